@@ -1,59 +1,772 @@
-from flask import Flask, render_template, session, request, jsonify
+from flask import Flask, Response, render_template, session, request, jsonify, stream_with_context
 from flask_socketio import SocketIO, emit, join_room, leave_room
-from flask_session import Session
-from models import db, ChatRoom, Message, UserProfile
+from models import db, configure_engine, init_db, get_beijing_time, session_scope, ChatRoom, Message
 from matching_queue import MatchingQueue
+from match_scheduler import MatchScheduler
+from message_writer import MessageWriter
+from state_backend import create_state_backend
+from session_store import init_session
+import metrics
+import structured_log
+from structured_log import log_event
 from config import Config
 from keyword_matcher import KeywordMatcher
-from room_key_generator import RoomKeyGenerator
+from keyword_tokenizer import create_tokenizer
+from room_key_generator import RoomKeyGenerator, RoomKeyPool
+from rate_limiter import RateLimiter, parse_limits
+import wire_format
+from serializers import MESSAGE_COLUMNS, ROOM_COLUMNS, serialize_messages, serialize_room
+from profile_store import ProfileStore
+from message_cache import RecentMessageCache
+from retention import RoomArchiver
+import message_search
+import room_stats
+from sqlalchemy import select, tuple_
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from datetime import datetime, timedelta
+import click
+import csv
+import io
 import uuid
 import os
 import json
+import logging
 
 # 初始化Flask应用
 app = Flask(__name__)
 app.config.from_object(Config)
+metrics.enabled = app.config['METRICS_ENABLED']
+structured_log.setup(
+    level=app.config['LOG_LEVEL'],
+    sample_rates=structured_log.parse_sample_rates(app.config['LOG_SAMPLE_RATES']),
+    queue_size=app.config['LOG_QUEUE_SIZE'],
+    shutdown_timeout=app.config['LOG_SHUTDOWN_TIMEOUT']
+)
+
+# eventlet worker 下让 psycopg2 在等待数据库时让出协程，否则一次查询会阻塞整个进程
+try:
+    from eventlet.patcher import is_monkey_patched
+    if is_monkey_patched('socket'):
+        from eventlet.support.psycopg2_patcher import make_psycopg_green
+        make_psycopg_green()
+except ImportError:
+    pass
 
 # 初始化扩展
 db.init_app(app)
-Session(app)
-socketio = SocketIO(app, cors_allowed_origins="*", manage_session=False)
+session_store = init_session(app)
+with app.app_context():
+    configure_engine(db.engine)
+    metrics.instrument_engine(db.engine)
+shared_state = app.config['STATE_BACKEND'] == 'redis'
+socketio = SocketIO(
+    app,
+    cors_allowed_origins="*",
+    manage_session=False,
+    # 共享状态时通过消息队列把 emit / join_room 转发到连接所在的进程
+    message_queue=app.config['REDIS_URL'] if shared_state else None
+)
+
+# 在线用户追踪 {user_id: {'sid': session_id, 'room_id': room_id, 'format': 线上格式}} 和全局匹配队列
+online_users, matching_queue = create_state_backend(
+    app.config['STATE_BACKEND'],
+    app.config['REDIS_URL'],
+    MatchingQueue(
+        min_similarity=app.config['KEYWORD_MIN_SIMILARITY'],
+        profile_min_similarity=app.config['PROFILE_MIN_SIMILARITY']
+    ),
+    prefix=app.config['STATE_KEY_PREFIX'],
+    lock_ttl_ms=app.config['MATCH_LEADER_LOCK_MS']
+)
+
+# 消息写入器（写后持久化）
+message_writer = MessageWriter(
+    app, db, socketio,
+    write_behind=app.config['MESSAGE_WRITE_BEHIND'],
+    batch_size=app.config['MESSAGE_BATCH_SIZE'],
+    flush_interval_ms=app.config['MESSAGE_FLUSH_INTERVAL_MS'],
+    max_buffer=app.config['MESSAGE_BUFFER_SIZE'],
+    max_retries=app.config['MESSAGE_WRITE_MAX_RETRIES']
+)
+
+# 按连接协商的线上格式（json / msgpack）发送事件 {sid: format}
+client_formats = {}
+room_emitter = wire_format.RoomEmitter(
+    socketio,
+    batch_window_ms=app.config['MESSAGE_BATCH_WINDOW_MS'],
+    msgpack_enabled='msgpack' in app.config['WIRE_FORMATS']
+)
+
+
+def client_format() -> str:
+    """当前连接协商的线上格式"""
+    return client_formats.get(request.sid, 'json')
+
+
+def join_chat_room(room_id, sid, fmt):
+    """连接加入聊天房间及其格式子房间"""
+    join_room(room_id, sid=sid, namespace='/')
+    join_room(wire_format.format_room(room_id, fmt), sid=sid, namespace='/')
+
+
+def send_room_history(room_id, room_key, history, cursor, has_more, older):
+    """向当前连接发送一页历史消息，msgpack 连接收到按列存放的消息"""
+    payload = {
+        'room_id': room_id,
+        'room_key': room_key,
+        'messages': history,
+        'message_count': len(history),
+        'cursor': cursor,
+        'has_more': has_more,
+        'older': older
+    }
+    fmt = client_format()
+    if fmt == 'msgpack':
+        payload = dict(payload, messages=wire_format.to_columns(history, ('id', 'sender_id', 'content', 'timestamp')))
+    room_emitter.send('room_history', payload, fmt)
+
+
+# 用户简介（upsert + LRU 缓存，内容没变时不访问数据库）
+profile_store = ProfileStore(max_entries=app.config['PROFILE_CACHE_SIZE'])
+
+
+def save_profiles(profiles):
+    """
+    保存用户简介，失败只记录日志，不影响匹配和建房
+
+    Args:
+        profiles: [(user_id, {'bio', 'purpose', 'keywords'})]
+    """
+    try:
+        profile_store.save_many(profiles)
+    except Exception as e:
+        log_event('save_profiles', '保存用户简介失败', level=logging.ERROR, error=str(e))
+
+
+# 关键词提取的分词器和结果缓存
+KeywordMatcher.configure(
+    create_tokenizer(app.config['KEYWORD_TOKENIZER'], app.config['KEYWORD_DICTIONARY_PATH']),
+    cache_size=app.config['KEYWORD_CACHE_SIZE']
+)
+
+# 房间最近消息缓存（只在单进程时启用，多个 worker 时其他进程的消息不会进入本进程的缓存）
+message_cache = RecentMessageCache(
+    per_room=app.config['MESSAGE_CACHE_PER_ROOM'],
+    max_bytes=app.config['MESSAGE_CACHE_MAX_BYTES']
+) if app.config['MESSAGE_CACHE_ENABLED'] and not shared_state else None
+
+
+def close_rooms(room_ids):
+    """标记房间不活跃并清除其最近消息缓存（需在应用上下文中调用）"""
+    with session_scope():
+        room_stats.close_rooms(db.session, room_ids)
+    if message_cache is not None:
+        for room_id in room_ids:
+            message_cache.invalidate(room_id)
+
+
+def start_chat(user_id, matched_user, match_type='random', score=None, profiles=None):
+    """
+    为两位已出队的用户创建房间，双方加入 SocketIO room 并发送匹配通知
+
+    Args:
+        user_id: 用户1 ID
+        matched_user: 用户2 ID
+        match_type: 'random' 或 'keyword'
+        score: 关键词匹配的相似度分数
+        profiles: (用户1资料, 用户2资料)，关键词匹配时保存到数据库
+
+    Returns:
+        房间ID
+    """
+    profiles = profiles or ({}, {})
+
+    # 保存用户简介
+    if match_type == 'keyword':
+        save_profiles(zip((user_id, matched_user), profiles))
+
+    with session_scope():
+        # 创建房间
+        room = ChatRoom(user1_id=user_id, user2_id=matched_user, match_type=match_type)
+        db.session.add(room)
+        db.session.flush()
+        room_id = str(room.id)
+        room_stats.increment(db.session, total_rooms=1, active_rooms=1)
+    if message_cache is not None:
+        message_cache.new_room(int(room_id))
+
+    # 双方加入 SocketIO room，并更新在线用户信息
+    for uid in (user_id, matched_user):
+        user_info = online_users.get(uid)
+        join_chat_room(room_id, user_info['sid'], user_info['format'])
+        online_users.set_room(uid, room_id)
+
+    # 通知双方匹配成功
+    if match_type == 'keyword':
+        keywords1, keywords2 = (set(profile.get('keywords', [])) for profile in profiles)
+        room_emitter.emit_room('matched_with_score', {
+            'room_id': room_id,
+            'match_score': score,
+            'keywords_matched': list(keywords1 & keywords2)
+        }, room_id)
+    else:
+        room_emitter.emit_room('matched', {'room_id': room_id}, room_id)
+
+    return room_id
+
+
+def find_existing_room_keys(keys):
+    """查询给定秘钥中已被占用的部分（走 room_key 唯一索引）"""
+    with app.app_context():
+        rows = db.session.query(ChatRoom.room_key).filter(ChatRoom.room_key.in_(list(keys))).all()
+        return {room_key for (room_key,) in rows}
+
+
+# 私密房间秘钥池
+room_key_pool = RoomKeyPool(
+    find_existing_room_keys,
+    size=app.config['ROOM_KEY_POOL_SIZE'],
+    refill_below=app.config['ROOM_KEY_POOL_REFILL_BELOW']
+)
+
+
+def add_private_room(user_id):
+    """
+    乐观插入私密房间：依赖 room_key 唯一索引，冲突时换一个秘钥重试（调用方负责提交）
+
+    Args:
+        user_id: 创建者ID
+
+    Returns:
+        已写入当前事务的 ChatRoom
+
+    Raises:
+        IntegrityError: 多次重试仍然冲突
+    """
+    max_attempts = app.config['ROOM_KEY_MAX_ATTEMPTS']
+    for attempt in range(max_attempts):
+        # 最后一次尝试使用更长的秘钥
+        room_key = room_key_pool.take() if attempt < max_attempts - 1 else RoomKeyGenerator.generate_key(12)
+        room = ChatRoom(
+            user1_id=user_id,
+            user2_id=None,  # 私密房间初始为空
+            room_key=room_key,
+            match_type='private',
+            is_private=True
+        )
+        try:
+            with db.session.begin_nested():
+                db.session.add(room)
+            break
+        except IntegrityError:
+            if attempt == max_attempts - 1:
+                raise
+    room_stats.increment(db.session, total_rooms=1, active_rooms=1)
+
+    # 秘钥池不足时在后台补充
+    if room_key_pool.needs_refill():
+        socketio.start_background_task(room_key_pool.refill)
+
+    return room
+
+
+def load_history_page(room_id, before=None):
+    """
+    按 (timestamp, id) 游标加载一页历史消息（keyset 分页，走 messages 复合索引）
+
+    Args:
+        room_id: 房间ID
+        before: 游标 {'timestamp': ISO时间, 'id': 消息ID}，返回比它更早的消息；None 表示最新一页
+
+    Returns:
+        (按时间正序排列的消息列表, 下一页游标, 是否还有更早的消息)
+
+    Raises:
+        ValueError: 游标格式无效
+    """
+    page_size = app.config['HISTORY_PAGE_SIZE']
+    cursor = (datetime.fromisoformat(str(before['timestamp'])), int(before['id'])) if before else None
+
+    # 整页都在最近消息缓存中时不访问数据库（缓存包含尚未写入数据库的消息）
+    cached = message_cache.page(room_id, page_size, cursor) if message_cache is not None else None
+    if cached is not None:
+        messages, has_more = cached
+        next_cursor = {'timestamp': messages[0]['timestamp'], 'id': messages[0]['id']} if messages else None
+        return messages, next_cursor, has_more
+
+    # 先写入尚未持久化的消息
+    message_writer.flush()
+
+    stmt = select(*MESSAGE_COLUMNS).where(Message.room_id == room_id)
+    if cursor:
+        stmt = stmt.where(tuple_(Message.timestamp, Message.id) < cursor)
+
+    # 多取一条用来判断是否还有更早的消息
+    with session_scope():
+        rows = db.session.execute(
+            stmt.order_by(Message.timestamp.desc(), Message.id.desc()).limit(page_size + 1)
+        ).all()
+    has_more = len(rows) > page_size
+    messages = serialize_messages(reversed(rows[:page_size]))
+    if message_cache is not None and not cursor:
+        message_cache.fill(room_id, messages, has_more)
+
+    next_cursor = {'timestamp': messages[0]['timestamp'], 'id': messages[0]['id']} if messages else None
+    return messages, next_cursor, has_more
+
+
+def reap_stale_users() -> int:
+    """
+    清理超过 PRESENCE_TIMEOUT 秒没有心跳的用户：移出匹配队列，批量标记其房间不活跃并通知对方
+
+    Returns:
+        清理的用户数
+    """
+    stale = online_users.expire(app.config['PRESENCE_TIMEOUT'])
+    if not stale:
+        return 0
+
+    room_ids = set()
+    for uid, user_info in stale:
+        matching_queue.remove(uid)
+        if user_info['room_id']:
+            room_ids.add(user_info['room_id'])
+
+    if room_ids:
+        with app.app_context():
+            close_rooms([int(r) for r in room_ids])
+        for room_id in room_ids:
+            socketio.emit('partner_left', {'message': '对方已断开连接'}, room=room_id)
+
+    metrics.REAPED_USERS.inc(len(stale))
+    log_event('presence_reaper', '清理失去心跳的用户', users=len(stale), rooms=len(room_ids))
+    return len(stale)
+
+
+def live_waiting_count() -> int:
+    """
+    随机队列的等待人数，不计已失去心跳、尚未被后台任务清理的用户
+
+    只读：清理（移出队列、关闭房间、通知对方）只由 start_presence_reaper 的后台任务执行
+    """
+    waiting = matching_queue.get_waiting_count()
+    stale = online_users.stale_users(app.config['PRESENCE_TIMEOUT'])
+    return max(0, waiting - matching_queue.count_waiting(stale)) if stale else waiting
+
+
+_presence_reaper = None
+
+
+def start_presence_reaper():
+    """启动定期清理失去心跳用户的后台任务（重复调用无副作用）"""
+    global _presence_reaper
+    if _presence_reaper is not None:
+        return
+
+    def run():
+        while True:
+            socketio.sleep(app.config['PRESENCE_REAP_INTERVAL'])
+            try:
+                reap_stale_users()
+            except Exception as e:
+                log_event('presence_reaper', '清理失去心跳的用户出错', level=logging.ERROR, error=str(e))
+
+    _presence_reaper = socketio.start_background_task(run)
+
+
+# 数据保留：关闭超过保留期的非私密房间归档到本地分段文件后从数据库删除
+room_archiver = RoomArchiver(
+    app.config['ARCHIVE_DIR'],
+    batch_size=app.config['RETENTION_BATCH_SIZE'],
+    segment_max_bytes=app.config['ARCHIVE_SEGMENT_MAX_BYTES']
+)
+_retention_job = None
+
+
+def archive_closed_rooms(max_batches=None):
+    """归档关闭超过 RETENTION_DAYS 天的房间，返回 (房间数, 消息数)"""
+    with app.app_context():
+        rooms, messages = room_archiver.archive(timedelta(days=app.config['RETENTION_DAYS']), max_batches=max_batches)
+    if rooms:
+        log_event('retention', '已归档关闭的聊天室', rooms=rooms, messages=messages)
+    return rooms, messages
+
+
+def start_retention_job():
+    """启动定期归档的后台任务（重复调用无副作用）"""
+    global _retention_job
+    if _retention_job is not None:
+        return
+
+    def run():
+        while True:
+            socketio.sleep(app.config['RETENTION_INTERVAL'])
+            try:
+                # 每轮批数有限，单轮不会长时间占用数据库，剩余的留给下一轮
+                archive_closed_rooms(max_batches=app.config['RETENTION_MAX_BATCHES'])
+            except Exception as e:
+                log_event('retention', '归档聊天室出错', level=logging.ERROR, error=str(e))
+
+    _retention_job = socketio.start_background_task(run)
+
+
+@app.cli.command('archive-rooms')
+def archive_rooms_command():
+    """立即归档所有超过保留期的关闭房间"""
+    rooms, messages = archive_closed_rooms()
+    click.echo(f'已归档 {rooms} 个房间，{messages} 条消息')
+
+
+@app.cli.command('restore-room')
+@click.argument('room_id', type=int)
+def restore_room_command(room_id):
+    """从归档恢复一个房间及其消息"""
+    try:
+        count = room_archiver.restore(room_id)
+    except (LookupError, ValueError) as e:
+        raise click.ClickException(str(e))
+    click.echo(f'已恢复房间 {room_id}，{count} 条消息')
+
+
+def handle_scheduled_match(match):
+    """后台调度器的配对回调"""
+    user_id, matched_user = match['users']
+
+    # 配对后用户可能已断开或已进入其他房间，仍在等待的一方放回队列
+    available = []
+    for uid in match['users']:
+        user_info = online_users.get(uid)
+        if user_info and not user_info['room_id']:
+            available.append(uid)
+    if len(available) < 2:
+        for uid, profile in zip(match['users'], match['profiles']):
+            if uid in available:
+                if profile.get('keywords'):
+                    matching_queue.add_with_profile(uid, profile)
+                else:
+                    matching_queue.add(uid)
+        return
+
+    with app.app_context():
+        room_id = start_chat(user_id, matched_user, match['match_type'], match['score'], match['profiles'])
+
+    time_to_match = metrics.TIME_TO_MATCH.labels(match['match_type'])
+    for wait in match['wait_seconds']:
+        time_to_match.observe(wait)
+
+    wait1, wait2 = match['wait_seconds']
+    log_event('scheduled_match', '调度器匹配成功', match_type=match['match_type'], users=[user_id, matched_user],
+              room_id=room_id, score=round(match['score'], 3), wait_seconds=[round(wait1, 3), round(wait2, 3)])
+
+
+# 后台匹配调度器（在第一个连接建立时启动）
+match_scheduler = MatchScheduler(
+    socketio,
+    matching_queue,
+    handle_scheduled_match,
+    interval_ms=app.config['MATCH_SCHEDULER_INTERVAL_MS'],
+    threshold_decay=app.config['MATCH_THRESHOLD_DECAY'],
+    threshold_floor=app.config['MATCH_THRESHOLD_FLOOR'],
+    fallback_after=app.config['MATCH_RANDOM_FALLBACK_SECONDS']
+) if app.config['MATCH_SCHEDULER_ENABLED'] else None
+
+if shared_state and not match_scheduler:
+    raise RuntimeError('STATE_BACKEND=redis 时必须启用后台匹配调度器（MATCH_SCHEDULER_ENABLED）')
+
+
+def check_admin_password():
+    """管理后台的简单密码验证（生产环境应该用更安全的方式）"""
+    return request.args.get('password') == os.environ.get('ADMIN_PASSWORD', 'admin123')
+
+
+def get_admin_stats():
+    """管理后台统计数据（读取 room_stats 维护的计数，与表的大小无关）"""
+    return room_stats.get_stats(db.session)
+
+
+def iter_export_rooms(chunk_size):
+    """
+    按房间ID顺序逐个产出带消息的房间数据
+
+    房间与消息的外连接结果通过服务端游标（yield_per）分批读取，
+    内存中最多只保留一批行和当前房间的消息，与数据总量无关
+
+    Args:
+        chunk_size: 每批从游标读取的行数
 
-# 全局匹配队列
-matching_queue = MatchingQueue()
+    Yields:
+        ChatRoom.to_dict() 的字段加 'messages' 列表（见 serializers）
+    """
+    stmt = (
+        select(*ROOM_COLUMNS, *MESSAGE_COLUMNS)
+        .outerjoin(Message, Message.room_id == ChatRoom.id)
+        .order_by(ChatRoom.id, Message.timestamp, Message.id)
+        .execution_options(yield_per=chunk_size)
+    )
 
-# 在线用户追踪 {user_id: {'sid': session_id, 'room_id': room_id}}
-online_users = {}
+    room_width = len(ROOM_COLUMNS)
+    room = None
+    messages = []
+    for row in db.session.execute(stmt).tuples():
+        if room is None or room['id'] != row[0]:
+            if room is not None:
+                room['messages'] = serialize_messages(messages)
+                yield room
+            room = serialize_room(row[:room_width])
+            messages = []
+        if row[room_width] is not None:
+            messages.append(row[room_width:])
+
+    if room is not None:
+        room['messages'] = serialize_messages(messages)
+        yield room
+
+
+def export_ndjson(rooms):
+    """每行一个房间的 JSON"""
+    for room in rooms:
+        yield json.dumps(room, ensure_ascii=False) + '\n'
+
+
+def export_json(rooms):
+    """逐个房间输出的 JSON 数组"""
+    yield '['
+    separator = '\n'
+    for room in rooms:
+        yield separator + json.dumps(room, ensure_ascii=False)
+        separator = ',\n'
+    yield '\n]\n'
+
+
+def export_csv(rooms):
+    """每条消息一行的 CSV（可用 Excel 打开），没有消息的房间也占一行"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    # UTF-8 BOM，让 Excel 正确识别中文
+    buffer.write('\ufeff')
+    writer.writerow(['房间ID', '用户1', '用户2', '发送者ID', '消息内容', '发送时间', '房间状态'])
+
+    for room in rooms:
+        status = '活跃' if room['is_active'] else '已关闭'
+        if not room['messages']:
+            writer.writerow([room['id'], room['user1_id'], room['user2_id'], '', '(无消息)', '', status])
+        for msg in room['messages']:
+            timestamp = msg['timestamp'].replace('T', ' ')[:19]
+            writer.writerow([room['id'], room['user1_id'], room['user2_id'],
+                             msg['sender_id'], msg['content'], timestamp, status])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+
+# 导出格式：(生成函数, MIME 类型)
+EXPORT_FORMATS = {
+    'ndjson': (export_ndjson, 'application/x-ndjson'),
+    'json': (export_json, 'application/json'),
+    'csv': (export_csv, 'text/csv'),
+}
+
+
+def buffered(pieces, size=64 * 1024):
+    """把小片段合并为约 size 字节的块再输出，减少响应写入次数"""
+    chunk = []
+    length = 0
+    for piece in pieces:
+        chunk.append(piece)
+        length += len(piece)
+        if length >= size:
+            yield ''.join(chunk)
+            chunk = []
+            length = 0
+    if chunk:
+        yield ''.join(chunk)
 
 
 @app.route('/admin')
 def admin():
-    """管理后台页面 - 简单密码保护"""
-    # 简单的密码验证（生产环境应该用更安全的方式）
-    password = request.args.get('password')
-    if password != os.environ.get('ADMIN_PASSWORD', 'admin123'):
+    """管理后台页面 - 统计数据 + 分页的聊天室列表"""
+    if not check_admin_password():
         return "未授权访问", 401
 
-    # 获取统计数据
-    total_rooms = ChatRoom.query.count()
-    total_messages = Message.query.count()
-    active_rooms = ChatRoom.query.filter_by(is_active=True).count()
+    # 先写入尚未持久化的消息
+    message_writer.flush()
+
+    stats = get_admin_stats()
+
+    # 按房间ID倒序的 keyset 分页（ID 与创建时间同序），每页的消息用一次 IN 查询预加载
+    per_page = app.config['ADMIN_ROOMS_PER_PAGE']
+    before = request.args.get('before', type=int)
+    stmt = select(*ROOM_COLUMNS)
+    if before:
+        stmt = stmt.where(ChatRoom.id < before)
+
+    rows = db.session.execute(stmt.order_by(ChatRoom.id.desc()).limit(per_page + 1)).all()
+    next_before = rows[per_page - 1].id if len(rows) > per_page else None
+    rooms = [serialize_room(row) for row in rows[:per_page]]
+
+    messages_by_room = {room['id']: [] for room in rooms}
+    if rooms:
+        # 按 (timestamp, id) 排序：消息ID由各 worker 按批预留，不保证与发送顺序一致
+        message_rows = db.session.execute(
+            select(*MESSAGE_COLUMNS).where(Message.room_id.in_(messages_by_room))
+            .order_by(Message.timestamp, Message.id)
+        ).all()
+        for msg in serialize_messages(message_rows):
+            messages_by_room[msg['room_id']].append(msg)
+    for room in rooms:
+        room['messages'] = messages_by_room[room['id']]
+
+    return render_template('admin.html', stats=stats, rooms=rooms, next_before=next_before,
+                           is_first_page=not before, password=request.args.get('password'))
+
+
+@app.route('/admin/stats')
+def admin_stats():
+    """管理后台统计数据（JSON）"""
+    if not check_admin_password():
+        return jsonify({'error': '未授权访问'}), 401
+
+    message_writer.flush()
+    stats = get_admin_stats()
+    if message_cache is not None:
+        stats['message_cache'] = message_cache.stats()
+    return jsonify(stats)
+
+
+@app.route('/admin/export')
+def admin_export():
+    """流式导出全部聊天记录，format 可选 ndjson（默认）、json、csv"""
+    if not check_admin_password():
+        return "未授权访问", 401
 
-    stats = {
-        'total_rooms': total_rooms,
-        'total_messages': total_messages,
-        'active_rooms': active_rooms
-    }
+    export_format = request.args.get('format', 'ndjson')
+    if export_format not in EXPORT_FORMATS:
+        return "不支持的导出格式", 400
+    generate, mimetype = EXPORT_FORMATS[export_format]
 
-    # 获取所有聊天室（按创建时间倒序）
-    rooms = ChatRoom.query.order_by(ChatRoom.created_at.desc()).all()
+    message_writer.flush()
+
+    rooms = iter_export_rooms(app.config['ADMIN_EXPORT_CHUNK_SIZE'])
+    filename = f"chat_records_{get_beijing_time().strftime('%Y-%m-%d')}.{export_format}"
+    return Response(
+        stream_with_context(buffered(generate(rooms))),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
+    )
 
-    # 准备 JSON 数据用于导出
-    data_json = [room.to_dict() for room in rooms]
-    for room_data, room in zip(data_json, rooms):
-        room_data['messages'] = [msg.to_dict() for msg in room.messages]
 
-    return render_template('admin.html', stats=stats, rooms=rooms, data_json=data_json)
+@app.route('/admin/search')
+def admin_search():
+    """
+    按内容搜索消息（JSON），按发送顺序从新到旧分页
+
+    参数: q 搜索词；room_id、sender_id 过滤；start、end 发送时间范围（ISO 格式）；
+    before 上一页返回的 next_before（"ISO时间,消息ID"）；limit 每页条数
+    """
+    if not check_admin_password():
+        return jsonify({'error': '未授权访问'}), 401
+
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'error': '缺少搜索词'}), 400
+    try:
+        start = datetime.fromisoformat(request.args['start']) if request.args.get('start') else None
+        end = datetime.fromisoformat(request.args['end']) if request.args.get('end') else None
+    except ValueError:
+        return jsonify({'error': '时间格式无效'}), 400
+    before = None
+    if request.args.get('before'):
+        try:
+            before_timestamp, before_id = request.args['before'].rsplit(',', 1)
+            before = (datetime.fromisoformat(before_timestamp), int(before_id))
+        except ValueError:
+            return jsonify({'error': '分页游标无效'}), 400
+    page_size = app.config['ADMIN_SEARCH_PAGE_SIZE']
+    limit = max(1, min(request.args.get('limit', page_size, type=int), page_size * 4))
+
+    message_writer.flush()
+    messages, next_before = message_search.search_messages(
+        db.session, query,
+        room_id=request.args.get('room_id', type=int),
+        sender_id=request.args.get('sender_id') or None,
+        start=start,
+        end=end,
+        before=before,
+        limit=limit
+    )
+    if next_before is not None:
+        next_before = f'{next_before[0].isoformat()},{next_before[1]}'
+    return jsonify({'messages': messages, 'next_before': next_before})
+
+
+@app.cli.command('reconcile-stats')
+def reconcile_stats_command():
+    """从头重新计算房间消息数和管理后台统计"""
+    stats = room_stats.reconcile()
+    click.echo(' '.join(f'{name}={value}' for name, value in stats.items()))
+
+
+@app.cli.command('reindex-messages')
+@click.option('--batch-size', default=10000, show_default=True, help='每批（一次提交）的消息数')
+def reindex_messages_command(batch_size):
+    """为还没有检索索引的历史消息补建索引"""
+    with session_scope():
+        count = message_search.reindex(db.session, batch_size=batch_size)
+    click.echo(f'已为 {count} 条消息建立检索索引')
+
+
+# 事件限流（按用户 / 连接 / 房间的令牌桶）
+rate_limiter = RateLimiter(parse_limits(app.config['RATE_LIMITS'])) if app.config['RATE_LIMIT_ENABLED'] else None
+
+
+def check_rate_limit(event: str, user_id: str = None, room_id: str = None) -> bool:
+    """
+    检查当前连接的事件是否超出限额，超出时向客户端发送 slow_down
+
+    Args:
+        event: 事件名
+        user_id: 用户ID
+        room_id: 房间ID（需要按房间限流的事件）
+
+    Returns:
+        是否放行
+    """
+    if rate_limiter is None:
+        return True
+    retry_after = rate_limiter.acquire(event, user=user_id, sid=request.sid, room=room_id)
+    if not retry_after:
+        return True
+
+    metrics.RATE_LIMITED.labels(event).inc()
+    emit('slow_down', {
+        'event': event,
+        'retry_after': round(retry_after, 2),
+        'message': f'操作过于频繁，请 {retry_after:.1f} 秒后再试'
+    })
+    log_event('rate_limited', '事件被限流', level=logging.WARNING, event_name=event, user_id=user_id,
+              room_id=room_id)
+    return False
+
+
+# 瞬时指标在输出 /metrics 时读取
+metrics.QUEUE_DEPTH.set_function(
+    lambda: {(queue,): count for queue, count in matching_queue.waiting_counts().items()}
+)
+metrics.ONLINE_USERS.set_function(lambda: {(): len(online_users)})
+if message_cache is not None:
+    metrics.MESSAGE_CACHE_REQUESTS.set_function(
+        lambda: {('hit',): message_cache.stats()['hits'], ('miss',): message_cache.stats()['misses']}
+    )
+    metrics.MESSAGE_CACHE_BYTES.set_function(lambda: {(): message_cache.stats()['bytes']})
+    metrics.MESSAGE_CACHE_ROOMS.set_function(lambda: {(): message_cache.stats()['rooms']})
+
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus 文本格式的运行指标"""
+    if not metrics.enabled:
+        return "指标未启用", 404
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
 
 
 @app.route('/')
@@ -61,18 +774,41 @@ def index():
     """主页面，生成匿名用户ID"""
     if 'user_id' not in session:
         session['user_id'] = str(uuid.uuid4())[:8]  # 生成8位短UUID
-    return render_template('index.html', user_id=session['user_id'])
+    return render_template('index.html', user_id=session['user_id'],
+                           socketio_transports=app.config['SOCKETIO_TRANSPORTS'],
+                           heartbeat_interval=app.config['HEARTBEAT_INTERVAL'])
 
 
 @socketio.on('connect')
-def handle_connect():
-    """处理WebSocket连接"""
+@metrics.track_event('connect')
+def handle_connect(auth=None):
+    """处理WebSocket连接，按客户端声明的格式协商线上格式"""
+    client_formats[request.sid] = wire_format.negotiate(auth, app.config['WIRE_FORMATS'])
+    if match_scheduler:
+        match_scheduler.start()
+    message_writer.start()
+    if session_store:
+        session_store.start_sweeper(socketio, app.config['SESSION_SWEEP_INTERVAL'])
+    start_presence_reaper()
+    if app.config['RETENTION_ENABLED']:
+        start_retention_job()
+
+    user_id = session.get('user_id')
+    if user_id:
+        log_event('connect', '用户已连接', user_id=user_id)
+
+
+@socketio.on('heartbeat')
+@metrics.track_event('heartbeat')
+def handle_heartbeat():
+    """客户端定期发送的心跳，刷新在线用户的活跃时间"""
     user_id = session.get('user_id')
     if user_id:
-        print(f"用户 {user_id} 已连接")
+        online_users.touch(user_id)
 
 
 @socketio.on('join_queue')
+@metrics.track_event('join_queue')
 def handle_join_queue():
     """处理加入匹配队列"""
     user_id = session.get('user_id')
@@ -80,47 +816,33 @@ def handle_join_queue():
         emit('error', {'message': '无效的用户ID'})
         return
 
+    if not check_rate_limit('join_queue', user_id):
+        return
+
     # 检查用户是否已在房间中
-    if user_id in online_users and online_users[user_id].get('room_id'):
+    user_info = online_users.get(user_id)
+    if user_info and user_info['room_id']:
         emit('error', {'message': '您已在聊天中'})
         return
 
     # 记录 SocketIO session ID
-    online_users[user_id] = {'sid': request.sid, 'room_id': None}
+    online_users.set(user_id, request.sid, wire_format=client_format())
 
-    # 尝试匹配
-    matched_user = matching_queue.try_match(user_id)
+    # 尝试匹配（启用后台调度器时只入队，由调度器统一配对）
+    matched_user = None if match_scheduler else matching_queue.try_match(user_id)
 
     if matched_user:
-        # 创建房间
-        room = ChatRoom(user1_id=user_id, user2_id=matched_user)
-        db.session.add(room)
-        db.session.commit()
-
-        # 双方加入 SocketIO room
-        room_id = str(room.id)
-        join_room(room_id)
-
-        # 获取对方的 session ID
-        matched_sid = online_users[matched_user]['sid']
-        join_room(room_id, sid=matched_sid)
-
-        # 更新在线用户信息
-        online_users[user_id]['room_id'] = room_id
-        online_users[matched_user]['room_id'] = room_id
-
-        # 通知双方匹配成功
-        socketio.emit('matched', {'room_id': room_id}, room=room_id)
-
-        print(f"匹配成功: {user_id} <-> {matched_user}, 房间ID: {room_id}")
+        room_id = start_chat(user_id, matched_user)
+        log_event('join_queue', '匹配成功', users=[user_id, matched_user], room_id=room_id)
     else:
         # 加入等待队列
         matching_queue.add(user_id)
-        emit('waiting', {'message': '等待匹配中...', 'waiting_count': matching_queue.get_waiting_count()})
-        print(f"用户 {user_id} 加入等待队列")
+        emit('waiting', {'message': '等待匹配中...', 'waiting_count': live_waiting_count()})
+        log_event('join_queue', '用户加入等待队列', user_id=user_id)
 
 
 @socketio.on('join_queue_with_profile')
+@metrics.track_event('join_queue_with_profile')
 def handle_join_queue_with_profile(data):
     """带简介加入匹配队列（支持关键词匹配）"""
     user_id = session.get('user_id')
@@ -128,8 +850,12 @@ def handle_join_queue_with_profile(data):
         emit('error', {'message': '无效的用户ID'})
         return
 
+    if not check_rate_limit('join_queue_with_profile', user_id):
+        return
+
     # 检查用户是否已在房间中
-    if user_id in online_users and online_users[user_id].get('room_id'):
+    user_info = online_users.get(user_id)
+    if user_info and user_info['room_id']:
         emit('error', {'message': '您已在聊天中'})
         return
 
@@ -149,81 +875,35 @@ def handle_join_queue_with_profile(data):
     }
 
     # 记录 SocketIO session ID
-    online_users[user_id] = {'sid': request.sid, 'room_id': None}
+    online_users.set(user_id, request.sid, wire_format=client_format())
 
     # 如果有关键词，先添加到关键词队列，然后尝试匹配
     if keywords:
         # 先将自己加入队列
         matching_queue.add_with_profile(user_id, profile)
 
-        # 尝试匹配
-        match_result = matching_queue.try_keyword_match(user_id, profile)
+        # 尝试匹配（启用后台调度器时只入队，由调度器统一配对）
+        match_result = None if match_scheduler else matching_queue.try_keyword_match(user_id, profile)
 
         if match_result:
-            matched_user, score = match_result
-
-            # 保存用户简介
-            user_profile = UserProfile(
-                user_id=user_id,
-                bio=bio,
-                purpose=purpose,
-                keywords=json.dumps(keywords, ensure_ascii=False)
-            )
-            db.session.add(user_profile)
-
-            # 保存匹配用户的简介
-            matched_profile = matching_queue.user_profiles.get(matched_user, {})
-            matched_user_profile = UserProfile(
-                user_id=matched_user,
-                bio=matched_profile.get('bio', ''),
-                purpose=matched_profile.get('purpose', ''),
-                keywords=json.dumps(matched_profile.get('keywords', []), ensure_ascii=False)
-            )
-            db.session.add(matched_user_profile)
-
-            # 创建房间
-            room = ChatRoom(
-                user1_id=user_id,
-                user2_id=matched_user,
-                match_type='keyword'
-            )
-            db.session.add(room)
-            db.session.commit()
-
-            # 双方加入 SocketIO room
-            room_id = str(room.id)
-            join_room(room_id)
-
-            # 获取对方的 session ID
-            matched_sid = online_users[matched_user]['sid']
-            join_room(room_id, sid=matched_sid)
-
-            # 更新在线用户信息
-            online_users[user_id]['room_id'] = room_id
-            online_users[matched_user]['room_id'] = room_id
-
-            # 通知双方匹配成功
-            socketio.emit('matched_with_score', {
-                'room_id': room_id,
-                'match_score': score,
-                'keywords_matched': list(set(keywords) & set(matched_profile.get('keywords', [])))
-            }, room=room_id)
-
-            print(f"关键词匹配成功: {user_id} <-> {matched_user}, 分数: {score:.2f}")
+            matched_user, score, matched_profile = match_result
+            start_chat(user_id, matched_user, 'keyword', score, (profile, matched_profile))
+            log_event('join_queue_with_profile', '关键词匹配成功', users=[user_id, matched_user], score=round(score, 3))
             return
 
         # 已添加到关键词队列但暂时没有匹配，发送等待状态
-        emit('waiting', {'message': '正在寻找相似话题的聊天对象...', 'waiting_count': matching_queue.get_waiting_count()})
-        print(f"用户 {user_id} 加入关键词匹配队列")
+        emit('waiting', {'message': '正在寻找相似话题的聊天对象...', 'waiting_count': live_waiting_count()})
+        log_event('join_queue_with_profile', '用户加入关键词匹配队列', user_id=user_id)
 
     # 如果没有关键词，加入随机队列
     else:
         matching_queue.add(user_id)
-        emit('waiting', {'message': '等待匹配中...', 'waiting_count': matching_queue.get_waiting_count()})
-        print(f"用户 {user_id} 加入随机等待队列")
+        emit('waiting', {'message': '等待匹配中...', 'waiting_count': live_waiting_count()})
+        log_event('join_queue_with_profile', '用户加入随机等待队列', user_id=user_id)
 
 
 @socketio.on('create_private_room')
+@metrics.track_event('create_private_room')
 def handle_create_private_room(data):
     """创建私密房间"""
     user_id = session.get('user_id')
@@ -231,46 +911,35 @@ def handle_create_private_room(data):
         emit('error', {'message': '无效的用户ID'})
         return
 
+    if not check_rate_limit('create_private_room', user_id):
+        return
+
     # 检查用户是否已在房间中
-    if user_id in online_users and online_users[user_id].get('room_id'):
+    user_info = online_users.get(user_id)
+    if user_info and user_info['room_id']:
         emit('error', {'message': '您已在聊天中'})
         return
 
-    # 生成唯一秘钥
-    existing_keys = set(r.room_key for r in ChatRoom.query.filter(ChatRoom.room_key.isnot(None)).all())
-    room_key = RoomKeyGenerator.generate_unique_key(existing_keys)
-
     # 获取用户资料
     bio = data.get('bio', '').strip()
     purpose = data.get('purpose', '').strip()
     keywords_text = data.get('keywords', '').strip()
     keywords = KeywordMatcher.extract_keywords(purpose + ' ' + keywords_text)
 
-    # 创建房间
-    room = ChatRoom(
-        user1_id=user_id,
-        user2_id=None,  # 私密房间初始为空
-        room_key=room_key,
-        match_type='private',
-        is_private=True
-    )
-    db.session.add(room)
+    with session_scope():
+        # 创建房间（分配唯一秘钥）
+        room = add_private_room(user_id)
+        room_id, room_key = str(room.id), room.room_key
+    if message_cache is not None:
+        message_cache.new_room(int(room_id), room_key)
 
     # 保存用户简介
-    user_profile = UserProfile(
-        user_id=user_id,
-        bio=bio,
-        purpose=purpose,
-        keywords=json.dumps(keywords, ensure_ascii=False)
-    )
-    db.session.add(user_profile)
-    db.session.commit()
+    save_profiles([(user_id, {'bio': bio, 'purpose': purpose, 'keywords': keywords})])
 
     # 加入 SocketIO room
-    room_id = str(room.id)
-    join_room(room_id)
+    join_chat_room(room_id, request.sid, client_format())
 
-    online_users[user_id] = {'sid': request.sid, 'room_id': room_id}
+    online_users.set(user_id, request.sid, room_id, wire_format=client_format())
 
     emit('private_room_created', {
         'room_key': room_key,
@@ -278,10 +947,11 @@ def handle_create_private_room(data):
         'message': f'私密房间已创建！\n\n🔑 秘钥：{room_key}\n\n分享给朋友，让他们输入此秘钥加入房间。'
     })
 
-    print(f"用户 {user_id} 创建私密房间，秘钥：{room_key}")
+    log_event('create_private_room', '用户创建私密房间', user_id=user_id, room_id=room_id, room_key=room_key)
 
 
 @socketio.on('join_private_room')
+@metrics.track_event('join_private_room')
 def handle_join_private_room(data):
     """通过秘钥加入私密房间"""
     user_id = session.get('user_id')
@@ -289,6 +959,9 @@ def handle_join_private_room(data):
         emit('error', {'message': '无效的用户ID'})
         return
 
+    if not check_rate_limit('join_private_room', user_id):
+        return
+
     room_key = data.get('room_key', '').strip().upper()
 
     # 验证秘钥格式
@@ -296,88 +969,95 @@ def handle_join_private_room(data):
         emit('error', {'message': '无效的秘钥格式'})
         return
 
-    # 查找房间
-    room = ChatRoom.query.filter_by(room_key=room_key, is_private=True).first()
-    if not room:
-        emit('error', {'message': '秘钥不存在'})
-        return
-
-    # 检查房间是否已满
-    if room.user2_id and room.user2_id != user_id:
-        emit('error', {'message': '房间已满'})
-        return
-
     # 获取用户资料
     bio = data.get('bio', '').strip()
     purpose = data.get('purpose', '').strip()
     keywords_text = data.get('keywords', '').strip()
     keywords = KeywordMatcher.extract_keywords(purpose + ' ' + keywords_text)
 
-    # 记录 SocketIO session ID
-    online_users[user_id] = {'sid': request.sid, 'room_id': str(room.id)}
+    with session_scope():
+        # 查找房间
+        room = ChatRoom.query.filter_by(room_key=room_key, is_private=True).first()
+        if not room:
+            emit('error', {'message': '秘钥不存在'})
+            return
 
-    # 加入房间
-    room_id = str(room.id)
-    join_room(room_id)
+        # 检查房间是否已满
+        if room.user2_id and room.user2_id != user_id:
+            emit('error', {'message': '房间已满'})
+            return
+
+        room_id = str(room.id)
 
-    # 更新房间信息
-    if not room.user2_id:
-        room.user2_id = user_id
-        room.is_active = True
+        # 更新房间信息
+        if not room.user2_id:
+            room.user2_id = user_id
+            if not room.is_active:
+                # 创建者已离开的房间被重新打开
+                room_stats.increment(db.session, active_rooms=1)
+            room.is_active = True
+            room.closed_at = None
 
     # 保存用户简介
-    user_profile = UserProfile(
-        user_id=user_id,
-        bio=bio,
-        purpose=purpose,
-        keywords=json.dumps(keywords, ensure_ascii=False)
-    )
-    db.session.add(user_profile)
-    db.session.commit()
+    save_profiles([(user_id, {'bio': bio, 'purpose': purpose, 'keywords': keywords})])
 
-    # 加载历史消息
-    messages = Message.query.filter_by(room_id=room.id).order_by(Message.timestamp.asc()).all()
-    history = [msg.to_dict() for msg in messages]
+    # 记录 SocketIO session ID
+    online_users.set(user_id, request.sid, room_id, wire_format=client_format())
+
+    # 加入房间
+    join_chat_room(room_id, request.sid, client_format())
+
+    # 加载最新一页历史消息
+    history, cursor, has_more = load_history_page(int(room_id))
 
     # 通知双方
-    socketio.emit('joined_private_room', {
+    room_emitter.emit_room('joined_private_room', {
         'room_id': room_id,
         'room_key': room_key,
         'has_history': len(history) > 0,
         'message': '已加入私密房间'
-    }, room=room_id)
+    }, room_id)
 
-    # 如果有历史记录，发送给新加入的用户
+    # 如果有历史记录，发送给新加入的用户（更早的消息由客户端滚动时按游标请求）
     if history:
-        emit('room_history', {'messages': history})
+        send_room_history(room_id, room_key, history, cursor, has_more, older=False)
 
-    print(f"用户 {user_id} 通过秘钥加入房间 {room_key}")
+    log_event('join_private_room', '用户通过秘钥加入房间', user_id=user_id, room_id=room_id, room_key=room_key)
 
 
 @socketio.on('get_room_history')
+@metrics.track_event('get_room_history')
 def handle_get_room_history(data):
-    """获取房间历史记录（通过秘钥查看）"""
-    room_key = data.get('room_key', '').strip().upper()
-
-    # 验证秘钥
-    room = ChatRoom.query.filter_by(room_key=room_key).first()
-    if not room:
-        emit('error', {'message': '秘钥不存在'})
+    """获取房间历史记录（通过秘钥查看），传入 before 游标时返回更早的一页"""
+    if not check_rate_limit('get_room_history', session.get('user_id')):
         return
 
-    # 获取历史消息
-    messages = Message.query.filter_by(room_id=room.id).order_by(Message.timestamp.asc()).all()
-    history = [msg.to_dict() for msg in messages]
+    room_key = data.get('room_key', '').strip().upper()
+    before = data.get('before')
+
+    # 验证秘钥（最近使用过的秘钥从缓存中取房间ID）
+    room_id = message_cache.room_for_key(room_key) if message_cache is not None else None
+    if room_id is None:
+        with session_scope():
+            room_id = db.session.query(ChatRoom.id).filter_by(room_key=room_key).scalar()
+        if not room_id:
+            emit('error', {'message': '秘钥不存在'})
+            return
+        if message_cache is not None:
+            message_cache.remember_key(room_key, room_id)
+
+    # 获取一页历史消息
+    try:
+        history, cursor, has_more = load_history_page(room_id, before)
+    except (KeyError, TypeError, ValueError):
+        emit('error', {'message': '无效的历史消息游标'})
+        return
 
-    emit('room_history', {
-        'room_id': room.id,
-        'room_key': room_key,
-        'messages': history,
-        'message_count': len(history)
-    })
+    send_room_history(room_id, room_key, history, cursor, has_more, older=bool(before))
 
 
 @socketio.on('send_message')
+@metrics.track_event('send_message')
 def handle_message(data):
     """处理发送消息"""
     user_id = session.get('user_id')
@@ -398,27 +1078,33 @@ def handle_message(data):
         return
 
     room_id = user_info['room_id']
+    online_users.touch(user_id)
 
-    # 保存消息到数据库
-    message = Message(
-        room_id=int(room_id),
-        sender_id=user_id,
-        content=content
-    )
-    db.session.add(message)
-    db.session.commit()
+    if not check_rate_limit('send_message', user_id, room_id):
+        return
 
-    # 广播到房间
-    socketio.emit('new_message', {
+    # 分配消息ID和时间戳，由写入器批量保存到数据库（同步写入模式下失败时不广播）
+    try:
+        message = message_writer.submit(int(room_id), user_id, content)
+    except SQLAlchemyError:
+        emit('error', {'message': '消息发送失败，请重试'})
+        return
+    metrics.MESSAGES.inc()
+    if message_cache is not None:
+        message_cache.append(dict(message, timestamp=message['timestamp'].isoformat()))
+
+    # 广播到房间（msgpack 连接按合并窗口批量收到）
+    room_emitter.new_message(room_id, {
         'sender_id': user_id,
         'content': content,
-        'timestamp': message.timestamp.isoformat()
-    }, room=room_id)
+        'timestamp': message['timestamp'].isoformat()
+    })
 
-    print(f"用户 {user_id} 在房间 {room_id} 发送消息")
+    log_event('send_message', '用户发送消息', user_id=user_id, room_id=room_id)
 
 
 @socketio.on('leave_room_event')
+@metrics.track_event('leave_room_event')
 def handle_leave_room():
     """处理离开房间"""
     user_id = session.get('user_id')
@@ -430,26 +1116,26 @@ def handle_leave_room():
     room_id = user_info['room_id']
 
     # 标记房间为不活跃
-    room = ChatRoom.query.get(int(room_id))
-    if room:
-        room.is_active = False
-        db.session.commit()
+    close_rooms([int(room_id)])
 
     # 通知对方
     socketio.emit('partner_left', {'message': '对方已离开聊天'}, room=room_id, include_self=False)
 
     # 自己离开 SocketIO room
     leave_room(room_id)
-    online_users[user_id]['room_id'] = None
+    leave_room(wire_format.format_room(room_id, user_info['format']))
+    online_users.set_room(user_id, None)
 
     emit('left_room', {'message': '您已离开聊天'})
 
-    print(f"用户 {user_id} 离开房间 {room_id}")
+    log_event('leave_room_event', '用户离开房间', user_id=user_id, room_id=room_id)
 
 
 @socketio.on('disconnect')
+@metrics.track_event('disconnect')
 def handle_disconnect():
     """处理连接断开"""
+    client_formats.pop(request.sid, None)
     user_id = session.get('user_id')
     if not user_id:
         return
@@ -458,32 +1144,29 @@ def handle_disconnect():
     matching_queue.remove(user_id)
 
     # 如果在房间中，通知对方
-    if user_id in online_users:
-        user_info = online_users[user_id]
+    user_info = online_users.get(user_id)
+    if user_info:
         if user_info.get('room_id'):
             room_id = user_info['room_id']
 
             # 标记房间不活跃
-            room = ChatRoom.query.get(int(room_id))
-            if room:
-                room.is_active = False
-                db.session.commit()
+            close_rooms([int(room_id)])
 
             # 通知对方
             socketio.emit('partner_left', {'message': '对方已断开连接'}, room=room_id)
 
         # 清理在线用户记录
-        del online_users[user_id]
+        online_users.remove(user_id)
 
-    print(f"用户 {user_id} 已断开连接")
+    log_event('disconnect', '用户已断开连接', user_id=user_id)
 
 
 if __name__ == '__main__':
     # 创建数据库表
     with app.app_context():
-        db.create_all()
-        print("数据库表已创建")
+        init_db()
+        log_event('startup', '数据库表已创建')
 
     # 启动应用
-    print("匿名聊天室启动在 http://localhost:5000")
+    log_event('startup', '匿名聊天室启动在 http://localhost:5000')
     socketio.run(app, debug=True, host='0.0.0.0', port=5000)
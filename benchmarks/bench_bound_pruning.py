@@ -0,0 +1,97 @@
+"""
+关键词匹配的位集上界剪枝基准测试
+比较 MatchingQueue.top_k_candidates 在关闭 / 开启位集上界剪枝（PRUNE_THRESHOLD）时的耗时，
+关键词按 Zipf 分布抽取（少数热门词的倒排列表很长），并报告每次检索实际计算上界的次数
+以及两种方式的检索结果是否一致
+
+用法:
+    python benchmarks/bench_bound_pruning.py
+    python benchmarks/bench_bound_pruning.py --users 1000,20000 --k 1,5 --thresholds 8,16
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from keyword_matcher import KeywordMatcher  # noqa: E402
+from matching_queue import MatchingQueue  # noqa: E402
+
+VOCABULARY = [f'话题{i}' for i in range(500)]
+ZIPF_WEIGHTS = [1 / (i + 1) for i in range(len(VOCABULARY))]
+
+
+def zipf_keywords(rng, count=4):
+    """按 Zipf 分布抽取关键词，模拟“游戏”“音乐”等热门词占多数的真实分布"""
+    keywords = set()
+    while len(keywords) < count:
+        keywords.add(rng.choices(VOCABULARY, ZIPF_WEIGHTS)[0])
+    return list(keywords)
+
+
+class BoundCounter:
+    """统计 weighted_similarity_upper_bounds 的调用次数"""
+
+    def __init__(self):
+        self.calls = 0
+        self._original = KeywordMatcher.weighted_similarity_upper_bounds
+
+    def __enter__(self):
+        def counted(*args):
+            self.calls += 1
+            return self._original(*args)
+        KeywordMatcher.weighted_similarity_upper_bounds = staticmethod(counted)
+        return self
+
+    def __exit__(self, *exc):
+        KeywordMatcher.weighted_similarity_upper_bounds = staticmethod(self._original)
+
+
+def bench_queue(users, k, prune_threshold, ops, repeat, seed):
+    """返回 (每次检索的微秒数（取 repeat 次中最快的一次）, 每次检索的上界计算次数, 检索结果)"""
+    rng = random.Random(seed)
+    queue = MatchingQueue(min_similarity=0.05)
+    queue.PRUNE_THRESHOLD = prune_threshold
+    for i in range(users):
+        queue.add_with_profile(f'u{i}', {'keywords': zipf_keywords(rng)})
+    queries = [zipf_keywords(rng) for _ in range(ops)]
+
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for keywords in queries:
+            queue.top_k_candidates('me', keywords, k)
+        best = min(best, time.perf_counter() - start)
+
+    with BoundCounter() as counter:
+        results = [queue.top_k_candidates('me', keywords, k) for keywords in queries]
+    return best / ops * 1e6, counter.calls / ops, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', default='1000,20000', help='等待中的关键词用户数')
+    parser.add_argument('--k', default='1,5', help='每次检索的候选数')
+    parser.add_argument('--thresholds', default=str(MatchingQueue.PRUNE_THRESHOLD), help='剪枝阈值')
+    parser.add_argument('--ops', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=3)
+    args = parser.parse_args()
+
+    thresholds = [int(t) for t in args.thresholds.split(',')]
+    print(f'MAX_CANDIDATES_PER_KEYWORD={MatchingQueue.MAX_CANDIDATES_PER_KEYWORD}')
+    print(f"{'users':>6} {'k':>3} {'threshold':>9} {'us/op':>8} {'vs scalar':>9} {'bounds/op':>10} {'same':>5}")
+    for users in (int(u) for u in args.users.split(',')):
+        for k in (int(v) for v in args.k.split(',')):
+            scalar, _, expected = bench_queue(users, k, 10 ** 9, args.ops, args.repeat, args.seed)
+            print(f"{users:>6} {k:>3} {'off':>9} {scalar:>8.1f} {'':>9} {0:>10.2f} {'':>5}")
+            for threshold in thresholds:
+                elapsed, bounds, results = bench_queue(users, k, threshold, args.ops, args.repeat, args.seed)
+                print(f'{users:>6} {k:>3} {threshold:>9} {elapsed:>8.1f} {scalar / elapsed:>8.2f}x '
+                      f'{bounds:>10.2f} {str(results == expected):>5}')
+
+
+if __name__ == '__main__':
+    main()
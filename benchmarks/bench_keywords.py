@@ -0,0 +1,128 @@
+"""
+关键词提取基准测试：simple（按空白标点切分）vs cjk（词典最大匹配）分词器
+吞吐：分别计时不重复文本（缓存未命中，纯分词开销）和从少量常见文本中重复抽样（模拟线上大量相同的聊天目的，
+走 LRU 缓存）时每秒处理的文本数；
+质量：对一组常见的中文聊天目的，按期望关键词计算召回率和准确率，并列出 cjk 分词器漏掉 / 多出的词
+
+用法:
+    python benchmarks/bench_keywords.py
+    python benchmarks/bench_keywords.py --texts 200000 --distinct 500
+    python benchmarks/bench_keywords.py --verbose                    # 打印每条质量测试文本的结果
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+# (聊天目的, 期望的关键词)
+QUALITY_SET = [
+    ('想找人聊电影和音乐', {'电影', '音乐'}),
+    ('喜欢看科幻电影，也玩原神', {'科幻', '电影', '原神'}),
+    ('周末想去爬山徒步', {'周末', '爬山', '徒步'}),
+    ('最近在学Python编程', {'python', '编程'}),
+    ('有没有一起打王者荣耀的', {'王者荣耀'}),
+    ('失眠了，想找个人聊聊天', {'失眠'}),
+    ('工作压力好大，想吐槽一下', {'工作', '压力', '吐槽'}),
+    ('养猫的铲屎官来交流一下', {'养猫', '铲屎官'}),
+    ('考研党求一起学习', {'考研', '学习'}),
+    ('喜欢听摇滚和民谣', {'摇滚', '民谣'}),
+    ('聊聊最近看的小说', {'小说'}),
+    ('想找人练英语口语', {'英语', '口语'}),
+    ('健身跑步打卡互相监督', {'健身', '跑步', '打卡', '监督'}),
+    ('有人喜欢剧本杀吗', {'剧本杀'}),
+    ('深夜树洞，随便聊聊', {'深夜', '树洞'}),
+    ('喜欢摄影和旅行的朋友', {'摄影', '旅行', '朋友'}),
+    ('分享美食和做饭心得', {'美食', '做饭', '心得'}),
+    ('追星女孩一起聊八卦', {'追星', '女孩', '八卦'}),
+    ('有没有玩我的世界的', {'我的世界'}),
+    ('聊聊投资理财和基金', {'投资', '理财', '基金'}),
+    ('喜欢日剧和动漫', {'日剧', '动漫'}),
+    ('想聊聊心理学和哲学', {'心理学', '哲学'}),
+    ('一起看世界杯足球', {'世界杯', '足球'}),
+    ('刚开始学吉他，求交流', {'吉他'}),
+    ('无聊，找人聊天', {'无聊'}),
+    ('职场新人求建议', {'职场', '新人', '建议'}),
+    ('喜欢画画和手工', {'画画', '手工'}),
+    ('想找人一起露营钓鱼', {'露营', '钓鱼'}),
+    ('聊聊天文和宇宙', {'天文', '宇宙'}),
+    ('最近在减肥，求监督', {'减肥', '监督'}),
+    ('喜欢宝可梦和塞尔达', {'宝可梦', '塞尔达'}),
+    ('程序员下班聊聊技术', {'程序员', '下班', '技术'}),
+    ('喜欢喝咖啡的来', {'咖啡'}),
+    ('想聊历史和推理小说', {'历史', '推理', '小说'}),
+    ('留学党交流经验', {'留学', '经验'}),
+    ('喜欢听播客和电台', {'播客', '电台'}),
+    ('有没有喜欢狼人杀的', {'狼人杀'}),
+    ('一起追韩剧吧', {'韩剧'}),
+    ('music and movies', {'music', 'movies'}),
+    ('ＦＰＳ游戏 开黑', {'fps', '游戏', '开黑'}),
+]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--texts', type=int, default=100000, help='每个吞吐测试处理的文本数')
+    parser.add_argument('--distinct', type=int, default=200, help='缓存测试中不同文本的数量')
+    parser.add_argument('--cache-size', type=int, default=4096)
+    parser.add_argument('--verbose', action='store_true')
+    return parser.parse_args()
+
+
+def make_texts(rng, count):
+    """把质量测试集中的聊天目的随机拼接并加上编号，得到互不相同的文本"""
+    purposes = [purpose for purpose, _ in QUALITY_SET]
+    return [f"{'，'.join(rng.sample(purposes, rng.randint(1, 3)))} {i}" for i in range(count)]
+
+
+def throughput(extract, texts):
+    t0 = time.perf_counter()
+    for text in texts:
+        extract(text)
+    return len(texts) / (time.perf_counter() - t0)
+
+
+def quality(extract, verbose=False):
+    """返回 (召回率, 准确率)"""
+    expected_total = found_total = correct_total = 0
+    for purpose, expected in QUALITY_SET:
+        found = set(extract(purpose))
+        correct = found & expected
+        expected_total += len(expected)
+        found_total += len(found)
+        correct_total += len(correct)
+        if verbose and found != expected:
+            print(f'  {purpose}: 漏掉 {sorted(expected - found)} 多出 {sorted(found - expected)}')
+    return correct_total / expected_total, correct_total / found_total if found_total else 0.0
+
+
+def main():
+    args = parse_args()
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    from keyword_matcher import KeywordMatcher
+    from keyword_tokenizer import create_tokenizer
+
+    rng = random.Random(1)
+    unique_texts = make_texts(rng, args.texts)
+    distinct = make_texts(rng, args.distinct)
+    repeated_texts = [rng.choice(distinct) for _ in range(args.texts)]
+
+    print(f"{'tokenizer':<10} {'unique(texts/s)':>16} {'repeated(texts/s)':>18} {'hit rate':>9} "
+          f"{'recall':>7} {'precision':>10}")
+    for name in ('simple', 'cjk'):
+        KeywordMatcher.configure(create_tokenizer(name), cache_size=args.cache_size)
+        unique = throughput(KeywordMatcher.extract_keywords, unique_texts)
+        KeywordMatcher.configure(cache_size=args.cache_size)
+        repeated = throughput(KeywordMatcher.extract_keywords, repeated_texts)
+        info = KeywordMatcher.cache_info()
+        hit_rate = info.hits / (info.hits + info.misses)
+
+        if args.verbose:
+            print(f'{name}:')
+        recall, precision = quality(KeywordMatcher.extract_keywords, verbose=args.verbose)
+        print(f'{name:<10} {unique:>16,.0f} {repeated:>18,.0f} {hit_rate:>9.1%} {recall:>7.1%} {precision:>10.1%}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""
+匹配队列微基准测试
+在不同等待人数下测量加入、匹配、取消的单次操作耗时，验证开销不随队列规模增长
+
+用法: python benchmarks/bench_matching_queue.py [--sizes 100,1000,10000,100000]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from matching_queue import MatchingQueue  # noqa: E402
+
+VOCABULARY = [f'话题{i}' for i in range(2000)]
+
+
+def random_profile(rng):
+    return {'keywords': rng.sample(VOCABULARY, 3), 'bio': '', 'purpose': ''}
+
+
+def fill_queue(size, rng):
+    """构造一个已有 size 个随机用户和 size 个关键词用户等待的队列"""
+    queue = MatchingQueue()
+    for i in range(size):
+        queue.add(f'r{i}')
+        queue.add_with_profile(f'k{i}', random_profile(rng))
+    return queue
+
+
+def per_op_us(fn, ops):
+    start = time.perf_counter()
+    for i in range(ops):
+        fn(i)
+    return (time.perf_counter() - start) / ops * 1e6
+
+
+def bench_size(size, ops, rng):
+    queue = fill_queue(size, rng)
+    profiles = [random_profile(rng) for _ in range(ops)]
+    results = {}
+
+    # 加入后立即取消：队列规模保持不变
+    def join_cancel_random(i):
+        queue.add(f'x{i}')
+        queue.remove(f'x{i}')
+
+    def join_cancel_keyword(i):
+        queue.add_with_profile(f'y{i}', profiles[i])
+        queue.remove(f'y{i}')
+
+    # 匹配后补回一个用户，保持队列规模
+    def match_random(i):
+        matched = queue.try_match(f'z{i}')
+        queue.add(matched or f'z{i}')
+
+    def match_keyword(i):
+        user_id = f'w{i}'
+        queue.add_with_profile(user_id, profiles[i])
+        result = queue.try_keyword_match(user_id, profiles[i])
+        if result:
+            queue.add_with_profile(result[0], random_profile(rng))
+        else:
+            queue.remove(user_id)
+
+    results['join+cancel (random)'] = per_op_us(join_cancel_random, ops)
+    results['join+cancel (keyword)'] = per_op_us(join_cancel_keyword, ops)
+    results['match (random)'] = per_op_us(match_random, ops)
+    results['match (keyword)'] = per_op_us(match_keyword, ops)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', default='100,1000,10000,100000')
+    parser.add_argument('--ops', type=int, default=5000)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    sizes = [int(s) for s in args.sizes.split(',')]
+    table = {size: bench_size(size, args.ops, rng) for size in sizes}
+
+    names = list(next(iter(table.values())).keys())
+    print(f"{'operation (us/op)':<24}" + ''.join(f'{size:>12}' for size in sizes))
+    for name in names:
+        print(f'{name:<24}' + ''.join(f'{table[size][name]:>12.2f}' for size in sizes))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""
+运行指标开销基准测试
+分别在 METRICS_ENABLED=false / true 的子进程中启动 app，用一对 Socket.IO 测试客户端在私密房间中
+反复发送消息（send_message 是最热的事件），比较每个事件的平均耗时；
+另外单独测量一次直方图 observe 和计数器 inc 的耗时
+
+用法:
+    python benchmarks/bench_metrics.py
+    python benchmarks/bench_metrics.py --events 20000 --rounds 5
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--events', type=int, default=5000, help='每轮发送的消息数')
+    parser.add_argument('--rounds', type=int, default=3, help='每种配置运行的轮数（取最快一轮）')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+def run_child(events):
+    """在当前进程中启动 app，返回每个 send_message 事件的平均耗时（秒）"""
+    sys.path.insert(0, ROOT)
+    from app import app, socketio, message_writer
+    from models import init_db
+
+    with app.app_context():
+        init_db()
+
+    def client():
+        flask_client = app.test_client()
+        flask_client.get('/')
+        return socketio.test_client(app, flask_test_client=flask_client)
+
+    owner, guest = client(), client()
+    owner.emit('create_private_room', {})
+    room_key = next(r['args'][0]['room_key'] for r in owner.get_received() if r['name'] == 'private_room_created')
+    guest.emit('join_private_room', {'room_key': room_key})
+    room_id = next(r['args'][0]['room_id'] for r in guest.get_received() if r['name'] == 'joined_private_room')
+    owner.get_received()
+
+    start = time.perf_counter()
+    for i in range(events):
+        owner.emit('send_message', {'room_id': room_id, 'content': f'消息 {i}'})
+        # 及时取走收到的消息，避免测试客户端的接收队列无限增长
+        if i % 100 == 99:
+            owner.get_received()
+            guest.get_received()
+    elapsed = time.perf_counter() - start
+    message_writer.flush()
+    return elapsed / events
+
+
+def measure(enabled, events):
+    env = dict(os.environ, METRICS_ENABLED='true' if enabled else 'false',
+               DATABASE_URL='sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db'))
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--child', '--events', str(events)],
+        env=env, cwd=ROOT, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])['per_event']
+
+
+def bench_primitives(iterations=200000):
+    sys.path.insert(0, ROOT)
+    import metrics
+
+    histogram = metrics.Histogram('bench_histogram_seconds', '基准测试').labels()
+    counter = metrics.Counter('bench_total', '基准测试').labels()
+    start = time.perf_counter()
+    for i in range(iterations):
+        histogram.observe(0.001)
+    observe = (time.perf_counter() - start) / iterations
+    start = time.perf_counter()
+    for i in range(iterations):
+        counter.inc()
+    inc = (time.perf_counter() - start) / iterations
+    return observe, inc
+
+
+def main():
+    args = parse_args()
+    if args.child:
+        print(json.dumps({'per_event': run_child(args.events)}))
+        return
+
+    results = {}
+    for enabled in (False, True):
+        results[enabled] = min(measure(enabled, args.events) for _ in range(args.rounds))
+
+    print(f"{'metrics':<9} {'us/event':>9}")
+    for enabled, per_event in results.items():
+        print(f"{'on' if enabled else 'off':<9} {per_event * 1e6:>9.1f}")
+    overhead = results[True] - results[False]
+    print(f'overhead: {overhead * 1e6:+.1f}us/event ({overhead / results[False] * 100:+.1f}%)')
+
+    observe, inc = bench_primitives()
+    print(f'histogram.observe: {observe * 1e9:.0f}ns, counter.inc: {inc * 1e9:.0f}ns')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,182 @@
+"""
+多 worker 负载测试：STATE_BACKEND=redis 下用 N 个服务进程共享在线用户和匹配池
+客户端轮流连接到各个 worker，两两加入随机匹配，配对后互发消息，
+报告全部配对完成的耗时、跨 worker 配对比例和每秒送达消息数
+
+依赖 python-socketio 客户端（websocket-client）和 requests；不传 --redis-url 时
+用 fakeredis 在本地启动一个 Redis 协议服务作为替身。SQLite 不支持多进程分配消息ID，
+默认每个 worker 使用独立的临时 SQLite 库，测试共享数据库请传 --database-url（PostgreSQL）。
+
+用法:
+    python benchmarks/bench_multiworker.py --workers 1 2 4
+    python benchmarks/bench_multiworker.py --redis-url redis://localhost:6379/0 --database-url postgresql://...
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+WORKER_CODE = """
+import sys
+sys.path.insert(0, sys.argv[2])
+from app import app, socketio
+from models import init_db
+with app.app_context():
+    init_db()
+socketio.run(app, host='127.0.0.1', port=int(sys.argv[1]), allow_unsafe_werkzeug=True)
+"""
+
+REDIS_CODE = """
+import sys
+from fakeredis import TcpFakeServer
+TcpFakeServer(('127.0.0.1', int(sys.argv[1])), server_type='redis').serve_forever()
+"""
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--pairs', type=int, default=50, help='聊天对数')
+    parser.add_argument('--messages', type=int, default=20, help='每个客户端发送的消息数')
+    parser.add_argument('--redis-url', default=None, help='默认用 fakeredis 启动本地替身')
+    parser.add_argument('--database-url', default=None, help='默认每个 worker 一个临时 SQLite 库')
+    parser.add_argument('--base-port', type=int, default=15000)
+    parser.add_argument('--timeout', type=float, default=60.0)
+    return parser.parse_args()
+
+
+def wait_http(url, timeout=30.0):
+    import requests
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            requests.get(url, timeout=1)
+            return
+        except requests.ConnectionError:
+            time.sleep(0.2)
+    raise RuntimeError(f'服务未启动: {url}')
+
+
+class BenchClient:
+    """一个聊天用户：HTTP 取得 session 后用 websocket 连接到指定 worker"""
+
+    def __init__(self, url):
+        import requests
+        import socketio
+
+        self.url = url
+        self.worker = url
+        self.matched = threading.Event()
+        self.received = 0
+        self.lock = threading.Lock()
+
+        response = requests.get(url + '/')
+        cookie = '; '.join(f'{k}={v}' for k, v in response.cookies.items())
+
+        self.sio = socketio.Client(reconnection=False)
+        self.sio.on('matched', self._on_matched)
+        self.sio.on('new_message', self._on_message)
+        self.sio.connect(url, headers={'Cookie': cookie}, transports=['websocket'])
+
+    def _on_matched(self, data):
+        self.room_id = data['room_id']
+        self.matched.set()
+
+    def _on_message(self, data):
+        with self.lock:
+            self.received += 1
+
+
+def run(args, workers, redis_url, workdir):
+    import redis
+
+    redis.Redis.from_url(redis_url).flushdb()
+
+    env = dict(os.environ, STATE_BACKEND='redis', REDIS_URL=redis_url, MATCH_SCHEDULER_ENABLED='true',
+               SOCKETIO_TRANSPORTS='websocket')
+    processes = []
+    urls = []
+    for i in range(workers):
+        port = args.base_port + i
+        worker_env = dict(env, DATABASE_URL=args.database_url or
+                          'sqlite:///' + os.path.join(workdir, f'worker{workers}_{i}.db'))
+        processes.append(subprocess.Popen(
+            [sys.executable, '-c', WORKER_CODE, str(port), ROOT],
+            env=worker_env, cwd=workdir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        ))
+        urls.append(f'http://127.0.0.1:{port}')
+
+    clients = []
+    try:
+        for url in urls:
+            wait_http(url)
+
+        clients = [BenchClient(urls[i % workers]) for i in range(args.pairs * 2)]
+
+        start = time.perf_counter()
+        for client in clients:
+            client.sio.emit('join_queue')
+        for client in clients:
+            if not client.matched.wait(args.timeout):
+                raise RuntimeError('配对超时')
+        match_seconds = time.perf_counter() - start
+
+        rooms = {}
+        for client in clients:
+            rooms.setdefault(client.room_id, set()).add(client.worker)
+        cross_worker = sum(1 for hosts in rooms.values() if len(hosts) > 1) / len(rooms)
+
+        # 每条消息送达发送者和对方两个客户端
+        expected = len(clients) * args.messages * 2
+        start = time.perf_counter()
+        for i in range(args.messages):
+            for client in clients:
+                client.sio.emit('send_message', {'content': f'消息 {i}'})
+
+        deadline = time.monotonic() + args.timeout
+        while sum(client.received for client in clients) < expected and time.monotonic() < deadline:
+            time.sleep(0.01)
+        elapsed = time.perf_counter() - start
+        delivered = sum(client.received for client in clients)
+
+        return match_seconds, cross_worker, delivered / elapsed, delivered / expected
+    finally:
+        for client in clients:
+            client.sio.disconnect()
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+
+
+def main():
+    args = parse_args()
+    workdir = tempfile.mkdtemp()  # Flask-Session 文件目录（各 worker 共享）
+
+    redis_process = None
+    redis_url = args.redis_url
+    if redis_url is None:
+        port = args.base_port - 1
+        redis_process = subprocess.Popen([sys.executable, '-c', REDIS_CODE, str(port)])
+        redis_url = f'redis://127.0.0.1:{port}/0'
+        time.sleep(1)
+
+    try:
+        print(f"redis: {redis_url}, pairs: {args.pairs}, messages/client: {args.messages}, cpus: {os.cpu_count()}")
+        print(f"{'workers':>8} {'match(s)':>9} {'cross':>7} {'msgs/s':>9} {'delivered':>10}")
+        for workers in args.workers:
+            match_seconds, cross_worker, throughput, delivered = run(args, workers, redis_url, workdir)
+            print(f'{workers:>8} {match_seconds:>9.2f} {cross_worker:>7.0%} {throughput:>9.0f} {delivered:>10.0%}')
+    finally:
+        if redis_process:
+            redis_process.terminate()
+
+
+if __name__ == '__main__':
+    main()
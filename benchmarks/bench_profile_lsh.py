@@ -0,0 +1,105 @@
+"""
+资料文本匹配基准测试：线性扫描 vs MinHash/LSH
+在合成的中文资料上比较两种检索方式的召回率和 p99 延迟
+
+用法: python benchmarks/bench_profile_lsh.py [--sizes 10000,100000] [--queries 200]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from keyword_matcher import KeywordMatcher  # noqa: E402
+from profile_lsh import ProfileLSH  # noqa: E402
+
+SUBJECTS = ['科幻电影', '独立音乐', '篮球比赛', '日本动漫', '考研复习', '健身减脂', '摄影技巧', '咖啡烘焙',
+            '编程学习', '历史小说', '旅行攻略', '猫咪日常', '桌游推理', '古典吉他', '股票基金', '英语口语',
+            '心理咨询', '职场吐槽', '恋爱烦恼', '宇宙天文', '美食探店', '绘画插画', '电子游戏', '马拉松']
+ACTIONS = ['喜欢', '想聊聊', '最近在研究', '周末常常', '一直很关注', '想找人讨论', '刚开始接触', '特别迷']
+SUFFIXES = ['有同好吗', '欢迎来找我', '希望认识新朋友', '随便聊聊', '求推荐', '一起交流经验']
+
+
+def synthetic_profile(rng):
+    phrases = [rng.choice(ACTIONS) + rng.choice(SUBJECTS) for _ in range(rng.randint(2, 4))]
+    return '，'.join(phrases) + '，' + rng.choice(SUFFIXES)
+
+
+def perturb(text, rng):
+    """对资料做小幅修改，模拟“相似但不相同”的查询"""
+    parts = text.split('，')
+    parts[rng.randrange(len(parts))] = rng.choice(ACTIONS) + rng.choice(SUBJECTS)
+    return '，'.join(parts)
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def bench_size(size, queries, min_similarity, rng):
+    lsh = ProfileLSH()
+    profiles = [synthetic_profile(rng) for _ in range(size)]
+
+    start = time.perf_counter()
+    for i, text in enumerate(profiles):
+        lsh.add(str(i), text)
+    build_seconds = time.perf_counter() - start
+
+    # 线性扫描：与 KeywordMatcher.find_best_match 相同，对每个候选构造集合计算 Jaccard
+    candidates = [{'user_id': str(i), 'keywords': list(lsh.shingles(text))} for i, text in enumerate(profiles)]
+
+    linear_latency, lsh_latency = [], []
+    relevant = hits = 0
+    for _ in range(queries):
+        query = perturb(profiles[rng.randrange(size)], rng)
+        query_shingles = list(lsh.shingles(query))
+
+        start = time.perf_counter()
+        exact = KeywordMatcher.find_best_match(query_shingles, candidates, min_similarity)
+        linear_latency.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        approx = lsh.query(query, min_similarity=min_similarity)
+        lsh_latency.append(time.perf_counter() - start)
+
+        if exact:
+            relevant += 1
+            # 返回的用户与线性扫描的最佳结果同样相似即视为命中
+            if approx:
+                approx_score = KeywordMatcher.calculate_similarity(
+                    query_shingles, candidates[int(approx[0])]['keywords']
+                )
+                hits += approx_score >= exact[1] - 1e-9
+
+    return {
+        'build_s': build_seconds,
+        'recall': hits / relevant if relevant else 1.0,
+        'linear_p50_ms': percentile(linear_latency, 50) * 1000,
+        'linear_p99_ms': percentile(linear_latency, 99) * 1000,
+        'lsh_p50_ms': percentile(lsh_latency, 50) * 1000,
+        'lsh_p99_ms': percentile(lsh_latency, 99) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', default='10000,100000')
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--min-similarity', type=float, default=0.3)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    print(f"{'size':>8} {'build(s)':>9} {'recall':>7} {'linear p50':>11} {'linear p99':>11} "
+          f"{'lsh p50':>9} {'lsh p99':>9}")
+    for size in (int(s) for s in args.sizes.split(',')):
+        r = bench_size(size, args.queries, args.min_similarity, rng)
+        print(f"{size:>8} {r['build_s']:>9.1f} {r['recall']:>7.3f} {r['linear_p50_ms']:>9.2f}ms "
+              f"{r['linear_p99_ms']:>9.2f}ms {r['lsh_p50_ms']:>7.2f}ms {r['lsh_p99_ms']:>7.2f}ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+"""
+限流器基准测试：每次 acquire 的耗时
+按 send_message 的默认限额（user + room 两个维度）对不同数量的活跃用户轮流取令牌，
+报告每次调用的耗时和保存的桶数；最后让所有桶空闲到回满，验证它们会在后续调用中被顺带清理
+
+用法:
+    python benchmarks/bench_rate_limiter.py
+    python benchmarks/bench_rate_limiter.py --users 100 10000 100000 --calls 500000
+"""
+import argparse
+import os
+import sys
+import time
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, nargs='+', default=[100, 10000, 100000])
+    parser.add_argument('--calls', type=int, default=200000)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    from rate_limiter import RateLimiter, parse_limits
+
+    print(f"{'users':>8} {'ns/acquire':>11} {'limited':>8} {'buckets':>8}")
+    for users in args.users:
+        limiter = RateLimiter(parse_limits('send_message:user=5/10,room=20/40'))
+        user_ids = [f'u{i}' for i in range(users)]
+        room_ids = [f'r{i // 2}' for i in range(users)]
+
+        limited = 0
+        start = time.perf_counter()
+        for i in range(args.calls):
+            n = i % users
+            if limiter.acquire('send_message', user=user_ids[n], room=room_ids[n]):
+                limited += 1
+        elapsed = time.perf_counter() - start
+        print(f'{users:>8} {elapsed / args.calls * 1e9:>11.0f} {limited:>8} {limiter.bucket_count():>8}')
+
+    # 桶容量 / 速率 = 0.1 秒后回满，之后的调用会把空闲的桶清理掉
+    limiter = RateLimiter(parse_limits('send_message:user=100/10'))
+    for i in range(10000):
+        limiter.acquire('send_message', user=f'u{i}')
+    before = limiter.bucket_count()
+    time.sleep(0.2)
+    for i in range(5000):
+        limiter.acquire('send_message', user=f'v{i}')
+    print(f'idle expiry: {before} idle buckets, after 5000 new users -> {limiter.bucket_count()} buckets')
+
+    # 未配置限额的事件直接放行
+    start = time.perf_counter()
+    for i in range(args.calls):
+        limiter.acquire('connect', user='u')
+    print(f'unlimited event: {(time.perf_counter() - start) / args.calls * 1e9:.0f}ns/acquire')
+
+
+if __name__ == '__main__':
+    main()
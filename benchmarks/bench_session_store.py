@@ -0,0 +1,78 @@
+"""
+Session 后端基准测试：每秒 session 读取次数
+模拟 Socket.IO 事件处理时的 session.get('user_id')：用同一个 cookie 反复调用 session 接口的
+open_session 并读取 user_id（不含请求上下文本身的开销），另外报告 memory 后端清理过期 session 的耗时
+
+用法:
+    python benchmarks/bench_session_store.py
+    python benchmarks/bench_session_store.py --backends cookie memory --lookups 50000
+    python benchmarks/bench_session_store.py --backends redis --redis-url redis://localhost:6379/0
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--backends', nargs='+', default=['filesystem', 'memory', 'cookie'])
+    parser.add_argument('--lookups', type=int, default=20000)
+    parser.add_argument('--sessions', type=int, default=10000, help='预先写入的 session 数（服务端存储）')
+    parser.add_argument('--redis-url', default='redis://localhost:6379/0')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    os.chdir(tempfile.mkdtemp())  # filesystem 后端的 flask_session 目录
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    from flask import Flask, request, session
+
+    from config import Config
+    from session_store import MemorySessionStore, init_session
+
+    print(f"{'backend':<12} {'lookups/s':>11} {'us/lookup':>10}")
+    for backend in args.backends:
+        app = Flask(__name__)
+        app.config.from_object(Config)
+        app.config['SESSION_BACKEND'] = backend
+        app.config['REDIS_URL'] = args.redis_url
+        store = init_session(app)
+
+        @app.route('/')
+        def index():
+            session['user_id'] = os.urandom(4).hex()
+            return ''
+
+        client = app.test_client()
+        # 其他用户的 session，让服务端存储有一定规模
+        for _ in range(args.sessions if backend != 'cookie' else 0):
+            app.test_client().get('/')
+        client.get('/')
+        cookie = client.get_cookie(app.config['SESSION_COOKIE_NAME'])
+        headers = {'Cookie': f'{cookie.key}={cookie.value}'}
+
+        interface = app.session_interface
+        with app.test_request_context('/', headers=headers):
+            current_request = request._get_current_object()
+            start = time.perf_counter()
+            for _ in range(args.lookups):
+                assert interface.open_session(app, current_request).get('user_id')
+            elapsed = time.perf_counter() - start
+
+        print(f'{backend:<12} {args.lookups / elapsed:>11.0f} {elapsed / args.lookups * 1e6:>10.1f}')
+
+        if store is not None:
+            expired = MemorySessionStore(ttl=0)
+            for i in range(args.sessions):
+                expired.set(str(i), {'user_id': str(i)})
+            start = time.perf_counter()
+            removed = expired.sweep()
+            print(f'{"":<12} sweep: {removed} expired sessions in {(time.perf_counter() - start) * 1000:.1f}ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""
+线上格式基准测试：json vs msgpack 的带宽和服务端编码耗时
+用 python-socketio 的 Packet 按服务端实际发送的方式编码（msgpack 为二进制附件），比较：
+- room_history：一页历史消息，json 为对象列表，msgpack 为按列存放
+- new_message 突发：N 条消息逐条发送的 json 帧 vs 合并后的一个 message_batch 帧
+
+用法:
+    python benchmarks/bench_wire_format.py
+    python benchmarks/bench_wire_format.py --page-size 50 --burst 20 --content-length 40
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--page-size', type=int, default=50, help='一页历史消息条数')
+    parser.add_argument('--burst', type=int, default=20, help='合并窗口内的新消息条数')
+    parser.add_argument('--content-length', type=int, default=40, help='消息平均字数')
+    parser.add_argument('--iterations', type=int, default=2000)
+    return parser.parse_args()
+
+
+def wire_size(encoded) -> int:
+    """Packet.encode 的结果：json 为字符串，带二进制附件时为 [字符串, bytes, ...]"""
+    parts = encoded if isinstance(encoded, list) else [encoded]
+    return sum(len(part.encode() if isinstance(part, str) else part) for part in parts)
+
+
+def bench(encode, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        result = encode()
+    return (time.perf_counter() - start) / iterations, result
+
+
+def main():
+    args = parse_args()
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    from socketio.packet import EVENT, Packet
+
+    import wire_format
+
+    rng = random.Random(1)
+    alphabet = '你好今天天气不错我们聊聊电影音乐旅行吧哈哈abcdefg 0123456789'
+    start = datetime(2024, 1, 1)
+
+    def message(i):
+        return {
+            'id': i,
+            'sender_id': rng.choice(['1a2b3c4d', '5e6f7a8b']),
+            'content': ''.join(rng.choice(alphabet) for _ in range(rng.randint(1, args.content_length * 2))),
+            'timestamp': (start + timedelta(seconds=i * 7)).isoformat()
+        }
+
+    history = [message(i) for i in range(args.page_size)]
+    page = {'room_id': '1', 'room_key': 'ABCD2345', 'message_count': len(history),
+            'cursor': {'timestamp': history[0]['timestamp'], 'id': history[0]['id']},
+            'has_more': True, 'older': False}
+    burst = [{k: v for k, v in message(i).items() if k != 'id'} for i in range(args.burst)]
+
+    # 每个用例返回发送的帧列表
+    cases = {
+        'room_history json': lambda: [Packet(EVENT, data=['room_history', dict(page, messages=history)]).encode()],
+        'room_history msgpack': lambda: [Packet(EVENT, data=['room_history', wire_format.encode(
+            dict(page, messages=wire_format.to_columns(history, ('id', 'sender_id', 'content', 'timestamp'))),
+            'msgpack')]).encode()],
+        f'{args.burst} x new_message json': lambda: [
+            Packet(EVENT, data=['new_message', msg]).encode() for msg in burst],
+        f'message_batch({args.burst}) msgpack': lambda: [Packet(EVENT, data=['message_batch', wire_format.encode(
+            {'room_id': '1', 'messages': wire_format.to_columns(burst, wire_format.MESSAGE_FIELDS)},
+            'msgpack')]).encode()],
+    }
+
+    print(f"{'payload':<30} {'frames':>7} {'bytes':>8} {'us/encode':>10}")
+    for name, encode in cases.items():
+        elapsed, frames = bench(encode, args.iterations)
+        size = sum(wire_size(frame) for frame in frames)
+        print(f'{name:<30} {len(frames):>7} {size:>8} {elapsed * 1e6:>10.1f}')
+
+
+if __name__ == '__main__':
+    main()
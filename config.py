@@ -1,6 +1,42 @@
 import os
 from sqlalchemy.pool import NullPool
 
+
+def engine_options(database_url: str, pool_mode: str = 'queue', pool_size: int = 5, max_overflow: int = 10,
+                   pool_recycle: int = 1800, pool_timeout: float = 10, pool_pre_ping: bool = False) -> dict:
+    """
+    生成 SQLAlchemy 引擎参数
+
+    Args:
+        database_url: 数据库地址
+        pool_mode: 'queue'（有界连接池）或 'null'（每次使用都新建连接）
+        pool_size: 连接池常驻连接数
+        max_overflow: 高峰时允许超出 pool_size 的临时连接数
+        pool_recycle: 连接最长使用秒数，避免被服务端或代理断开的空闲连接
+        pool_timeout: 连接池耗尽时等待归还的最长秒数
+        pool_pre_ping: 每次取出连接时是否先 ping 一次
+
+    Returns:
+        SQLALCHEMY_ENGINE_OPTIONS
+    """
+    if pool_mode == 'null':
+        return {'poolclass': NullPool, 'pool_pre_ping': True}
+
+    # SQLite 内存库只能用单连接池，不接受连接池大小参数
+    if database_url.startswith('sqlite') and (database_url == 'sqlite://' or ':memory:' in database_url):
+        return {}
+
+    # eventlet worker 会给连接池用到的锁和队列打补丁，等待连接时只挂起当前协程
+    return {
+        'pool_size': pool_size,
+        'max_overflow': max_overflow,
+        'pool_recycle': pool_recycle,
+        'pool_timeout': pool_timeout,
+        'pool_pre_ping': pool_pre_ping,
+        'pool_use_lifo': True  # 优先复用最近归还的连接，多余的空闲连接能被回收
+    }
+
+
 class Config:
     """Flask应用配置"""
 
@@ -16,12 +52,117 @@ class Config:
     SQLALCHEMY_DATABASE_URI = database_url
     SQLALCHEMY_TRACK_MODIFICATIONS = False
 
-    # 使用 NullPool 禁用连接池，完全兼容 eventlet
-    SQLALCHEMY_ENGINE_OPTIONS = {
-        'poolclass': NullPool,
-        'pool_pre_ping': True
-    }
+    # 数据库连接池：queue（有界连接池，默认）或 null（每次使用都新建连接，旧行为）
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(
+        database_url,
+        pool_mode=os.environ.get('DB_POOL_MODE', 'queue'),
+        pool_size=int(os.environ.get('DB_POOL_SIZE', '5')),
+        max_overflow=int(os.environ.get('DB_MAX_OVERFLOW', '10')),
+        pool_recycle=int(os.environ.get('DB_POOL_RECYCLE', '1800')),
+        pool_timeout=float(os.environ.get('DB_POOL_TIMEOUT', '10')),
+        pool_pre_ping=os.environ.get('DB_POOL_PRE_PING', 'false').lower() == 'true'
+    )
+
+    # 在线用户与匹配池存储：memory（单进程）或 redis（多个 worker / 节点共享，
+    # 同时作为 Socket.IO 的跨进程消息队列，需启用后台匹配调度器）
+    STATE_BACKEND = os.environ.get('STATE_BACKEND', 'memory')
+    REDIS_URL = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
+    STATE_KEY_PREFIX = os.environ.get('STATE_KEY_PREFIX', 'chat:')
+    MATCH_LEADER_LOCK_MS = int(os.environ.get('MATCH_LEADER_LOCK_MS', '2000'))  # 匹配调度锁过期时间
+    # 客户端可用的传输方式；多个 worker 共用端口且没有粘性会话时只能用 websocket
+    SOCKETIO_TRANSPORTS = os.environ.get('SOCKETIO_TRANSPORTS', 'polling,websocket').split(',')
+
+    # 关键词匹配配置（IDF 加权相似度低于该阈值的候选不会被匹配）
+    KEYWORD_MIN_SIMILARITY = float(os.environ.get('KEYWORD_MIN_SIMILARITY', '0.1'))
+    # 没有关键词重合时，按 bio + purpose 文本（MinHash 估计的 Jaccard）匹配的阈值
+    PROFILE_MIN_SIMILARITY = float(os.environ.get('PROFILE_MIN_SIMILARITY', '0.3'))
+
+    # 后台匹配调度器：每隔 N 毫秒对整个等待池批量配对，等待越久阈值越低，超时后回退到随机配对
+    MATCH_SCHEDULER_ENABLED = os.environ.get('MATCH_SCHEDULER_ENABLED', 'true').lower() == 'true'
+    MATCH_SCHEDULER_INTERVAL_MS = int(os.environ.get('MATCH_SCHEDULER_INTERVAL_MS', '200'))
+    MATCH_THRESHOLD_DECAY = float(os.environ.get('MATCH_THRESHOLD_DECAY', '0.01'))  # 每秒降低量
+    MATCH_THRESHOLD_FLOOR = float(os.environ.get('MATCH_THRESHOLD_FLOOR', '0.0'))
+    MATCH_RANDOM_FALLBACK_SECONDS = float(os.environ.get('MATCH_RANDOM_FALLBACK_SECONDS', '30'))
+
+    # 消息写后持久化：消息先广播，再由后台任务批量写入数据库
+    MESSAGE_WRITE_BEHIND = os.environ.get('MESSAGE_WRITE_BEHIND', 'true').lower() == 'true'
+    MESSAGE_BATCH_SIZE = int(os.environ.get('MESSAGE_BATCH_SIZE', '200'))
+    MESSAGE_FLUSH_INTERVAL_MS = int(os.environ.get('MESSAGE_FLUSH_INTERVAL_MS', '100'))
+    MESSAGE_BUFFER_SIZE = int(os.environ.get('MESSAGE_BUFFER_SIZE', '10000'))
+    # 每条消息遇到暂时性数据库错误时的最大重试次数（指数退避，最长 30 秒），超过后记入死信日志
+    MESSAGE_WRITE_MAX_RETRIES = int(os.environ.get('MESSAGE_WRITE_MAX_RETRIES', '5'))
+
+    # Socket.IO 线上格式：服务端允许的格式（客户端在连接时协商），以及 msgpack 连接的新消息合并窗口
+    WIRE_FORMATS = os.environ.get('WIRE_FORMATS', 'msgpack,json').split(',')
+    MESSAGE_BATCH_WINDOW_MS = int(os.environ.get('MESSAGE_BATCH_WINDOW_MS', '20'))
+
+    # 用户简介缓存的用户数（内容没有变化时不再写数据库）
+    PROFILE_CACHE_SIZE = int(os.environ.get('PROFILE_CACHE_SIZE', '10000'))
+
+    # 历史消息每页条数（按 (timestamp, id) 游标分页）
+    HISTORY_PAGE_SIZE = int(os.environ.get('HISTORY_PAGE_SIZE', '50'))
+    # 房间最近消息缓存：每个房间保留的消息数、所有房间共用的内存上限（字节），仅单进程（memory 后端）时启用
+    MESSAGE_CACHE_ENABLED = os.environ.get('MESSAGE_CACHE_ENABLED', 'true').lower() == 'true'
+    MESSAGE_CACHE_PER_ROOM = int(os.environ.get('MESSAGE_CACHE_PER_ROOM', '200'))
+    MESSAGE_CACHE_MAX_BYTES = int(os.environ.get('MESSAGE_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+
+    # 关键词提取：分词器（cjk 词典最大匹配 / simple 按空白标点切分）、用户词典文件（每行一个词）、结果缓存条数
+    KEYWORD_TOKENIZER = os.environ.get('KEYWORD_TOKENIZER', 'cjk')
+    KEYWORD_DICTIONARY_PATH = os.environ.get('KEYWORD_DICTIONARY_PATH', '')
+    KEYWORD_CACHE_SIZE = int(os.environ.get('KEYWORD_CACHE_SIZE', '4096'))
+
+    # 管理后台：聊天室列表每页房间数，导出时每批从数据库游标读取的行数
+    ADMIN_ROOMS_PER_PAGE = int(os.environ.get('ADMIN_ROOMS_PER_PAGE', '20'))
+    ADMIN_EXPORT_CHUNK_SIZE = int(os.environ.get('ADMIN_EXPORT_CHUNK_SIZE', '1000'))
+    # 管理后台消息搜索每页条数（请求的 limit 最多为它的 4 倍）
+    ADMIN_SEARCH_PAGE_SIZE = int(os.environ.get('ADMIN_SEARCH_PAGE_SIZE', '50'))
+
+    # 私密房间秘钥池：后台预生成并校验过的秘钥，创建房间时乐观插入，冲突重试
+    ROOM_KEY_POOL_SIZE = int(os.environ.get('ROOM_KEY_POOL_SIZE', '200'))
+    ROOM_KEY_POOL_REFILL_BELOW = int(os.environ.get('ROOM_KEY_POOL_REFILL_BELOW', '50'))
+    ROOM_KEY_MAX_ATTEMPTS = int(os.environ.get('ROOM_KEY_MAX_ATTEMPTS', '5'))
+
+    # 在线状态：客户端心跳间隔、超过多久没有心跳视为离线、后台清理间隔（秒）
+    HEARTBEAT_INTERVAL = float(os.environ.get('HEARTBEAT_INTERVAL', '25'))
+    PRESENCE_TIMEOUT = float(os.environ.get('PRESENCE_TIMEOUT', '90'))
+    PRESENCE_REAP_INTERVAL = float(os.environ.get('PRESENCE_REAP_INTERVAL', '10'))
+
+    # 数据保留：关闭超过 RETENTION_DAYS 天的非私密房间连同消息归档到 ARCHIVE_DIR（gzip NDJSON 分段文件）后删除，
+    # 每隔 RETENTION_INTERVAL 秒运行一轮，每轮最多 RETENTION_MAX_BATCHES 批、每批 RETENTION_BATCH_SIZE 个房间。
+    # 默认关闭：归档目录需要在持久化磁盘上
+    RETENTION_ENABLED = os.environ.get('RETENTION_ENABLED', 'false').lower() == 'true'
+    RETENTION_DAYS = float(os.environ.get('RETENTION_DAYS', '30'))
+    RETENTION_INTERVAL = float(os.environ.get('RETENTION_INTERVAL', '3600'))
+    RETENTION_BATCH_SIZE = int(os.environ.get('RETENTION_BATCH_SIZE', '100'))
+    RETENTION_MAX_BATCHES = int(os.environ.get('RETENTION_MAX_BATCHES', '50'))
+    ARCHIVE_DIR = os.environ.get('ARCHIVE_DIR', 'archive')
+    ARCHIVE_SEGMENT_MAX_BYTES = int(os.environ.get('ARCHIVE_SEGMENT_MAX_BYTES', str(64 * 1024 * 1024)))
+
+    # 事件限流：事件:维度=每秒令牌数/桶容量，维度为 user / sid / room，多个事件用分号分隔
+    RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', 'true').lower() == 'true'
+    RATE_LIMITS = os.environ.get(
+        'RATE_LIMITS',
+        'send_message:user=5/10,room=20/40;'
+        'join_queue:user=0.5/5;'
+        'join_queue_with_profile:user=0.5/5;'
+        'create_private_room:user=0.2/3,sid=0.2/3;'
+        'join_private_room:user=0.5/5,sid=0.5/5;'
+        'get_room_history:user=2/10'
+    )
+
+    # 运行指标（/metrics，Prometheus 文本格式）
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'true').lower() == 'true'
+
+    # 日志配置（JSON 行，后台线程写入 stdout）
+    LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
+    # 按事件采样，如 "send_message=0.01,join_queue=1"；0 表示不记录该事件
+    LOG_SAMPLE_RATES = os.environ.get('LOG_SAMPLE_RATES', 'send_message=0.01')
+    LOG_QUEUE_SIZE = int(os.environ.get('LOG_QUEUE_SIZE', '10000'))
+    LOG_SHUTDOWN_TIMEOUT = float(os.environ.get('LOG_SHUTDOWN_TIMEOUT', '2'))  # 退出时最多等待写完日志的秒数
 
-    # Session配置
-    SESSION_TYPE = 'filesystem'
+    # Session配置：memory（进程内 LRU + TTL，仅单 worker）、cookie（签名 cookie，无服务端状态）、
+    # redis（使用 REDIS_URL）或 filesystem（旧行为，每次读取都访问磁盘）；共享状态时默认用 cookie
+    SESSION_BACKEND = os.environ.get('SESSION_BACKEND', 'cookie' if STATE_BACKEND == 'redis' else 'memory')
     PERMANENT_SESSION_LIFETIME = 86400  # 24小时
+    SESSION_MEMORY_MAX_ENTRIES = int(os.environ.get('SESSION_MEMORY_MAX_ENTRIES', '100000'))
+    SESSION_SWEEP_INTERVAL = float(os.environ.get('SESSION_SWEEP_INTERVAL', '60'))  # 清理过期 session 的间隔（秒）
@@ -2,9 +2,69 @@
 关键词提取和匹配器
 用于从用户输入的目的中提取关键词，并计算用户之间的相似度
 """
-import re
+import functools
+import heapq
+import math
 from collections import Counter
-from typing import List, Tuple, Optional
+from typing import Dict, Iterable, List, Tuple, Optional, Sequence
+
+from keyword_tokenizer import CJKTokenizer, FUNCTION_WORDS, normalize_text
+
+
+class KeywordVocabulary:
+    """
+    关键词词表：为每个关键词分配一个位编号，把关键词集合压缩成整数位集
+
+    位集的交集只需一次按位运算和 int.bit_count()，MatchingQueue 用它在精确打分前计算候选的分数上界以剪枝。
+    编号按引用计数回收并优先复用最小的空闲编号，保证位集长度只取决于当前在用的关键词数。
+    """
+
+    def __init__(self):
+        self.ids = {}  # {keyword: bit_id}
+        self.keywords = []  # bit_id -> keyword（空闲编号为 None）
+        self._refcounts = []  # bit_id -> 引用计数
+        self._free_ids = []  # 空闲编号小顶堆
+
+    def acquire(self, keyword: str) -> int:
+        """引用关键词（不存在时分配编号），返回位编号"""
+        bit_id = self.ids.get(keyword)
+        if bit_id is None:
+            if self._free_ids:
+                bit_id = heapq.heappop(self._free_ids)
+                self.keywords[bit_id] = keyword
+                self._refcounts[bit_id] = 0
+            else:
+                bit_id = len(self.keywords)
+                self.keywords.append(keyword)
+                self._refcounts.append(0)
+            self.ids[keyword] = bit_id
+
+        self._refcounts[bit_id] += 1
+        return bit_id
+
+    def release(self, keyword: str):
+        """释放关键词引用，引用计数归零时回收编号"""
+        bit_id = self.ids.get(keyword)
+        if bit_id is None:
+            return
+
+        self._refcounts[bit_id] -= 1
+        if self._refcounts[bit_id] <= 0:
+            del self.ids[keyword]
+            self.keywords[bit_id] = None
+            heapq.heappush(self._free_ids, bit_id)
+
+    def encode(self, keywords: Iterable[str]) -> int:
+        """将关键词集合编码为位集（未登记的关键词被忽略）"""
+        bits = 0
+        for keyword in keywords:
+            bit_id = self.ids.get(keyword)
+            if bit_id is not None:
+                bits |= 1 << bit_id
+        return bits
+
+    def __len__(self):
+        return len(self.ids)
 
 
 class KeywordMatcher:
@@ -17,45 +77,53 @@ class KeywordMatcher:
         '看', '好', '自己', '这', '想', '找', '可以', '那个', '什么', '聊', '聊天',
         '想', '想找', '那个', '一些', '那个', '个', '吗', '吧', '啊', '呢', '嘛',
         '还', '就是', '都是', '或者', '但是', '然后', '因为', '所以', '如果', '虽然'
-    }
+    } | set(FUNCTION_WORDS.split())
+
+    # 分词器（见 keyword_tokenizer），用 configure 替换
+    tokenizer = CJKTokenizer()
 
     @staticmethod
     def extract_keywords(text: str, max_keywords: int = 10) -> List[str]:
         """
-        从文本中提取关键词
+        从文本中提取关键词（按规范化后的文本缓存结果）
 
         Args:
             text: 输入文本
             max_keywords: 最大关键词数量
 
         Returns:
-            关键词列表（按词频降序）
+            关键词列表（按词频降序，词频相同时按出现顺序）
         """
         if not text:
             return []
+        return list(KeywordMatcher._cached_extract(normalize_text(text), max_keywords))
 
-        # 1. 移除特殊字符，保留中文、英文、数字
-        text = re.sub(r'[^\w\s\u4e00-\u9fff]', ' ', text)
-
-        # 2. 分词（按空格和常见分隔符）
-        words = re.split(r'[\s,，、.。;；:：]', text.lower())
-
-        # 3. 过滤停用词和短词
+    @staticmethod
+    def _extract(text: str, max_keywords: int) -> Tuple[str, ...]:
+        """分词、过滤停用词和短词（至少2个字符）后按词频取前 max_keywords 个"""
         keywords = [
-            word.strip() for word in words
-            if word.strip()
-            and len(word.strip()) >= 2  # 至少2个字符
-            and word.strip() not in KeywordMatcher.STOP_WORDS
+            word for word in KeywordMatcher.tokenizer.tokenize(text)
+            if len(word) >= 2 and word not in KeywordMatcher.STOP_WORDS
         ]
+        return tuple(word for word, _ in Counter(keywords).most_common(max_keywords))
 
-        if not keywords:
-            return []
+    @classmethod
+    def configure(cls, tokenizer=None, cache_size: int = 4096):
+        """
+        替换分词器并重建关键词缓存
 
-        # 4. 统计词频
-        word_freq = Counter(keywords)
+        Args:
+            tokenizer: 带 tokenize(text) -> List[str] 方法的分词器，None 表示保持当前分词器
+            cache_size: 按规范化文本缓存的提取结果数（LRU）
+        """
+        if tokenizer is not None:
+            cls.tokenizer = tokenizer
+        cls._cached_extract = staticmethod(functools.lru_cache(maxsize=cache_size)(cls._extract))
 
-        # 5. 返回最常见的关键词
-        return [word for word, _ in word_freq.most_common(max_keywords)]
+    @staticmethod
+    def cache_info():
+        """关键词缓存的命中统计（functools 的 CacheInfo）"""
+        return KeywordMatcher._cached_extract.cache_info()
 
     @staticmethod
     def calculate_similarity(keywords1: List[str], keywords2: List[str]) -> float:
@@ -81,11 +149,57 @@ class KeywordMatcher:
 
         return intersection / union if union > 0 else 0.0
 
+    @staticmethod
+    def idf(document_frequency: int, total_documents: int) -> float:
+        """
+        计算关键词的逆文档频率（IDF）
+
+        Args:
+            document_frequency: 包含该关键词的等待用户数
+            total_documents: 等待用户总数
+
+        Returns:
+            IDF 权重（越常见的关键词权重越低，始终大于0）
+        """
+        return math.log(1.0 + total_documents / max(document_frequency, 1))
+
+    @staticmethod
+    def calculate_weighted_similarity(
+        keywords1: List[str],
+        keywords2: List[str],
+        weights: Dict[str, float],
+        default_weight: float = 1.0
+    ) -> float:
+        """
+        计算两组关键词的加权 Jaccard 相似度
+
+        Args:
+            keywords1: 关键词列表1
+            keywords2: 关键词列表2
+            weights: 关键词权重（通常为 IDF），缺失的关键词使用 default_weight
+            default_weight: 默认权重
+
+        Returns:
+            相似度分数 (0-1之间，1表示完全相同)
+        """
+        if not keywords1 or not keywords2:
+            return 0.0
+
+        set1 = set(keywords1)
+        set2 = set(keywords2)
+
+        # 加权 Jaccard = 交集权重和 / 并集权重和
+        intersection = sum(weights.get(k, default_weight) for k in set1 & set2)
+        union = sum(weights.get(k, default_weight) for k in set1 | set2)
+
+        return intersection / union if union > 0 else 0.0
+
     @staticmethod
     def find_best_match(
         user_keywords: List[str],
         candidate_profiles: List[dict],
-        min_similarity: float = 0.2
+        min_similarity: float = 0.2,
+        weights: Optional[Dict[str, float]] = None
     ) -> Optional[Tuple[str, float]]:
         """
         从候选用户中找到最佳匹配
@@ -94,6 +208,7 @@ class KeywordMatcher:
             user_keywords: 当前用户的关键词
             candidate_profiles: 候选用户资料列表 [{'user_id': 'xxx', 'keywords': [...]}, ...]
             min_similarity: 最小相似度阈值
+            weights: 关键词权重，提供时使用加权 Jaccard 相似度
 
         Returns:
             (匹配用户ID, 相似度分数) 或 None
@@ -106,10 +221,62 @@ class KeywordMatcher:
             if not candidate_keywords:
                 continue
 
-            score = KeywordMatcher.calculate_similarity(user_keywords, candidate_keywords)
+            if weights is None:
+                score = KeywordMatcher.calculate_similarity(user_keywords, candidate_keywords)
+            else:
+                score = KeywordMatcher.calculate_weighted_similarity(
+                    user_keywords, candidate_keywords, weights
+                )
 
             if score >= min_similarity and score > best_score:
                 best_score = score
                 best_match = profile['user_id']
 
         return (best_match, best_score) if best_match else None
+
+    @staticmethod
+    def weighted_similarity_upper_bounds(
+        query_bits: int,
+        candidate_bits: Sequence[int],
+        query_bit_weights: Dict[int, float],
+        min_weight: float
+    ) -> List[float]:
+        """
+        计算一组候选的加权 Jaccard 相似度上界（位集表示，用于剪枝）
+
+        候选独有的每个关键词权重至少为 min_weight，因此
+        上界 = 交集权重和 / (查询权重和 + min_weight * 候选独有关键词数)，
+        只需按位与和 bit_count() 即可得到。上界只用于决定精确打分的顺序和何时停止，
+        不能代替 calculate_weighted_similarity 的精确分数。
+
+        Args:
+            query_bits: 查询关键词位集
+            candidate_bits: 候选关键词位集列表
+            query_bit_weights: 查询关键词的权重 {bit_id: weight}
+            min_weight: 任意关键词权重的下界
+
+        Returns:
+            与 candidate_bits 一一对应的相似度上界
+        """
+        query_total = sum(query_bit_weights.values())
+        if query_total <= 0:
+            return [0.0] * len(candidate_bits)
+
+        # 交集只可能是查询位集的子集，按子集缓存交集权重
+        intersection_weights = {0: 0.0}
+        bounds = []
+        for bits in candidate_bits:
+            common = bits & query_bits
+            intersection = intersection_weights.get(common)
+            if intersection is None:
+                intersection = sum(
+                    weight for bit_id, weight in query_bit_weights.items() if common >> bit_id & 1
+                )
+                intersection_weights[common] = intersection
+
+            candidate_only = (bits ^ common).bit_count()
+            bounds.append(intersection / (query_total + min_weight * candidate_only))
+        return bounds
+
+
+KeywordMatcher.configure()
@@ -0,0 +1,163 @@
+"""
+关键词分词器
+KeywordMatcher.extract_keywords 通过分词器把规范化后的文本切成候选词，分词器可替换：
+- SimpleTokenizer：按空白和标点切分（旧行为），不带空格的中文句子会成为一个长词
+- CJKTokenizer：中日韩字符按内置词典正向最大匹配，未登录的片段按停用字切开，
+  2~4 字的片段整体作为新词，更长的片段退化为字符二元组；其他文字按单词切分。词典随代码发布，不需要下载
+"""
+import re
+import unicodedata
+from typing import Iterable, List, Optional
+
+# 中日韩字符：CJK 统一汉字及扩展 A、兼容汉字、平假名 / 片假名、韩文音节
+CJK_CHARS = '\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\u3040-\u30ff\uac00-\ud7af'
+
+# 常见的聊天话题词
+TOPIC_WORDS = (
+    '电影 音乐 旅行 旅游 读书 看书 阅读 小说 动漫 漫画 二次元 游戏 手游 电竞 主机 单机 编程 程序员 代码 技术 科技 '
+    '人工智能 数码 摄影 拍照 绘画 画画 设计 美术 写作 诗歌 历史 哲学 心理学 心理 情感 恋爱 失恋 婚姻 家庭 育儿 '
+    '宠物 猫咪 狗狗 美食 做饭 烹饪 烘焙 咖啡 奶茶 健身 运动 跑步 篮球 足球 羽毛球 乒乓球 网球 游泳 瑜伽 爬山 徒步 '
+    '骑行 露营 钓鱼 学习 考研 考公 考试 留学 英语 日语 韩语 外语 工作 职场 加班 创业 投资 理财 股票 基金 经济 金融 '
+    '法律 医学 健康 养生 睡眠 失眠 压力 焦虑 抑郁 孤独 无聊 吐槽 八卦 明星 追星 综艺 电视剧 美剧 韩剧 日剧 纪录片 '
+    '脱口秀 相声 演唱会 摇滚 民谣 古典 说唱 流行 钢琴 吉他 唱歌 跳舞 舞蹈 乐器 时尚 穿搭 化妆 护肤 购物 汽车 自驾 '
+    '城市 大学 高中 校园 室友 同学 朋友 交友 树洞 倾诉 星座 塔罗 天文 宇宙 物理 数学 化学 生物 自然 环保 动物 植物 '
+    '园艺 手工 模型 桌游 剧本杀 狼人杀 密室逃脱 科幻 悬疑 推理 恐怖 喜剧 爱情 动作 武侠 仙侠 网文 耽美 番剧 '
+    '原神 王者荣耀 英雄联盟 我的世界 塞尔达 宝可梦 篮球赛 世界杯 奥运 夜跑 早起 熬夜 深夜 周末 假期 天气 '
+    '电台 播客 歌单 乐队 说唱歌手 爵士 电子乐 演出 展览 博物馆 话剧 音乐剧 散步 减肥 美妆 养猫 养狗 铲屎官'
+)
+
+# 功能词：参与词典匹配后被过滤，不作为关键词（英文功能词只用于过滤）
+FUNCTION_WORDS = (
+    '一个 没有 自己 可以 那个 什么 聊天 想找 一些 就是 都是 或者 但是 然后 因为 所以 如果 虽然 找人 聊聊 一起 '
+    '喜欢 有没有 怎么 这个 一下 大家 有人 希望 感觉 觉得 最近 现在 今天 平时 关于 还有 比如 特别 非常 真的 一点 '
+    '有点 东西 事情 话题 想要 随便 我们 你们 他们 的话 之类 各种 方面 相关 爱好 兴趣 分享 交流 讨论 聊一聊 '
+    '找个 有谁 谁能 一块 陪我 同好 小伙伴 感兴趣 的人 开始 互相 求助 求问 '
+    'and the or with for to of in on at is are my me you anyone someone about'
+)
+
+# 单字停用字：未登录片段在这些字处切开
+STOP_CHARS = frozenset(
+    '的了在是我有和就不人都一上也很到说要去你会着看好这想找聊个吗吧啊呢嘛还跟与或及等他她它们些太更最被把给让对从'
+    '向为于哦呀哈嗯喔么那哪谁啥怎能来做求刚'
+)
+
+
+def normalize_text(text: str) -> str:
+    """全角转半角（NFKC）、转小写并合并空白，作为分词和缓存的键"""
+    return ' '.join(unicodedata.normalize('NFKC', text).lower().split())
+
+
+class SimpleTokenizer:
+    """按空白和标点切分（不处理不带空格的中文）"""
+
+    _CLEAN_PATTERN = re.compile(r'[^\w\s\u4e00-\u9fff]')
+    _SPLIT_PATTERN = re.compile(r'[\s,，、.。;；:：]')
+
+    def tokenize(self, text: str) -> List[str]:
+        """
+        Args:
+            text: 规范化后的文本（见 normalize_text）
+
+        Returns:
+            按出现顺序的候选词
+        """
+        return [word for word in self._SPLIT_PATTERN.split(self._CLEAN_PATTERN.sub(' ', text)) if word]
+
+
+class CJKTokenizer:
+    """中日韩文本按词典正向最大匹配，其他文字按单词切分"""
+
+    _RUN_PATTERN = re.compile(f'([{CJK_CHARS}]+)|([^\\W_{CJK_CHARS}]+)')
+    _CJK_WORD_PATTERN = re.compile(f'[{CJK_CHARS}]{{2,}}')
+
+    def __init__(self, words: Optional[Iterable[str]] = None, max_span: int = 4):
+        """
+        Args:
+            words: 额外的词典词（与内置的话题词、功能词合并）
+            max_span: 未登录片段不超过该长度时整体作为一个词，更长时切成字符二元组
+        """
+        words = set(TOPIC_WORDS.split()) | set(FUNCTION_WORDS.split()) | set(words or ())
+        # 词典只用于切分连续的中日韩字符
+        self.dictionary = {word for word in words if self._CJK_WORD_PATTERN.fullmatch(word)}
+        self.max_word_length = max(len(word) for word in self.dictionary)
+        self.max_span = max_span
+
+    def tokenize(self, text: str) -> List[str]:
+        """
+        Args:
+            text: 规范化后的文本（见 normalize_text）
+
+        Returns:
+            按出现顺序的候选词，如 "想找人聊电影和音乐" -> ['想找', '电影', '音乐']
+        """
+        tokens = []
+        for cjk, word in self._RUN_PATTERN.findall(text):
+            if cjk:
+                self._segment(cjk, tokens)
+            else:
+                tokens.append(word)
+        return tokens
+
+    def _segment(self, run: str, tokens: List[str]):
+        """正向最大匹配一段连续的中日韩字符"""
+        dictionary = self.dictionary
+        span_start = None  # 当前未登录片段的起点
+        i = 0
+        length = len(run)
+        while i < length:
+            for size in range(min(self.max_word_length, length - i), 1, -1):
+                if run[i:i + size] in dictionary:
+                    break
+            else:
+                size = 0
+
+            if size == 0 and run[i] not in STOP_CHARS:
+                if span_start is None:
+                    span_start = i
+                i += 1
+                continue
+
+            if span_start is not None:
+                self._emit_span(run[span_start:i], tokens)
+                span_start = None
+            if size:
+                tokens.append(run[i:i + size])
+                i += size
+            else:
+                i += 1  # 停用字
+
+        if span_start is not None:
+            self._emit_span(run[span_start:], tokens)
+
+    def _emit_span(self, span: str, tokens: List[str]):
+        """未登录片段：单字丢弃，较短的整体作为新词，较长的切成字符二元组"""
+        if len(span) < 2:
+            return
+        if len(span) <= self.max_span:
+            tokens.append(span)
+        else:
+            tokens.extend(span[i:i + 2] for i in range(len(span) - 1))
+
+
+def load_words(path: str) -> List[str]:
+    """读取用户词典（每行一个词，# 开头为注释）"""
+    with open(path, encoding='utf-8') as f:
+        return [line.strip() for line in f if line.strip() and not line.startswith('#')]
+
+
+def create_tokenizer(name: str = 'cjk', dictionary_path: str = ''):
+    """
+    按名称创建分词器
+
+    Args:
+        name: 'cjk' 或 'simple'
+        dictionary_path: cjk 分词器的用户词典文件，为空时只用内置词典
+
+    Raises:
+        ValueError: 未知的分词器名称
+    """
+    if name == 'cjk':
+        return CJKTokenizer(load_words(dictionary_path) if dictionary_path else None)
+    if name == 'simple':
+        return SimpleTokenizer()
+    raise ValueError(f'未知的分词器: {name}')
@@ -0,0 +1,75 @@
+"""
+后台匹配调度器
+以固定间隔对整个等待池做批量配对，把匹配工作从请求处理路径中移出
+"""
+import logging
+from typing import Callable
+
+from structured_log import log_event
+
+
+class MatchScheduler:
+    """周期性调用 MatchingQueue.plan_matches 并交给回调创建房间的后台任务"""
+
+    def __init__(self, socketio, matching_queue, on_match: Callable[[dict], None],
+                 interval_ms: int = 200, threshold_decay: float = 0.01,
+                 threshold_floor: float = 0.0, fallback_after: float = 30.0,
+                 max_users: int = 1000):
+        """
+        Args:
+            socketio: SocketIO 实例（用于启动兼容 eventlet 的后台任务和休眠）
+            matching_queue: 全局匹配队列
+            on_match: 每个配对结果的处理回调，参数见 MatchingQueue.plan_matches
+            interval_ms: 调度间隔（毫秒）
+            threshold_decay: 每等待一秒相似度阈值降低的量
+            threshold_floor: 阈值下限
+            fallback_after: 关键词用户回退到随机配对前的最长等待秒数
+            max_users: 每轮最多为多少个关键词用户检索候选
+        """
+        self.socketio = socketio
+        self.matching_queue = matching_queue
+        self.on_match = on_match
+        self.interval = interval_ms / 1000.0
+        self.threshold_decay = threshold_decay
+        self.threshold_floor = threshold_floor
+        self.fallback_after = fallback_after
+        self.max_users = max_users
+        self._task = None
+        self._running = False
+
+    def start(self):
+        """启动后台任务（重复调用无副作用）"""
+        if self._task is not None:
+            return
+        self._running = True
+        self._task = self.socketio.start_background_task(self._run)
+
+    def stop(self):
+        """通知后台任务在下一轮结束后退出"""
+        self._running = False
+
+    def run_once(self) -> int:
+        """执行一轮批量配对，返回配对数量"""
+        matches = self.matching_queue.plan_matches(
+            threshold_decay=self.threshold_decay,
+            threshold_floor=self.threshold_floor,
+            fallback_after=self.fallback_after,
+            max_users=self.max_users
+        )
+        for match in matches:
+            try:
+                self.on_match(match)
+            except Exception as e:
+                log_event('scheduled_match', '匹配调度器处理配对失败', level=logging.ERROR,
+                          users=list(match['users']), error=str(e))
+        return len(matches)
+
+    def _run(self):
+        while self._running:
+            self.socketio.sleep(self.interval)
+            try:
+                self.run_once()
+            except Exception as e:
+                # 调度器不能因为单轮异常而退出
+                log_event('match_scheduler', '匹配调度器运行出错', level=logging.ERROR, error=str(e))
+        self._task = None
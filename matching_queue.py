@@ -1,44 +1,91 @@
-from collections import deque
+from collections import OrderedDict
+from itertools import islice
+import heapq
 import threading
-from typing import Optional, Tuple, List
+import time
+from typing import Dict, Optional, Tuple, List
 
+from keyword_matcher import KeywordMatcher, KeywordVocabulary
+from profile_lsh import ProfileLSH
 
-class MatchingQueue:
-    """匹配队列管理器，用于管理等待匹配的用户"""
 
-    def __init__(self):
-        self.queue = deque()  # 随机匹配队列
-        self.keyword_queue = {}  # 关键词队列 {keyword: [user_ids]}
+class MatchingQueue:
+    """
+    匹配队列管理器，用于管理等待匹配的用户
+
+    所有索引都基于保持插入顺序的哈希结构：
+    - 随机队列：OrderedDict，队首弹出与任意位置删除均为 O(1)
+    - 关键词倒排索引：{keyword: {user_id: None}}（有序集合，先到先匹配）
+    - 用户正排索引：{user_id: set(keywords)}
+    因此加入、匹配、取消和断开连接的开销只与该用户的关键词数量有关，与等待总人数无关。
+
+    关键词匹配使用 IDF 加权的 Jaccard 相似度：倒排列表长度即为该关键词在等待用户中的
+    文档频率，常见关键词（如“游戏”“音乐”）权重更低，不会主导匹配结果。
+    候选较多时用位集剪枝：关键词集合以位集表示（KeywordVocabulary），先由按位运算得到每个候选的
+    分数上界，再按上界从高到低逐个精确打分，上界不足时提前结束（精确打分本身仍是逐个计算）。
+    没有关键词重合时，再通过 bio + purpose 文本的 MinHash/LSH 索引寻找资料相近的用户。
+    """
+
+    # 每个关键词最多考察的候选人数（按等待先后顺序），保证匹配开销有上界
+    MAX_CANDIDATES_PER_KEYWORD = 32
+
+    # 一个倒排列表中待打分的候选人数达到该值时，先用位集上界剪枝
+    PRUNE_THRESHOLD = 16
+
+    def __init__(self, min_similarity: float = 0.0, profile_min_similarity: float = 0.3):
+        self.min_similarity = min_similarity  # 关键词匹配的最小相似度阈值
+        self.profile_min_similarity = profile_min_similarity  # 资料文本匹配的最小相似度阈值
+        self.profile_index = ProfileLSH()  # 资料文本 LSH 索引
+        self.queue = OrderedDict()  # 随机匹配队列 {user_id: None}
+        self.keyword_queue = {}  # 关键词倒排索引 {keyword: {user_id: None}}
+        self.user_keywords = {}  # 用户关键词 {user_id: set(keywords)}
+        self.user_bits = {}  # 用户关键词位集 {user_id: int}
+        self.vocabulary = KeywordVocabulary()  # 关键词 -> 位编号
+        self.max_document_frequency = 0  # 倒排列表长度的上界（只增不减，用于计算权重下界）
         self.user_profiles = {}  # 用户资料 {user_id: {keywords, bio, purpose}}
+        self.enqueued_at = {}  # 开始等待的时间 {user_id: monotonic 秒}
         self.lock = threading.Lock()
 
     def add(self, user_id):
-        """添加用户到等待队列（随机匹配）"""
+        """添加用户到等待队列（随机匹配），用户原在关键词队列时移出"""
         with self.lock:
+            if user_id in self.user_keywords:
+                self._remove_user_from_keyword_queue(user_id)
             if user_id not in self.queue:
-                self.queue.append(user_id)
+                self.queue[user_id] = None
+                self.enqueued_at.setdefault(user_id, time.monotonic())
 
     def add_with_profile(self, user_id: str, profile: dict):
         """
-        添加用户到关键词匹配队列
+        添加用户到关键词匹配队列，用户原在随机队列时移出
 
         Args:
             user_id: 用户ID
             profile: 用户资料 {'keywords': [...], 'bio': '...', 'purpose': '...'}
         """
         with self.lock:
-            keywords = profile.get('keywords', [])
+            keywords = set(profile.get('keywords', []))
+            self.queue.pop(user_id, None)
+
+            # 重复加入时先清理旧的关键词索引
+            old_keywords = self.user_keywords.get(user_id, set())
+            self._unindex_keywords(user_id, old_keywords - keywords)
 
             # 存储用户资料
             self.user_profiles[user_id] = profile
+            self.user_keywords[user_id] = keywords
+            self.enqueued_at.setdefault(user_id, time.monotonic())
 
-            # 将用户ID添加到每个关键词的队列中
-            for keyword in keywords:
-                if keyword not in self.keyword_queue:
-                    self.keyword_queue[keyword] = []
+            # 将用户ID添加到每个关键词的有序集合中
+            for keyword in keywords - old_keywords:
+                posting = self.keyword_queue.setdefault(keyword, {})
+                posting[user_id] = None
+                self.vocabulary.acquire(keyword)
+                self.max_document_frequency = max(self.max_document_frequency, len(posting))
+            self.user_bits[user_id] = self.vocabulary.encode(keywords)
 
-                if user_id not in self.keyword_queue[keyword]:
-                    self.keyword_queue[keyword].append(user_id)
+            # 更新资料文本索引
+            self.profile_index.add(user_id, self._profile_text(profile))
 
     def try_match(self, user_id):
         """
@@ -51,34 +98,36 @@ class MatchingQueue:
             str: 匹配到的用户ID，如果没有匹配则返回None
         """
         with self.lock:
-            if len(self.queue) > 0:
-                # 从队列取出第一个等待的用户
-                matched_user = self.queue.popleft()
-
-                # 确保不是自己
-                if matched_user == user_id:
-                    if len(self.queue) > 0:
-                        # 把自己放回队列，取下一个
-                        self.queue.append(matched_user)
-                        matched_user = self.queue.popleft()
-                    else:
-                        # 队列里只有自己，放回去
-                        self.queue.append(matched_user)
-                        return None
-
-                return matched_user
-            return None
-
-    def try_keyword_match(self, user_id: str, profile: dict) -> Optional[Tuple[str, float]]:
+            if not self.queue:
+                return None
+
+            # 从队列取出第一个等待的用户
+            matched_user, _ = self.queue.popitem(last=False)
+
+            # 确保不是自己
+            if matched_user == user_id:
+                if not self.queue:
+                    # 队列里只有自己，放回去
+                    self.queue[matched_user] = None
+                    return None
+
+                # 把自己放回队尾，取下一个
+                matched_user, _ = self.queue.popitem(last=False)
+                self.queue[user_id] = None
+
+            self.enqueued_at.pop(matched_user, None)
+            return matched_user
+
+    def try_keyword_match(self, user_id: str, profile: dict) -> Optional[Tuple[str, float, dict]]:
         """
-        尝试基于关键词匹配
+        尝试基于关键词匹配（IDF 加权相似度，取最佳候选）
 
         Args:
             user_id: 当前用户ID
             profile: 当前用户资料 {'keywords': [...], 'bio': '...', 'purpose': '...'}
 
         Returns:
-            (匹配用户ID, 相似度分数) 或 None
+            (匹配用户ID, 相似度分数, 匹配用户资料) 或 None
         """
         with self.lock:
             keywords = profile.get('keywords', [])
@@ -86,67 +135,290 @@ class MatchingQueue:
             if not keywords:
                 return None
 
-            # 收集所有候选用户（基于关键词重合）
-            candidate_users = {}
+            top = self._top_k_candidates(user_id, keywords, 1, self.min_similarity)
+            if top:
+                matched_user_id, similarity_score = top[0]
+            else:
+                # 没有关键词重合时，按资料文本寻找相近用户
+                result = self.profile_index.find_similar(user_id, self.profile_min_similarity)
+                if not result:
+                    return None
+                matched_user_id, similarity_score = result
 
-            for keyword in keywords:
-                if keyword in self.keyword_queue:
-                    for candidate_id in self.keyword_queue[keyword]:
-                        if candidate_id != user_id:
-                            if candidate_id not in candidate_users:
-                                candidate_users[candidate_id] = 0
-                            candidate_users[candidate_id] += 1
+            # 清理匹配队列中的这两个用户
+            self._remove_user(user_id)
+            matched_profile = self._remove_user(matched_user_id)
 
-            if not candidate_users:
-                return None
+            return (matched_user_id, similarity_score, matched_profile)
 
-            # 找到重合关键词最多的用户
-            best_match = max(candidate_users.items(), key=lambda x: x[1])
-            matched_user_id = best_match[0]
-            overlap_count = best_match[1]
+    def top_k_candidates(self, user_id: str, keywords: List[str], k: int = 5) -> List[Tuple[str, float]]:
+        """
+        获取与给定关键词最相似的 k 个等待用户（不会将其移出队列）
 
-            # 计算相似度分数
-            matched_profile = self.user_profiles.get(matched_user_id, {})
-            matched_keywords = matched_profile.get('keywords', [])
+        Args:
+            user_id: 当前用户ID（结果中排除自己）
+            keywords: 当前用户关键词
+            k: 返回的候选数量
+
+        Returns:
+            [(用户ID, 相似度分数), ...]，按分数降序
+        """
+        with self.lock:
+            return self._top_k_candidates(user_id, keywords, k, self.min_similarity)
+
+    def plan_matches(
+        self,
+        threshold_decay: float = 0.0,
+        threshold_floor: float = 0.0,
+        fallback_after: Optional[float] = None,
+        max_users: int = 1000,
+        k: int = 5,
+        now: Optional[float] = None
+    ) -> List[dict]:
+        """
+        对整个等待池做一次批量配对，并将配对成功的用户移出队列（供后台调度器周期性调用）
 
-            # 使用 Jaccard 相似系数
-            from keyword_matcher import KeywordMatcher
-            similarity_score = KeywordMatcher.calculate_similarity(keywords, matched_keywords)
+        1. 为等待最久的 max_users 个关键词用户各取 top-k 候选，得到带分数的候选边；
+           每条边的阈值随双方中等待较久者的等待时间线性放宽：
+           max(threshold_floor, min_similarity - threshold_decay * 等待秒数)
+        2. 按分数从高到低贪心配对（近似最大权匹配）
+        3. 等待超过 fallback_after 秒仍未配对的关键词用户，与随机队列中的用户一起按等待先后随机配对
 
-            # 清理匹配队列中的这两个用户
-            self._remove_user_from_keyword_queue(user_id, keywords)
-            self._remove_user_from_keyword_queue(matched_user_id, matched_keywords)
+        Args:
+            threshold_decay: 每等待一秒相似度阈值降低的量
+            threshold_floor: 阈值下限
+            fallback_after: 关键词用户转入随机配对前的最长等待秒数，None 表示不回退
+            max_users: 每次最多为多少个关键词用户检索候选，保证单次开销有上界
+            k: 每个用户检索的候选数量
+            now: 当前时间（time.monotonic()），默认取当前值
 
-            return (matched_user_id, similarity_score)
+        Returns:
+            [{'users': (user1, user2), 'match_type': 'keyword' | 'random', 'score': float,
+              'profiles': (profile1, profile2), 'wait_seconds': (wait1, wait2)}, ...]
+        """
+        with self.lock:
+            if now is None:
+                now = time.monotonic()
+
+            def waited(user_id):
+                return now - self.enqueued_at.get(user_id, now)
+
+            def threshold(user_id):
+                return max(threshold_floor, self.min_similarity - threshold_decay * waited(user_id))
+
+            # 1. 收集候选边（关键词用户按插入顺序即等待先后排列）
+            edges = []
+            for user_id in islice(self.user_keywords, max_users):
+                keywords = list(self.user_keywords[user_id])
+                candidates = self._top_k_candidates(user_id, keywords, k, threshold_floor)
+                if not candidates:
+                    similar = self.profile_index.find_similar(user_id, self.profile_min_similarity)
+                    candidates = [similar] if similar else []
+
+                for candidate_id, score in candidates:
+                    if score >= min(threshold(user_id), threshold(candidate_id)):
+                        edges.append((score, user_id, candidate_id))
+
+            # 2. 按分数贪心配对
+            edges.sort(key=lambda edge: edge[0], reverse=True)
+            pairs = []
+            paired = set()
+            for score, user_id, candidate_id in edges:
+                if user_id in paired or candidate_id in paired:
+                    continue
+                paired.update((user_id, candidate_id))
+                pairs.append(((user_id, candidate_id), 'keyword', score))
+
+            # 3. 超时的关键词用户回退到随机配对（有序集合去重，已配对的用户不再参与）
+            pool = OrderedDict((user_id, None) for user_id in self.queue if user_id not in paired)
+            if fallback_after is not None:
+                for user_id in islice(self.user_keywords, max_users):
+                    if user_id not in paired and waited(user_id) >= fallback_after:
+                        pool[user_id] = None
+            pool = sorted(pool, key=waited, reverse=True)
+            for i in range(0, len(pool) - 1, 2):
+                pairs.append(((pool[i], pool[i + 1]), 'random', 0.0))
+
+            # 将配对成功的用户移出队列
+            matches = []
+            for (user1, user2), match_type, score in pairs:
+                wait_seconds = (waited(user1), waited(user2))
+                profiles = (self._remove_user(user1), self._remove_user(user2))
+                matches.append({
+                    'users': (user1, user2),
+                    'match_type': match_type,
+                    'score': score,
+                    'profiles': profiles,
+                    'wait_seconds': wait_seconds
+                })
+            return matches
+
+    @staticmethod
+    def _profile_text(profile: dict) -> str:
+        """拼接用于资料相似度计算的文本"""
+        return f"{profile.get('bio', '')} {profile.get('purpose', '')}"
+
+    def _keyword_weight(self, keyword: str) -> float:
+        """根据当前等待用户中的文档频率计算关键词 IDF 权重"""
+        posting = self.keyword_queue.get(keyword)
+        return KeywordMatcher.idf(len(posting) if posting else 0, len(self.user_keywords))
+
+    def _weighted_similarity(self, query_weights: Dict[str, float], query_total: float,
+                             candidate_keywords: set, weight_cache: Dict[str, float]) -> float:
+        """计算查询关键词与候选关键词的加权 Jaccard 相似度"""
+        intersection = 0.0
+        candidate_only = 0.0
+        for keyword in candidate_keywords:
+            weight = query_weights.get(keyword)
+            if weight is not None:
+                intersection += weight
+                continue
+
+            weight = weight_cache.get(keyword)
+            if weight is None:
+                weight = weight_cache[keyword] = self._keyword_weight(keyword)
+            candidate_only += weight
+
+        union = query_total + candidate_only
+        return intersection / union if union > 0 else 0.0
+
+    def _top_k_candidates(self, user_id: str, keywords: List[str], k: int,
+                          min_similarity: float) -> List[Tuple[str, float]]:
+        """
+        IDF 加权的 top-k 检索（调用方需持有锁）
 
-    def _remove_user_from_keyword_queue(self, user_id: str, keywords: list):
-        """从关键词队列中移除用户"""
+        按权重从高到低（即从稀有到常见）遍历查询关键词的倒排列表。
+        只在第 i 个及之后的列表中出现的候选人，最多与当前用户共享这些关键词，
+        其相似度上界为 剩余权重和 / 查询权重和。当上界不超过当前第 k 名分数
+        （或最小相似度阈值）时，剩余的常见关键词列表无需再遍历。
+        """
+        query_weights = {keyword: self._keyword_weight(keyword) for keyword in set(keywords)}
+        if not query_weights:
+            return []
+
+        terms = sorted(query_weights, key=query_weights.get, reverse=True)
+        query_total = sum(query_weights.values())
+        remaining = query_total
+
+        top = []  # 小顶堆 [(score, -order, candidate_id)]，order 为候选在倒排列表中的先后
+        weight_cache = {}  # 本次检索中候选人独有关键词的权重缓存
+        seen = {user_id}
+        order = 0
+
+        # 查询关键词都已登记在词表中时才能使用位集剪枝
+        query_bits = self.vocabulary.encode(terms)
+        prune_enabled = query_bits.bit_count() == len(terms)
+        if prune_enabled:
+            query_bit_weights = {self.vocabulary.ids[keyword]: weight for keyword, weight in query_weights.items()}
+            # 文档频率不超过 max_document_frequency，据此得到任意关键词权重的下界
+            total_users = len(self.user_keywords)
+            min_weight = KeywordMatcher.idf(min(self.max_document_frequency, total_users), total_users)
+
+        for keyword in terms:
+            bound = remaining / query_total
+            remaining -= query_weights[keyword]
+
+            kth_score = top[0][0] if len(top) >= k else 0.0
+            if bound < min_similarity or (len(top) >= k and bound <= kth_score):
+                break
+
+            posting = self.keyword_queue.get(keyword)
+            if not posting:
+                continue
+
+            batch = []
+            for candidate_id in posting:
+                if candidate_id in seen:
+                    continue
+                seen.add(candidate_id)
+                order += 1
+                batch.append((bound, -order, candidate_id))
+                if len(batch) >= self.MAX_CANDIDATES_PER_KEYWORD:
+                    break
+
+            if prune_enabled and len(batch) >= self.PRUNE_THRESHOLD:
+                bounds = KeywordMatcher.weighted_similarity_upper_bounds(
+                    query_bits, [self.user_bits[candidate_id] for _, _, candidate_id in batch],
+                    query_bit_weights, min_weight
+                )
+                batch = sorted(
+                    ((min(bound, candidate_bound), neg_order, candidate_id)
+                     for candidate_bound, (_, neg_order, candidate_id) in zip(bounds, batch)),
+                    reverse=True
+                )
+
+            for candidate_bound, neg_order, candidate_id in batch:
+                # 剩余候选的分数不可能超过上界，已满足时提前结束
+                if candidate_bound < min_similarity or (len(top) >= k and candidate_bound <= top[0][0]):
+                    break
+
+                score = self._weighted_similarity(
+                    query_weights, query_total, self.user_keywords.get(candidate_id, ()), weight_cache
+                )
+                if score < min_similarity:
+                    continue
+
+                entry = (score, neg_order, candidate_id)
+                if len(top) < k:
+                    heapq.heappush(top, entry)
+                elif entry[:2] > top[0][:2]:
+                    heapq.heapreplace(top, entry)
+
+        # 分数相同时先等待的用户优先
+        return [(candidate_id, score) for score, _, candidate_id in sorted(top, reverse=True)]
+
+    def _unindex_keywords(self, user_id: str, keywords):
+        """从指定关键词的倒排列表中移除用户"""
         for keyword in keywords:
-            if keyword in self.keyword_queue:
-                if user_id in self.keyword_queue[keyword]:
-                    self.keyword_queue[keyword].remove(user_id)
+            posting = self.keyword_queue.get(keyword)
+            if posting is None:
+                continue
+
+            if user_id in posting:
+                del posting[user_id]
+                self.vocabulary.release(keyword)
 
-                # 如果该关键词队列为空，删除该键
-                if not self.keyword_queue[keyword]:
-                    del self.keyword_queue[keyword]
+            # 如果该关键词队列为空，删除该键
+            if not posting:
+                del self.keyword_queue[keyword]
+
+    def _remove_user(self, user_id: str) -> dict:
+        """从所有队列中移除用户（调用方需持有锁），返回其资料"""
+        self.queue.pop(user_id, None)
+        self.enqueued_at.pop(user_id, None)
+        return self._remove_user_from_keyword_queue(user_id)
+
+    def _remove_user_from_keyword_queue(self, user_id: str) -> dict:
+        """从关键词队列中移除用户，返回其资料"""
+        keywords = self.user_keywords.pop(user_id, None)
+        if keywords:
+            self._unindex_keywords(user_id, keywords)
+        self.user_bits.pop(user_id, None)
+
+        if not self.user_keywords:
+            self.max_document_frequency = 0
+
+        self.profile_index.remove(user_id)
 
         # 清理用户资料
-        if user_id in self.user_profiles:
-            del self.user_profiles[user_id]
+        return self.user_profiles.pop(user_id, None) or {}
 
     def remove(self, user_id):
         """从队列移除用户（断开连接时调用）"""
         with self.lock:
-            # 从随机队列移除
-            if user_id in self.queue:
-                self.queue.remove(user_id)
-
-            # 从关键词队列移除
-            if user_id in self.user_profiles:
-                keywords = self.user_profiles[user_id].get('keywords', [])
-                self._remove_user_from_keyword_queue(user_id, keywords)
+            self._remove_user(user_id)
 
     def get_waiting_count(self):
         """获取当前等待人数（随机队列）"""
         with self.lock:
             return len(self.queue)
+
+    def count_waiting(self, user_ids) -> int:
+        """给定用户中有多少人在随机队列中"""
+        with self.lock:
+            return sum(1 for user_id in user_ids if user_id in self.queue)
+
+    def waiting_counts(self) -> Dict[str, int]:
+        """获取随机队列和关键词队列的等待人数"""
+        with self.lock:
+            return {'random': len(self.queue), 'keyword': len(self.user_profiles)}
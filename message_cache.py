@@ -0,0 +1,191 @@
+"""
+房间最近消息缓存
+每个房间一个固定长度的环形缓冲区，保存最近发送的消息（与 serialize_messages 相同的 dict），
+发送消息时直接写入，加载历史时优先从缓冲区取，整页都在缓冲区内时不访问数据库；
+所有房间的消息按估算的内存占用共享一个上限，超出时淘汰最久未使用的房间，房间关闭时删除。
+
+只适合单进程：多个 worker 时其他进程发送的消息不会进入本进程的缓冲区
+"""
+import sys
+import threading
+from collections import OrderedDict, deque
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+
+def _entry_size(message: dict) -> int:
+    """消息 dict 的近似内存占用（字节）"""
+    return sys.getsizeof(message) + sum(sys.getsizeof(value) for value in message.values())
+
+
+# 每个房间缓冲区本身的近似内存占用（只记录了秘钥的空房间也计入上限）
+_ROOM_OVERHEAD = sys.getsizeof(deque()) + 200
+
+
+class _RoomBuffer:
+    """一个房间的最近消息"""
+    __slots__ = ('entries', 'has_older', 'room_key', 'size')
+
+    def __init__(self, has_older: Optional[bool]):
+        self.entries = deque()  # [((时间戳, ID), 消息 dict, 字节数)]，按时间正序
+        # 数据库中是否还有比缓冲区更早的消息：False 表示缓冲区包含房间的全部消息，None 表示未知
+        self.has_older = has_older
+        self.room_key = None
+        self.size = _ROOM_OVERHEAD
+
+
+class RecentMessageCache:
+    """按房间的最近消息环形缓冲区 + 跨房间的 LRU 淘汰"""
+
+    def __init__(self, per_room: int = 200, max_bytes: int = 64 * 1024 * 1024):
+        """
+        Args:
+            per_room: 每个房间保留的消息数
+            max_bytes: 所有房间缓存消息的估算内存上限
+        """
+        self.per_room = per_room
+        self.max_bytes = max_bytes
+        self._rooms = OrderedDict()  # {room_id: _RoomBuffer}，最近使用的在末尾
+        self._keys = {}  # {room_key: room_id}
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._lock = threading.Lock()
+
+    def new_room(self, room_id: int, room_key: Optional[str] = None):
+        """记录新建的空房间，之后的消息都会经过缓存，缓冲区是完整的"""
+        with self._lock:
+            self._drop(room_id)
+            buffer = self._rooms[room_id] = _RoomBuffer(has_older=False)
+            self._bytes += buffer.size
+            if room_key:
+                buffer.room_key = room_key
+                self._keys[room_key] = room_id
+            self._evict()
+
+    def append(self, message: dict):
+        """
+        写入一条刚发送的消息
+
+        Args:
+            message: 与 serialize_messages 相同字段的 dict（timestamp 为 ISO 字符串）
+        """
+        size = _entry_size(message)
+        key = (datetime.fromisoformat(message['timestamp']), message['id'])
+        with self._lock:
+            buffer = self._touch(message['room_id'])
+            if len(buffer.entries) >= self.per_room:
+                self._pop_oldest(buffer)
+            buffer.entries.append((key, message, size))
+            buffer.size += size
+            self._bytes += size
+            self._evict()
+
+    def fill(self, room_id: int, messages: List[dict], has_more: bool):
+        """
+        用从数据库读取的最新一页消息填充缓冲区（读取期间写入的更新消息会保留）
+
+        Args:
+            room_id: 房间ID
+            messages: 按时间正序的消息
+            has_more: 数据库中是否还有更早的消息
+        """
+        entries = [((datetime.fromisoformat(msg['timestamp']), msg['id']), msg, _entry_size(msg))
+                   for msg in messages[-self.per_room:]]
+        with self._lock:
+            buffer = self._touch(room_id)
+            last = entries[-1][0] if entries else None
+            newer = [entry for entry in buffer.entries if last is None or entry[0] > last]
+            merged = entries + newer
+            buffer.has_older = has_more or len(messages) > self.per_room or len(merged) > self.per_room
+            buffer.entries = deque(merged[-self.per_room:])
+            self._bytes -= buffer.size
+            buffer.size = _ROOM_OVERHEAD + sum(entry[2] for entry in buffer.entries)
+            self._bytes += buffer.size
+            self._evict()
+
+    def page(self, room_id: int, page_size: int,
+             before: Optional[Tuple[datetime, int]] = None) -> Optional[Tuple[List[dict], bool]]:
+        """
+        从缓冲区取一页比游标更早的消息
+
+        Args:
+            room_id: 房间ID
+            page_size: 每页条数
+            before: (时间戳, 消息ID) 游标，None 表示最新一页
+
+        Returns:
+            (按时间正序的消息, 是否还有更早的消息)；缓冲区不足以确定整页时返回 None
+        """
+        with self._lock:
+            buffer = self._rooms.get(room_id)
+            if buffer is not None:
+                entries = [entry for entry in buffer.entries if before is None or entry[0] < before]
+                # 缓冲区中的消息够一页，或缓冲区已包含房间的全部消息时可以直接返回
+                if len(entries) > page_size or buffer.has_older is False or (
+                        len(entries) == page_size and buffer.has_older):
+                    self._rooms.move_to_end(room_id)
+                    self._hits += 1
+                    has_more = len(entries) > page_size or bool(buffer.has_older)
+                    return [entry[1] for entry in entries[-page_size:]], has_more
+            self._misses += 1
+            return None
+
+    def remember_key(self, room_key: str, room_id: int):
+        """记录秘钥对应的房间ID（随房间一起淘汰）"""
+        with self._lock:
+            self._touch(room_id).room_key = room_key
+            self._keys[room_key] = room_id
+            self._evict()
+
+    def room_for_key(self, room_key: str) -> Optional[int]:
+        """秘钥对应的房间ID，未缓存时返回 None"""
+        with self._lock:
+            return self._keys.get(room_key)
+
+    def invalidate(self, room_id: int):
+        """房间关闭时删除其缓存"""
+        with self._lock:
+            self._drop(room_id)
+
+    def stats(self) -> Dict[str, float]:
+        """命中率和内存占用"""
+        with self._lock:
+            requests = self._hits + self._misses
+            return {
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_rate': self._hits / requests if requests else 0.0,
+                'rooms': len(self._rooms),
+                'messages': sum(len(buffer.entries) for buffer in self._rooms.values()),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes
+            }
+
+    def _touch(self, room_id: int) -> _RoomBuffer:
+        buffer = self._rooms.get(room_id)
+        if buffer is None:
+            # 不是由本进程从空房间开始记录的，缓冲区之前可能还有数据库中的消息
+            buffer = self._rooms[room_id] = _RoomBuffer(has_older=None)
+            self._bytes += buffer.size
+        else:
+            self._rooms.move_to_end(room_id)
+        return buffer
+
+    def _pop_oldest(self, buffer: _RoomBuffer):
+        _, _, size = buffer.entries.popleft()
+        buffer.size -= size
+        self._bytes -= size
+        buffer.has_older = True
+
+    def _drop(self, room_id: int):
+        buffer = self._rooms.pop(room_id, None)
+        if buffer is not None:
+            self._bytes -= buffer.size
+            if buffer.room_key is not None:
+                self._keys.pop(buffer.room_key, None)
+
+    def _evict(self):
+        # 至少保留最近使用的一个房间
+        while self._bytes > self.max_bytes and len(self._rooms) > 1:
+            self._drop(next(iter(self._rooms)))
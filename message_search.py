@@ -0,0 +1,209 @@
+"""
+消息全文检索（管理后台）
+中文没有空格分词，按字符 n-gram 建索引：每段连续的中日韩字符产出相邻两字的 bigram，再加上最后一个字，
+其他文字按单词（小写）索引。这样任意长度的中文子串都能查到：两个字以上按 bigram 短语匹配，单字按前缀匹配。
+
+索引随消息写入增量维护（消息统一通过 insert_messages 写入）：
+- SQLite：FTS5 虚拟表 messages_fts（rowid 即消息ID），删除消息时由触发器同步删除
+- PostgreSQL：messages.search_vector（tsvector）+ GIN 索引，和消息在同一条 INSERT 中写入
+"""
+import re
+from datetime import datetime
+from typing import Iterable, List, Optional, Tuple
+
+from sqlalchemy import bindparam, cast, column, insert, select, table, text, tuple_
+from sqlalchemy.dialects.postgresql import TSQUERY
+
+from keyword_tokenizer import CJK_CHARS
+from models import Message
+from serializers import MESSAGE_COLUMNS, serialize_messages
+
+_TOKEN_PATTERN = re.compile(f'([{CJK_CHARS}]+)|([^\\W_{CJK_CHARS}]+)')
+
+# SQLite 的 FTS5 表（rowid 为消息ID，tokens 为空格连接的索引词）
+messages_fts = table('messages_fts', column('rowid'), column('tokens'))
+
+
+def tokenize(content: str) -> List[str]:
+    """
+    把消息内容切分为索引词（按出现顺序，位置用于短语匹配）
+
+    Args:
+        content: 消息内容
+
+    Returns:
+        如 "想聊电影 Movie" -> ['想聊', '聊电', '电影', '影', 'movie']
+    """
+    tokens = []
+    for cjk, word in _TOKEN_PATTERN.findall(content):
+        if cjk:
+            tokens.extend(cjk[i:i + 2] for i in range(len(cjk) - 1))
+            tokens.append(cjk[-1])
+        else:
+            tokens.append(word.lower())
+    return tokens
+
+
+def query_terms(query: str) -> List[Tuple[List[str], bool]]:
+    """
+    把搜索词拆成需要同时满足的条件
+
+    Returns:
+        [(连续的索引词, 是否前缀匹配)]；多字中文为 bigram 短语，单字中文和单词为前缀匹配
+    """
+    terms = []
+    for cjk, word in _TOKEN_PATTERN.findall(query):
+        if cjk and len(cjk) > 1:
+            terms.append(([cjk[i:i + 2] for i in range(len(cjk) - 1)], False))
+        else:
+            terms.append(([cjk or word.lower()], True))
+    return terms
+
+
+def to_tsvector(tokens: Iterable[str]) -> str:
+    """索引词转为 tsvector 的文本形式（带位置），如 "'电影':1 '影':2"（索引词中没有引号和反斜杠）"""
+    positions = {}
+    for position, token in enumerate(tokens, 1):
+        # tsvector 的位置最大为 16383
+        positions.setdefault(token, []).append(str(min(position, 16383)))
+    return ' '.join(f"'{token}':{','.join(pos)}" for token, pos in positions.items())
+
+
+def to_tsquery(terms: List[Tuple[List[str], bool]]) -> str:
+    """query_terms 的结果转为 tsquery 的文本形式，如 "'电影' <-> '影音' & 'abc':*" """
+    parts = []
+    for tokens, prefix in terms:
+        if prefix:
+            parts.append(f"'{tokens[0]}':*")
+        else:
+            parts.append('(' + ' <-> '.join(f"'{token}'" for token in tokens) + ')')
+    return ' & '.join(parts)
+
+
+def to_fts5_query(terms: List[Tuple[List[str], bool]]) -> str:
+    """query_terms 的结果转为 FTS5 查询，如 '"电影 影音" AND "abc"*' """
+    parts = []
+    for tokens, prefix in terms:
+        phrase = '"' + ' '.join(tokens) + '"'
+        parts.append(phrase + '*' if prefix else phrase)
+    return ' AND '.join(parts)
+
+
+def insert_messages(session, rows: List[dict]):
+    """
+    写入消息并同时建立检索索引（在同一事务中）
+
+    Args:
+        session: 当前数据库会话
+        rows: 含 'id'、'room_id'、'sender_id'、'content'、'timestamp' 的消息 dict（不会被修改）
+    """
+    if not rows:
+        return
+    if session.get_bind().dialect.name == 'postgresql':
+        # search_vector 随消息在同一条 INSERT 中写入
+        session.execute(insert(Message), [
+            dict(row, search_vector=to_tsvector(tokenize(row['content']))) for row in rows
+        ])
+    else:
+        session.execute(insert(Message), rows)
+        _insert_fts(session, rows)
+
+
+def _insert_fts(session, rows):
+    session.execute(
+        text('INSERT INTO messages_fts (rowid, tokens) VALUES (:id, :tokens)'),
+        [{'id': row['id'], 'tokens': ' '.join(tokenize(row['content']))} for row in rows]
+    )
+
+
+def reindex(session, batch_size: int = 10000, after_id: int = 0) -> int:
+    """
+    为还没有索引的历史消息补建索引（按ID顺序分批，每批提交一次）
+
+    Args:
+        session: 数据库会话
+        batch_size: 每批消息数
+        after_id: 从该ID之后开始
+
+    Returns:
+        补建索引的消息数
+    """
+    postgres = session.get_bind().dialect.name == 'postgresql'
+    total = 0
+    while True:
+        stmt = select(Message.id, Message.content).where(Message.id > after_id)
+        if postgres:
+            stmt = stmt.where(Message.search_vector.is_(None))
+        else:
+            stmt = stmt.where(~Message.id.in_(text('SELECT rowid FROM messages_fts')))
+        rows = [{'id': id_, 'content': content}
+                for id_, content in session.execute(stmt.order_by(Message.id).limit(batch_size))]
+        if not rows:
+            return total
+
+        if postgres:
+            session.execute(
+                text('UPDATE messages SET search_vector = CAST(:vector AS tsvector) WHERE id = :id'),
+                [{'id': row['id'], 'vector': to_tsvector(tokenize(row['content']))} for row in rows]
+            )
+        else:
+            _insert_fts(session, rows)
+        session.commit()
+        total += len(rows)
+        after_id = rows[-1]['id']
+
+
+def search_messages(session, query: str, room_id: Optional[int] = None, sender_id: Optional[str] = None,
+                    start: Optional[datetime] = None, end: Optional[datetime] = None,
+                    before: Optional[Tuple[datetime, int]] = None,
+                    limit: int = 50) -> Tuple[List[dict], Optional[Tuple[datetime, int]]]:
+    """
+    按内容搜索消息，按 (timestamp, id) 倒序（从新到旧）keyset 分页
+
+    消息ID由各 worker 按批预留，不保证与发送顺序一致，因此与历史消息一样按 (timestamp, id) 排序
+
+    Args:
+        session: 数据库会话
+        query: 搜索词，空格分隔的多个词需同时出现
+        room_id: 只搜索该房间
+        sender_id: 只搜索该发送者
+        start: 发送时间下限（含）
+        end: 发送时间上限（不含）
+        before: 上一页最后一条消息的 (时间戳, ID)
+        limit: 每页条数
+
+    Returns:
+        (消息 dict 列表, 下一页的 before；没有更多时为 None)
+    """
+    terms = query_terms(query)
+    if not terms:
+        return [], None
+
+    if session.get_bind().dialect.name == 'postgresql':
+        stmt = select(*MESSAGE_COLUMNS).where(
+            Message.search_vector.op('@@')(cast(bindparam('q', to_tsquery(terms)), TSQUERY)))
+    else:
+        # 从 FTS5 表取出匹配项，再关联消息表过滤
+        stmt = (
+            select(*MESSAGE_COLUMNS)
+            .select_from(messages_fts)
+            .join(Message, Message.id == messages_fts.c.rowid)
+            .where(text('messages_fts MATCH :q').bindparams(q=to_fts5_query(terms)))
+        )
+
+    if room_id is not None:
+        stmt = stmt.where(Message.room_id == room_id)
+    if sender_id:
+        stmt = stmt.where(Message.sender_id == sender_id)
+    if start is not None:
+        stmt = stmt.where(Message.timestamp >= start)
+    if end is not None:
+        stmt = stmt.where(Message.timestamp < end)
+    if before is not None:
+        stmt = stmt.where(tuple_(Message.timestamp, Message.id) < before)
+
+    rows = session.execute(
+        stmt.order_by(Message.timestamp.desc(), Message.id.desc()).limit(limit + 1)
+    ).all()
+    next_before = (rows[limit - 1].timestamp, rows[limit - 1].id) if len(rows) > limit else None
+    return serialize_messages(rows[:limit]), next_before
@@ -0,0 +1,288 @@
+"""
+消息写后持久化（write-behind）
+消息先在内存中分配ID和时间戳并立即广播，再由后台任务批量写入 messages 表。
+
+写入失败时区分两类错误：连接断开、超时、锁等待等暂时性错误，整批放回缓冲区头部，按指数退避重试，
+每条消息最多重试 max_retries 次；约束冲突、编码错误等数据错误，逐条重写这一批，仍然失败的消息
+记录到死信日志（message_dead_letter 事件，含完整消息）后丢弃，不会卡住后面的消息
+"""
+import atexit
+import logging
+import threading
+import time
+from collections import deque
+
+from sqlalchemy import func, select, text
+from sqlalchemy.exc import DBAPIError, InterfaceError, OperationalError, TimeoutError as PoolTimeoutError
+
+import metrics
+import message_search
+import room_stats
+from structured_log import log_event
+from models import Message, get_beijing_time
+
+# 暂时性错误后的最长退避时间（秒）
+MAX_RETRY_DELAY = 30.0
+
+
+def _is_transient(error: Exception) -> bool:
+    """连接断开、连接池超时、锁等待等与数据本身无关、稍后重试可能成功的错误"""
+    if isinstance(error, (OperationalError, InterfaceError, PoolTimeoutError)):
+        return True
+    return isinstance(error, DBAPIError) and error.connection_invalidated
+
+
+class MessageWriter:
+    """消息批量写入器：有界缓冲区 + 定时/定量刷新 + 退出时刷新"""
+
+    def __init__(self, app, db, socketio, write_behind: bool = True, batch_size: int = 200,
+                 flush_interval_ms: int = 100, max_buffer: int = 10000, max_retries: int = 5):
+        """
+        Args:
+            app: Flask 应用（后台刷新时需要应用上下文）
+            db: Flask-SQLAlchemy 实例
+            socketio: SocketIO 实例（用于启动兼容 eventlet 的后台任务）
+            write_behind: False 时每条消息同步写入（与旧行为一致），写入失败时 submit 直接抛出异常，不缓冲也不重试
+            batch_size: 缓冲消息数达到该值时立即触发刷新，也是单次 INSERT 的最大行数
+            flush_interval_ms: 定时刷新间隔（毫秒）
+            max_buffer: 缓冲区上限，写满时由发送方同步刷新（背压）
+            max_retries: 每条消息遇到暂时性错误时的最大重试次数，超过后记入死信日志并丢弃
+        """
+        self.app = app
+        self.db = db
+        self.socketio = socketio
+        self.write_behind = write_behind
+        self.batch_size = batch_size
+        self.interval = flush_interval_ms / 1000.0
+        self.max_buffer = max_buffer
+        self.max_retries = max_retries
+
+        self._buffer = deque()
+        self._attempts = {}  # {消息ID: 已失败的写入次数}，只记录失败过的消息
+        self._retry_at = 0.0  # 暂时性错误后的退避截止时间（time.monotonic）
+        self._ids = deque()  # 已预留的消息ID
+        self._next_id = None  # SQLite 下的进程内ID计数器
+        self._id_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._flush_scheduled = False
+        self._task = None
+        self._running = False
+
+    def start(self):
+        """启动后台刷新任务，并注册退出时的刷新（重复调用无副作用）"""
+        if self._task is not None or not self.write_behind:
+            return
+        self._running = True
+        self._task = self.socketio.start_background_task(self._run)
+        atexit.register(self.stop)
+
+    def stop(self, timeout: float = 5.0):
+        """停止后台任务并在 timeout 秒内尽量写完缓冲区中的消息"""
+        self._running = False
+        deadline = time.monotonic() + timeout
+        while self._buffer and time.monotonic() < deadline:
+            if not self.flush(force=True):
+                break
+
+    def submit(self, room_id: int, sender_id: str, content: str) -> dict:
+        """
+        提交一条消息，返回已分配ID和时间戳的消息数据
+
+        Args:
+            room_id: 房间ID
+            sender_id: 发送者ID
+            content: 消息内容
+
+        Returns:
+            {'id', 'room_id', 'sender_id', 'content', 'timestamp'}
+
+        Raises:
+            SQLAlchemyError: 同步模式下写入失败（消息没有保存，调用方应告知发送者）
+        """
+        message = {
+            'id': self._allocate_id(),
+            'room_id': room_id,
+            'sender_id': sender_id,
+            'content': content,
+            # 与数据库读出的值保持一致（不带时区的北京时间）
+            'timestamp': get_beijing_time().replace(tzinfo=None)
+        }
+        if not self.write_behind:
+            self._write_sync(message)
+            return message
+
+        self._buffer.append(message)
+        if len(self._buffer) >= self.max_buffer:
+            # 缓冲区已满：由发送方同步写入（背压）
+            self.flush()
+        elif len(self._buffer) >= self.batch_size and not self._flush_scheduled:
+            self._flush_scheduled = True
+            self.socketio.start_background_task(self.flush)
+
+        return message
+
+    def _write_sync(self, message: dict):
+        """同步模式：先写完从写后模式切换前留下的消息，再写入这一条，失败时回滚并抛出"""
+        if self._buffer:
+            self.flush(force=True)
+        with self._flush_lock:
+            try:
+                self._write([message])
+            except Exception as e:
+                self._rollback()
+                log_event('message_flush', '消息同步写入失败', level=logging.ERROR,
+                          message_id=message['id'], error=str(e))
+                raise
+        if metrics.enabled:
+            metrics.FLUSHED_MESSAGES.inc()
+
+    def pending_count(self) -> int:
+        """尚未写入数据库的消息数"""
+        return len(self._buffer)
+
+    def flush(self, force: bool = False) -> int:
+        """
+        将缓冲区中的消息批量写入数据库
+
+        Args:
+            force: 忽略暂时性错误后的退避时间（退出时使用）；缓冲区已满时也总会尝试写入
+
+        Returns:
+            写入的消息数（暂时性错误时未写入的消息保留在缓冲区等待重试）
+        """
+        written = 0
+        with self._flush_lock:
+            self._flush_scheduled = False
+            if not force and time.monotonic() < self._retry_at and len(self._buffer) < self.max_buffer:
+                return 0
+            while self._buffer:
+                rows = []
+                while self._buffer and len(rows) < self.batch_size:
+                    rows.append(self._buffer.popleft())
+
+                start = time.perf_counter()
+                try:
+                    self._write(rows)
+                except Exception as e:
+                    self._rollback()
+                    if _is_transient(e):
+                        self._requeue(rows, e)
+                        return written
+                    # 数据错误：逐条重写，找出无法写入的消息
+                    log_event('message_flush', '消息批量写入失败，逐条重试', level=logging.WARNING,
+                              rows=len(rows), error=str(e))
+                    count, failed = self._write_each(rows)
+                    written += count
+                    if failed:
+                        return written
+                    continue
+
+                written += len(rows)
+                if metrics.enabled:
+                    metrics.FLUSH_DURATION.observe(time.perf_counter() - start)
+                    metrics.FLUSHED_MESSAGES.inc(len(rows))
+        return written
+
+    def _write(self, rows):
+        """在一个事务中写入一批消息和房间计数"""
+        with self.app.app_context():
+            message_search.insert_messages(self.db.session, rows)
+            room_stats.record_messages(self.db.session, rows)
+            self.db.session.commit()
+        if self._attempts:
+            for row in rows:
+                self._attempts.pop(row['id'], None)
+        self._retry_at = 0.0
+
+    def _rollback(self):
+        try:
+            with self.app.app_context():
+                self.db.session.rollback()
+        except Exception:
+            pass
+
+    def _write_each(self, rows):
+        """
+        逐条写入一批消息：数据错误的消息进入死信，遇到暂时性错误时剩余消息放回缓冲区
+
+        Returns:
+            (写入的消息数, 是否因暂时性错误中止)
+        """
+        written = 0
+        for i, row in enumerate(rows):
+            try:
+                self._write([row])
+            except Exception as e:
+                self._rollback()
+                if _is_transient(e):
+                    self._requeue(rows[i:], e)
+                    return written, True
+                self._dead_letter(row, e)
+                continue
+            written += 1
+            if metrics.enabled:
+                metrics.FLUSHED_MESSAGES.inc()
+        return written, False
+
+    def _requeue(self, rows, error: Exception):
+        """暂时性错误：把消息放回缓冲区头部并退避，超过重试次数的消息进入死信"""
+        retry = []
+        for row in rows:
+            attempts = self._attempts.get(row['id'], 0) + 1
+            if attempts > self.max_retries:
+                self._dead_letter(row, error)
+            else:
+                self._attempts[row['id']] = attempts
+                retry.append(row)
+        self._buffer.extendleft(reversed(retry))
+
+        attempts = max((self._attempts[row['id']] for row in retry), default=1)
+        delay = min(self.interval * 2 ** attempts, MAX_RETRY_DELAY)
+        self._retry_at = time.monotonic() + delay
+        log_event('message_flush', '消息批量写入失败，稍后重试', level=logging.ERROR,
+                  rows=len(retry), attempts=attempts, retry_in=round(delay, 3), error=str(error))
+
+    def _dead_letter(self, row: dict, error: Exception):
+        """记录无法写入的消息（完整内容写入日志，便于人工补写）并丢弃"""
+        self._attempts.pop(row['id'], None)
+        log_event('message_dead_letter', '消息无法写入数据库，已丢弃', level=logging.ERROR,
+                  message_id=row['id'], room_id=row['room_id'], sender_id=row['sender_id'],
+                  content=row['content'], timestamp=row['timestamp'].isoformat(), error=str(error))
+        if metrics.enabled:
+            metrics.DEAD_LETTER_MESSAGES.inc()
+
+    def _run(self):
+        while self._running:
+            self.socketio.sleep(self.interval)
+            if self._buffer:
+                self.flush()
+        self._task = None
+
+    def _allocate_id(self) -> int:
+        """分配消息ID（按批从数据库预留，避免每条消息一次往返）"""
+        with self._id_lock:
+            if not self._ids:
+                self._ids.extend(self._reserve_ids(self.batch_size))
+            return self._ids.popleft()
+
+    def _reserve_ids(self, count: int):
+        with self.app.app_context():
+            engine = self.db.engine
+            if engine.dialect.name == 'postgresql':
+                # 序列取值是原子的，多进程同时预留也不会冲突
+                result = self.db.session.execute(
+                    text("SELECT nextval(pg_get_serial_sequence('messages', 'id')) "
+                         "FROM generate_series(1, :count)"),
+                    {'count': count}
+                )
+                ids = [row[0] for row in result]
+                self.db.session.commit()
+                return ids
+
+            # SQLite 只支持单进程写入，首次使用时从当前最大ID开始计数
+            if self._next_id is None:
+                max_id = self.db.session.execute(select(func.max(Message.id))).scalar()
+                self._next_id = (max_id or 0) + 1
+            ids = range(self._next_id, self._next_id + count)
+            self._next_id += count
+            return ids
@@ -0,0 +1,232 @@
+"""
+运行指标
+计数器和直方图直接累加 Python 数值，不加锁（eventlet 协程不会在累加中途切换；
+线程模式下依赖 GIL，极少数并发更新可能丢失，对监控指标可以接受），
+在 /metrics 以 Prometheus 文本格式输出
+"""
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from functools import wraps
+from typing import Callable, Dict, Sequence
+
+# 是否启用埋点（关闭时装饰器直接返回原函数）
+enabled = True
+
+# 当前正在处理的 Socket.IO 事件，用于把数据库查询归到对应事件
+current_event = ContextVar('current_event', default='background')
+
+# 延迟直方图的默认分桶（秒）
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+# 等待配对时长的分桶（秒）
+WAIT_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+_registry = []
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, name: str, description: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.description = description
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        _registry.append(self)
+
+    def labels(self, *values):
+        """获取指定标签值的子指标（热路径上应缓存返回值）"""
+        child = self._children.get(values)
+        if child is None:
+            child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _samples(self):
+        raise NotImplementedError
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.description}', f'# TYPE {self.name} {self.kind}']
+        lines.extend(self._samples())
+        return lines
+
+
+class _CounterValue:
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+
+class Counter(_Metric):
+    """只增不减的计数器"""
+    kind = 'counter'
+
+    def _new_child(self):
+        return _CounterValue()
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def _samples(self):
+        for values, child in list(self._children.items()):
+            yield f'{self.name}{_format_labels(self.labelnames, values)} {child.value}'
+
+
+class _HistogramValue:
+    __slots__ = ('bounds', 'counts', 'sum')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+
+class Histogram(_Metric):
+    """固定分桶的直方图"""
+    kind = 'histogram'
+
+    def __init__(self, name: str, description: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, description, labelnames)
+        self.bounds = tuple(buckets)
+
+    def _new_child(self):
+        return _HistogramValue(self.bounds)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def _samples(self):
+        for values, child in list(self._children.items()):
+            counts = list(child.counts)
+            cumulative = 0
+            for bound, count in zip(self.bounds + (float('inf'),), counts):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float('inf') else f'le="{bound}"'
+                yield f'{self.name}_bucket{_format_labels(self.labelnames, values, le)} {cumulative}'
+            yield f'{self.name}_sum{_format_labels(self.labelnames, values)} {child.sum}'
+            yield f'{self.name}_count{_format_labels(self.labelnames, values)} {cumulative}'
+
+
+class Gauge(_Metric):
+    """在输出时调用回调取值的瞬时指标，回调返回 {标签值元组: 数值}"""
+    kind = 'gauge'
+
+    def __init__(self, name: str, description: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, description, labelnames)
+        self._callback = None
+
+    def set_function(self, callback: Callable[[], Dict[tuple, float]]):
+        self._callback = callback
+
+    def _samples(self):
+        if self._callback is None:
+            return
+        for values, value in self._callback().items():
+            yield f'{self.name}{_format_labels(self.labelnames, values)} {value}'
+
+
+# Socket.IO 事件
+EVENT_DURATION = Histogram('chat_event_duration_seconds', 'Socket.IO 事件处理耗时', ['event'])
+DB_QUERIES = Counter('chat_db_queries_total', '数据库查询次数（按触发的事件）', ['event'])
+DB_QUERY_SECONDS = Counter('chat_db_query_seconds_total', '数据库查询累计耗时（按触发的事件）', ['event'])
+
+# 匹配
+QUEUE_DEPTH = Gauge('chat_matching_queue_depth', '等待匹配的人数', ['queue'])
+TIME_TO_MATCH = Histogram('chat_time_to_match_seconds', '从入队到配对成功的等待时长', ['match_type'],
+                          buckets=WAIT_BUCKETS)
+ONLINE_USERS = Gauge('chat_online_users', '在线用户数')
+REAPED_USERS = Counter('chat_presence_reaped_total', '因心跳超时被清理的用户数')
+
+# 消息
+MESSAGES = Counter('chat_messages_total', '发送的消息数')
+FLUSH_DURATION = Histogram('chat_message_flush_duration_seconds', '一批消息写入数据库的耗时')
+FLUSHED_MESSAGES = Counter('chat_messages_flushed_total', '已写入数据库的消息数')
+DEAD_LETTER_MESSAGES = Counter('chat_messages_dead_letter_total', '无法写入数据库、记入死信日志后丢弃的消息数')
+
+# 房间最近消息缓存（回调读取缓存自身的统计）
+MESSAGE_CACHE_REQUESTS = Gauge('chat_message_cache_requests', '历史消息请求查询最近消息缓存的次数（按结果）', ['result'])
+MESSAGE_CACHE_BYTES = Gauge('chat_message_cache_bytes', '最近消息缓存估算的内存占用')
+MESSAGE_CACHE_ROOMS = Gauge('chat_message_cache_rooms', '最近消息缓存中的房间数')
+
+# 数据保留（归档后从数据库删除）
+ARCHIVED_ROOMS = Counter('chat_archived_rooms_total', '已归档并删除的聊天室数')
+ARCHIVED_MESSAGES = Counter('chat_archived_messages_total', '随聊天室归档并删除的消息数')
+
+# 限流
+RATE_LIMITED = Counter('chat_rate_limited_total', '被限流拒绝的事件数', ['event'])
+
+# 日志
+LOG_DROPPED = Counter('chat_log_dropped_total', '日志队列写满而丢弃的日志数')
+
+
+def track_event(event: str):
+    """
+    Socket.IO 事件处理函数的装饰器：记录处理耗时，并把期间的数据库查询归到该事件
+
+    Args:
+        event: 事件名
+    """
+    def decorator(handler):
+        if not enabled:
+            return handler
+
+        histogram = EVENT_DURATION.labels(event)
+
+        @wraps(handler)
+        def wrapper(*args, **kwargs):
+            token = current_event.set(event)
+            start = time.perf_counter()
+            try:
+                return handler(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - start)
+                current_event.reset(token)
+
+        return wrapper
+
+    return decorator
+
+
+def instrument_engine(engine):
+    """给 SQLAlchemy 引擎挂上查询计数和计时"""
+    if not enabled:
+        return
+
+    from sqlalchemy import event
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['query_start'].pop()
+        name = current_event.get()
+        DB_QUERIES.labels(name).inc()
+        DB_QUERY_SECONDS.labels(name).inc(elapsed)
+
+
+def render() -> str:
+    """以 Prometheus 文本格式输出全部指标"""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
@@ -1,9 +1,31 @@
 from flask_sqlalchemy import SQLAlchemy
+from contextlib import contextmanager
 from datetime import datetime, timezone, timedelta
 import json
 
+from sqlalchemy import event
+from sqlalchemy.dialects.postgresql import TSVECTOR
+
 db = SQLAlchemy()
 
+
+@contextmanager
+def session_scope():
+    """
+    一段数据库操作的会话作用域：正常结束时提交，出错时回滚，随后立即把连接归还连接池
+
+    Socket.IO 事件的应用上下文要等处理函数返回才结束，数据库操作完成后用它尽早释放连接，
+    不在发送消息、等待其他服务时占用连接。块内加载的对象在退出后会被分离，需要的值应在块内取出。
+    """
+    try:
+        yield db.session
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    finally:
+        db.session.remove()
+
 # 北京时间（UTC+8）
 def get_beijing_time():
     return datetime.now(timezone(timedelta(hours=8)))
@@ -36,10 +58,14 @@ class UserProfile(db.Model):
 class ChatRoom(db.Model):
     """聊天室模型"""
     __tablename__ = 'chat_rooms'
+    __table_args__ = (
+        # 按状态筛选并按创建时间排序的房间列表
+        db.Index('ix_chat_rooms_active_created', 'is_active', 'created_at'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
-    user1_id = db.Column(db.String(100), nullable=False)
-    user2_id = db.Column(db.String(100), nullable=True)  # 改为可空（私密房间初始状态）
+    user1_id = db.Column(db.String(100), nullable=False, index=True)
+    user2_id = db.Column(db.String(100), nullable=True, index=True)  # 改为可空（私密房间初始状态）
     created_at = db.Column(db.DateTime, default=get_beijing_time)
     is_active = db.Column(db.Boolean, default=True)
 
@@ -47,9 +73,15 @@ class ChatRoom(db.Model):
     room_key = db.Column(db.String(20), unique=True, nullable=True, index=True)  # 秘钥
     match_type = db.Column(db.String(20), default='random')  # 'random', 'keyword', 'private'
     is_private = db.Column(db.Boolean, default=False)  # 是否为私密房间
+    closed_at = db.Column(db.DateTime, nullable=True, index=True)  # 关闭时间，保留期任务按它查找归档候选
+
+    # 冗余计数，与写入消息在同一事务中更新（见 room_stats）
+    message_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    last_message_at = db.Column(db.DateTime, nullable=True)
 
     # 关联消息
-    messages = db.relationship('Message', backref='room', lazy=True, cascade='all, delete-orphan')
+    messages = db.relationship('Message', backref='room', lazy=True, cascade='all, delete-orphan',
+                               order_by='Message.id')
 
     def to_dict(self):
         return {
@@ -67,12 +99,20 @@ class ChatRoom(db.Model):
 class Message(db.Model):
     """消息模型"""
     __tablename__ = 'messages'
+    __table_args__ = (
+        # 历史消息按 (timestamp, id) 游标分页，每页是一次索引范围扫描
+        db.Index('ix_messages_room_timestamp_id', 'room_id', 'timestamp', 'id'),
+        # 全文检索（见 message_search），SQLite 改用 FTS5 虚拟表
+        db.Index('ix_messages_search_vector', 'search_vector', postgresql_using='gin').ddl_if(dialect='postgresql'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     room_id = db.Column(db.Integer, db.ForeignKey('chat_rooms.id'), nullable=False)
     sender_id = db.Column(db.String(100), nullable=False)
     content = db.Column(db.Text, nullable=False)
     timestamp = db.Column(db.DateTime, default=get_beijing_time)
+    # PostgreSQL 下的检索索引词，由 message_search 写入，普通查询不加载
+    search_vector = db.deferred(db.Column(TSVECTOR().with_variant(db.Text(), 'sqlite'), nullable=True))
 
     def to_dict(self):
         return {
@@ -82,3 +122,91 @@ class Message(db.Model):
             'content': self.content,
             'timestamp': self.timestamp.isoformat()
         }
+
+
+class ChatStat(db.Model):
+    """全局统计计数（房间数、活跃房间数、消息数），与对应的写入在同一事务中增减"""
+    __tablename__ = 'chat_stats'
+
+    name = db.Column(db.String(50), primary_key=True)
+    value = db.Column(db.BigInteger, nullable=False, default=0)
+
+
+def _sqlite_connect(dbapi_connection, connection_record):
+    # 关闭 pysqlite 自己的事务处理（它不会在 SAVEPOINT 之前发出 BEGIN）
+    dbapi_connection.isolation_level = None
+
+
+def _sqlite_begin(conn):
+    conn.exec_driver_sql('BEGIN')
+
+
+def configure_engine(engine):
+    """
+    为 SQLite 引擎启用完整的事务语义（需在创建第一个连接之前调用，重复调用无副作用）
+
+    pysqlite 默认不发出 BEGIN，最外层的 SAVEPOINT / RELEASE（begin_nested）会单独提交，
+    同一事务中之后的写入（如计数）不再与它一起回滚；按 SQLAlchemy 文档的做法由引擎自己发出 BEGIN
+    """
+    if engine.dialect.name != 'sqlite' or event.contains(engine, 'connect', _sqlite_connect):
+        return
+    event.listen(engine, 'connect', _sqlite_connect)
+    event.listen(engine, 'begin', _sqlite_begin)
+
+
+def init_db():
+    """创建数据表，并为已存在的表补建后来新增的列和索引（需在应用上下文中调用）"""
+    db.create_all()
+    added = _add_missing_columns()
+    if 'closed_at' in added.get(ChatRoom.__tablename__, ()):
+        # 新增 closed_at 之前关闭的房间没有关闭时间，用创建时间代替，使它们也能被归档
+        with db.engine.begin() as conn:
+            conn.execute(
+                db.update(ChatRoom)
+                .where(ChatRoom.is_active.is_(False), ChatRoom.closed_at.is_(None))
+                .values(closed_at=ChatRoom.created_at)
+            )
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(db.engine, checkfirst=True)
+    if db.engine.dialect.name == 'sqlite':
+        _create_sqlite_fts()
+
+    # 新增计数列或统计行时，从现有数据重新计算一次
+    import room_stats
+    missing_stats = room_stats.ensure_stats()
+    if missing_stats or {'message_count', 'last_message_at'} & set(added.get(ChatRoom.__tablename__, ())):
+        room_stats.reconcile()
+
+
+def _add_missing_columns():
+    """
+    为已存在的表补建模型中新增的列（NOT NULL 的列需要有 server_default）
+
+    Returns:
+        {表名: [新增的列名]}
+    """
+    inspector = db.inspect(db.engine)
+    preparer = db.engine.dialect.identifier_preparer
+    ddl_compiler = db.engine.dialect.ddl_compiler(db.engine.dialect, None)
+    added = {}
+    with db.engine.begin() as conn:
+        for table in db.metadata.sorted_tables:
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                spec = ddl_compiler.get_column_specification(column)
+                conn.execute(db.text(f'ALTER TABLE {preparer.quote(table.name)} ADD COLUMN {spec}'))
+                added.setdefault(table.name, []).append(column.name)
+    return added
+
+
+def _create_sqlite_fts():
+    """SQLite 的消息检索表：FTS5 虚拟表（rowid 为消息ID），删除消息时由触发器同步删除"""
+    with db.engine.begin() as conn:
+        conn.execute(db.text("CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(tokens, tokenize='unicode61')"))
+        conn.execute(db.text(
+            'CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages '
+            'BEGIN DELETE FROM messages_fts WHERE rowid = old.id; END'
+        ))
@@ -0,0 +1,177 @@
+"""
+用户资料文本的 MinHash/LSH 索引
+对 bio + purpose 的字符 shingle 计算 MinHash 签名，按分带（band）放入哈希桶，
+查询时只对落在相同桶中的候选人计算精确 Jaccard 相似度，实现亚线性的近似最相似资料检索
+"""
+import random
+import re
+import zlib
+from typing import Optional, Set, Tuple
+
+
+class ProfileLSH:
+    """基于 MinHash 签名和分带哈希桶的资料相似度索引"""
+
+    # 梅森素数，用于构造 (a * x + b) mod p 形式的哈希排列
+    _PRIME = (1 << 61) - 1
+    _MAX_HASH = (1 << 32) - 1
+
+    # 只保留中文、英文和数字，忽略空白和标点
+    _CLEAN_PATTERN = re.compile(r'[^\w\u4e00-\u9fff]+')
+
+    def __init__(self, num_perm: int = 64, bands: int = 16, shingle_size: int = 2, seed: int = 1):
+        """
+        Args:
+            num_perm: MinHash 签名长度
+            bands: 分带数量（每带 num_perm // bands 行），带越多召回越高、候选越多
+            shingle_size: 字符 shingle 长度（中文按字切分，2 即字符二元组）
+            seed: 哈希排列的随机种子，同一种子生成的签名可以互相比较
+        """
+        if num_perm % bands != 0:
+            raise ValueError('num_perm 必须能被 bands 整除')
+
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+
+        rng = random.Random(seed)
+        self._perms = [
+            (rng.randrange(1, self._PRIME), rng.randrange(0, self._PRIME))
+            for _ in range(num_perm)
+        ]
+
+        self.buckets = {}  # {(band, band_hash): {user_id: None}}
+        self.signatures = {}  # {user_id: signature}
+        self.shingle_sets = {}  # {user_id: frozenset(shingles)}，用于候选人的精确打分
+
+    def shingles(self, text: str) -> Set[str]:
+        """将文本切分为字符 shingle 集合"""
+        if not text:
+            return set()
+
+        text = self._CLEAN_PATTERN.sub('', text.lower())
+        k = self.shingle_size
+        if len(text) <= k:
+            return {text} if text else set()
+
+        return {text[i:i + k] for i in range(len(text) - k + 1)}
+
+    def signature(self, text: str) -> Optional[Tuple[int, ...]]:
+        """计算文本的 MinHash 签名，文本为空时返回 None"""
+        return self._signature(self.shingles(text))
+
+    def _signature(self, shingles: Set[str]) -> Optional[Tuple[int, ...]]:
+        if not shingles:
+            return None
+
+        hashes = [zlib.crc32(s.encode('utf-8')) for s in shingles]
+        prime = self._PRIME
+        max_hash = self._MAX_HASH
+        return tuple(
+            min((a * h + b) % prime for h in hashes) & max_hash
+            for a, b in self._perms
+        )
+
+    def _band_keys(self, signature: Tuple[int, ...]):
+        rows = self.rows
+        for band in range(self.bands):
+            yield (band, hash(signature[band * rows:(band + 1) * rows]))
+
+    def add(self, user_id: str, text: str) -> bool:
+        """
+        添加或更新用户资料
+
+        Returns:
+            是否已加入索引（文本为空时不加入）
+        """
+        self.remove(user_id)
+
+        shingles = frozenset(self.shingles(text))
+        signature = self._signature(shingles)
+        if signature is None:
+            return False
+
+        self.signatures[user_id] = signature
+        self.shingle_sets[user_id] = shingles
+        for key in self._band_keys(signature):
+            self.buckets.setdefault(key, {})[user_id] = None
+        return True
+
+    def remove(self, user_id: str):
+        """从索引中移除用户"""
+        signature = self.signatures.pop(user_id, None)
+        if signature is None:
+            return
+
+        del self.shingle_sets[user_id]
+
+        for key in self._band_keys(signature):
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                continue
+            bucket.pop(user_id, None)
+            if not bucket:
+                del self.buckets[key]
+
+    def query(
+        self,
+        text: str,
+        exclude: Optional[str] = None,
+        min_similarity: float = 0.0,
+        max_candidates: int = 256
+    ) -> Optional[Tuple[str, float]]:
+        """
+        查找与文本最相似的已索引用户
+
+        Args:
+            text: 查询文本
+            exclude: 需要排除的用户ID（通常是自己）
+            min_similarity: 最小 Jaccard 相似度
+            max_candidates: 最多比较的候选人数，保证查询开销有上界
+
+        Returns:
+            (用户ID, 相似度) 或 None
+        """
+        shingles = frozenset(self.shingles(text))
+        return self._query(shingles, self._signature(shingles), exclude, min_similarity, max_candidates)
+
+    def find_similar(self, user_id: str, min_similarity: float = 0.0) -> Optional[Tuple[str, float]]:
+        """查找与已索引用户资料最相似的其他用户"""
+        signature = self.signatures.get(user_id)
+        if signature is None:
+            return None
+        return self._query(self.shingle_sets[user_id], signature, user_id, min_similarity)
+
+    def _query(self, shingles, signature, exclude, min_similarity, max_candidates=256):
+        if signature is None:
+            return None
+
+        best_match = None
+        best_score = 0.0
+        seen = {exclude}
+
+        for key in self._band_keys(signature):
+            bucket = self.buckets.get(key)
+            if not bucket:
+                continue
+
+            for candidate_id in bucket:
+                if candidate_id in seen:
+                    continue
+                seen.add(candidate_id)
+
+                candidate = self.shingle_sets[candidate_id]
+                intersection = len(shingles & candidate)
+                score = intersection / (len(shingles) + len(candidate) - intersection)
+                if score >= min_similarity and score > best_score:
+                    best_score = score
+                    best_match = candidate_id
+
+                if len(seen) > max_candidates:
+                    return (best_match, best_score) if best_match else None
+
+        return (best_match, best_score) if best_match else None
+
+    def __len__(self):
+        return len(self.signatures)
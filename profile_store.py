@@ -0,0 +1,124 @@
+"""
+用户简介存储
+按 user_id 的 LRU 缓存记录最近写入的简介的内容哈希：内容没有变化的简介不再访问数据库，
+有变化时用 INSERT ... ON CONFLICT (user_id) DO UPDATE 写入（PostgreSQL / SQLite），
+重复加入的用户不会再触发唯一约束冲突
+"""
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from typing import Iterable, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql, sqlite
+
+from models import db, session_scope, get_beijing_time, UserProfile
+
+# 支持 ON CONFLICT 的方言
+_UPSERT_INSERTS = {'postgresql': postgresql.insert, 'sqlite': sqlite.insert}
+
+
+def profile_hash(profile: dict) -> str:
+    """简介内容（bio、purpose、keywords）的哈希"""
+    content = json.dumps([profile.get('bio', ''), profile.get('purpose', ''), list(profile.get('keywords', []))],
+                         ensure_ascii=False)
+    return hashlib.blake2b(content.encode(), digest_size=16).hexdigest()
+
+
+class ProfileStore:
+    """带 LRU 缓存（内容哈希）的用户简介写入"""
+
+    def __init__(self, max_entries: int = 10000):
+        """
+        Args:
+            max_entries: 缓存的用户数上限
+        """
+        self.max_entries = max_entries
+        self._cache = OrderedDict()  # {user_id: 内容哈希}
+        self._lock = threading.Lock()
+
+    def save(self, user_id: str, profile: dict) -> bool:
+        """保存一位用户的简介，返回是否写入了数据库"""
+        return self.save_many([(user_id, profile)]) > 0
+
+    def save_many(self, profiles: Iterable[Tuple[str, dict]]) -> int:
+        """
+        保存多位用户的简介，内容与缓存一致的跳过，其余用一条 upsert 写入
+
+        需要在应用上下文中、且不在其他 session_scope 内调用（写入使用独立的事务）
+
+        Args:
+            profiles: [(user_id, {'bio', 'purpose', 'keywords'})]
+
+        Returns:
+            写入数据库的简介数
+        """
+        changed = {}
+        with self._lock:
+            for user_id, profile in profiles:
+                digest = profile_hash(profile)
+                if self._cache.get(user_id) == digest:
+                    self._cache.move_to_end(user_id)
+                    continue
+                changed[user_id] = (digest, profile)
+
+        if not changed:
+            return 0
+
+        now = get_beijing_time()
+        rows = [{
+            'user_id': user_id,
+            'bio': profile.get('bio', ''),
+            'purpose': profile.get('purpose', ''),
+            'keywords': json.dumps(list(profile.get('keywords', [])), ensure_ascii=False),
+            'created_at': now,
+            'updated_at': now
+        } for user_id, (_, profile) in changed.items()]
+        with session_scope():
+            self._upsert(rows)
+
+        # 写入成功后才缓存，失败时下次仍会重试
+        with self._lock:
+            for user_id, (digest, _) in changed.items():
+                self._put(user_id, digest)
+        return len(rows)
+
+    def __len__(self):
+        return len(self._cache)
+
+    def _put(self, user_id: str, digest: str):
+        self._cache[user_id] = digest
+        self._cache.move_to_end(user_id)
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+
+    @staticmethod
+    def _upsert(rows):
+        make_insert = _UPSERT_INSERTS.get(db.engine.dialect.name)
+        if make_insert is not None:
+            stmt = make_insert(UserProfile).values(rows)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[UserProfile.user_id],
+                set_={
+                    'bio': stmt.excluded.bio,
+                    'purpose': stmt.excluded.purpose,
+                    'keywords': stmt.excluded.keywords,
+                    'updated_at': stmt.excluded.updated_at
+                }
+            )
+            db.session.execute(stmt)
+            return
+
+        # 其他数据库：先更新已有的行，再插入新行
+        existing = {
+            profile.user_id: profile for profile in
+            db.session.scalars(select(UserProfile).where(UserProfile.user_id.in_([r['user_id'] for r in rows])))
+        }
+        for row in rows:
+            profile = existing.get(row['user_id'])
+            if profile is None:
+                db.session.add(UserProfile(**row))
+            else:
+                profile.bio, profile.purpose, profile.keywords = row['bio'], row['purpose'], row['keywords']
+                profile.updated_at = row['updated_at']
@@ -0,0 +1,137 @@
+"""
+事件限流
+每个（事件, 维度, 键）一个令牌桶，维度为 user（用户ID）、sid（Socket.IO 连接）或 room（房间ID）。
+桶只保存 (令牌数, 上次更新时间) 两个数，按最近使用排序，空闲到令牌已经回满的桶
+与新桶等价，在之后的调用中顺带从头部清理，不需要后台任务
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+SCOPES = ('user', 'sid', 'room')
+
+
+def parse_limits(spec: str) -> Dict[str, Dict[str, Tuple[float, float]]]:
+    """
+    解析限额配置
+
+    Args:
+        spec: 形如 "send_message:user=5/10,room=20/40;join_queue:user=0.5/5" 的字符串，
+              rate/burst 表示每秒补充 rate 个令牌、最多积攒 burst 个
+
+    Returns:
+        {事件: {维度: (rate, burst)}}
+    """
+    limits = {}
+    for rule in spec.split(';'):
+        if not rule.strip():
+            continue
+        event, _, scopes = rule.partition(':')
+        limits[event.strip()] = {}
+        for item in scopes.split(','):
+            scope, _, value = item.partition('=')
+            scope = scope.strip()
+            if scope not in SCOPES:
+                raise ValueError(f'未知的限流维度: {scope}')
+            rate, _, burst = value.partition('/')
+            rate, burst = float(rate), float(burst or rate)
+            if rate <= 0 or burst < 1:
+                raise ValueError(f'无效的限额: {rule}')
+            limits[event.strip()][scope] = (rate, burst)
+    return limits
+
+
+class TokenBucketLimiter:
+    """同一组限额（rate, burst）下按键区分的令牌桶"""
+
+    def __init__(self, rate: float, burst: float):
+        """
+        Args:
+            rate: 每秒补充的令牌数
+            burst: 桶容量（允许的突发次数）
+        """
+        self.rate = rate
+        self.burst = burst
+        # 空闲超过该时长的桶已经回满，可以删除
+        self.idle_ttl = burst / rate
+        self._buckets = OrderedDict()  # {键: (令牌数, 上次更新时间)}
+
+    def peek(self, key, now: float) -> float:
+        """返回键当前的令牌数（不修改）"""
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            return self.burst
+        tokens, last = bucket
+        return min(self.burst, tokens + (now - last) * self.rate)
+
+    def consume(self, key, tokens: float, now: float):
+        """把键的令牌数更新为 tokens - 1，并清理头部空闲的桶"""
+        buckets = self._buckets
+        buckets[key] = (tokens - 1, now)
+        buckets.move_to_end(key)
+        # 每次最多清理两个，摊销 O(1)
+        for _ in range(2):
+            oldest = next(iter(buckets))
+            if now - buckets[oldest][1] < self.idle_ttl:
+                break
+            del buckets[oldest]
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class RateLimiter:
+    """按事件配置的多维度限流：一次请求需要所有维度的桶都有令牌"""
+
+    def __init__(self, limits: Dict[str, Dict[str, Tuple[float, float]]]):
+        """
+        Args:
+            limits: {事件: {维度: (rate, burst)}}，见 parse_limits
+        """
+        self._rules: Dict[str, List[Tuple[str, TokenBucketLimiter]]] = {
+            event: [(scope, TokenBucketLimiter(rate, burst)) for scope, (rate, burst) in scopes.items()]
+            for event, scopes in limits.items()
+        }
+        self._lock = threading.Lock()
+
+    def acquire(self, event: str, user: Optional[str] = None, sid: Optional[str] = None,
+                room: Optional[str] = None) -> float:
+        """
+        尝试为一次事件取令牌
+
+        Args:
+            event: 事件名（未配置限额的事件总是放行）
+            user / sid / room: 各维度的键，为 None 的维度不限流
+
+        Returns:
+            0 表示放行；被限流时返回建议的重试等待秒数
+        """
+        rules = self._rules.get(event)
+        if not rules:
+            return 0.0
+
+        keys = {'user': user, 'sid': sid, 'room': room}
+        now = time.monotonic()
+        with self._lock:
+            buckets = []
+            retry_after = 0.0
+            for scope, limiter in rules:
+                key = keys[scope]
+                if key is None:
+                    continue
+                tokens = limiter.peek(key, now)
+                if tokens < 1:
+                    retry_after = max(retry_after, (1 - tokens) / limiter.rate)
+                buckets.append((limiter, key, tokens))
+
+            # 有任一维度不足时不扣减任何桶
+            if retry_after > 0:
+                return retry_after
+            for limiter, key, tokens in buckets:
+                limiter.consume(key, tokens, now)
+        return 0.0
+
+    def bucket_count(self) -> int:
+        """当前保存的桶数"""
+        return sum(len(limiter) for rules in self._rules.values() for _, limiter in rules)
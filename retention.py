@@ -0,0 +1,177 @@
+"""
+聊天室数据保留：归档与恢复
+关闭超过保留期的非私密房间连同消息写入本地磁盘上 gzip 压缩、只追加的 NDJSON 分段文件（每行一个房间），
+落盘（fsync）后再从数据库删除；每批只处理有限个房间，事务很短，不会长时间锁表。
+归档文件可以用 restore 把单个房间写回数据库
+"""
+import gzip
+import json
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Iterator, Optional, Tuple
+
+from sqlalchemy import delete, insert, select
+
+import message_search
+import metrics
+import room_stats
+from models import db, session_scope, get_beijing_time, ChatRoom, Message
+from serializers import MESSAGE_COLUMNS, ROOM_COLUMNS, serialize_messages, serialize_room
+
+SEGMENT_SUFFIX = '.ndjson.gz'
+
+
+class RoomArchiver:
+    """把关闭的聊天室归档到分段文件并从数据库删除，或从归档恢复"""
+
+    def __init__(self, archive_dir: str, batch_size: int = 100, segment_max_bytes: int = 64 * 1024 * 1024):
+        """
+        Args:
+            archive_dir: 归档文件目录
+            batch_size: 每批（一个事务）归档的房间数
+            segment_max_bytes: 分段文件超过该大小后写入新的分段
+        """
+        self.archive_dir = archive_dir
+        self.batch_size = batch_size
+        self.segment_max_bytes = segment_max_bytes
+        self._segment = None
+        self._segment_seq = 0
+
+    def archive(self, older_than: timedelta, max_batches: Optional[int] = None) -> Tuple[int, int]:
+        """
+        归档关闭时间早于 now - older_than 的非私密房间（需要在应用上下文中调用）
+
+        Args:
+            older_than: 保留期
+            max_batches: 本次最多处理的批数，None 表示处理完所有候选
+
+        Returns:
+            (归档的房间数, 归档的消息数)
+        """
+        cutoff = get_beijing_time() - older_than
+        total_rooms = total_messages = batches = 0
+        while max_batches is None or batches < max_batches:
+            rooms, messages = self._archive_batch(cutoff)
+            if not rooms:
+                break
+            total_rooms += rooms
+            total_messages += messages
+            batches += 1
+        return total_rooms, total_messages
+
+    def _archive_batch(self, cutoff: datetime) -> Tuple[int, int]:
+        """归档一批房间：写入并落盘后在同一个事务中删除，返回 (房间数, 消息数)"""
+        with session_scope():
+            # closed_at 上有索引，候选按关闭时间顺序取出；多个 worker 同时运行时跳过已被锁定的行
+            room_ids = db.session.scalars(
+                select(ChatRoom.id)
+                .where(ChatRoom.closed_at < cutoff, ChatRoom.is_active.is_(False), ChatRoom.is_private.is_(False))
+                .order_by(ChatRoom.closed_at)
+                .limit(self.batch_size)
+                .with_for_update(skip_locked=True)
+            ).all()
+            if not room_ids:
+                return 0, 0
+
+            messages = {room_id: [] for room_id in room_ids}
+            for message in serialize_messages(db.session.execute(
+                    select(*MESSAGE_COLUMNS).where(Message.room_id.in_(room_ids)).order_by(Message.id))):
+                messages[message['room_id']].append(message)
+
+            records = []
+            for row in db.session.execute(select(*ROOM_COLUMNS, ChatRoom.closed_at).where(ChatRoom.id.in_(room_ids))):
+                room = serialize_room(row[:-1])
+                room['closed_at'] = row[-1].isoformat()
+                records.append({'room': room, 'messages': messages[room['id']]})
+
+            # 先落盘再删除：删除失败时下次会重新归档，恢复时取最后写入的一份
+            self._write(records)
+            message_count = db.session.execute(delete(Message).where(Message.room_id.in_(room_ids))).rowcount
+            db.session.execute(delete(ChatRoom).where(ChatRoom.id.in_(room_ids)))
+            room_stats.increment(db.session, total_rooms=-len(records), total_messages=-message_count)
+
+        metrics.ARCHIVED_ROOMS.inc(len(records))
+        metrics.ARCHIVED_MESSAGES.inc(message_count)
+        return len(records), message_count
+
+    def _write(self, records):
+        """把一批记录作为一个 gzip member 追加到当前分段并 fsync"""
+        data = ''.join(json.dumps(record, ensure_ascii=False) + '\n' for record in records).encode()
+        with open(self._segment_path(), 'ab') as f:
+            f.write(gzip.compress(data))
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _segment_path(self) -> str:
+        """当前分段文件；超过大小上限时换新的分段（文件名带进程号，多个 worker 不会写同一个文件）"""
+        if self._segment is None or os.path.getsize(self._segment) >= self.segment_max_bytes:
+            os.makedirs(self.archive_dir, exist_ok=True)
+            self._segment_seq += 1
+            name = f"rooms-{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}-{self._segment_seq:04d}{SEGMENT_SUFFIX}"
+            self._segment = os.path.join(self.archive_dir, name)
+        return self._segment
+
+    def iter_records(self) -> Iterator[dict]:
+        """按写入顺序遍历所有分段中的归档记录"""
+        if not os.path.isdir(self.archive_dir):
+            return
+        for name in sorted(os.listdir(self.archive_dir)):
+            if not name.endswith(SEGMENT_SUFFIX):
+                continue
+            with gzip.open(os.path.join(self.archive_dir, name), 'rt', encoding='utf-8') as f:
+                for line in f:
+                    yield json.loads(line)
+
+    def find(self, room_id: int) -> Optional[dict]:
+        """查找房间最后一次归档的记录，不存在时返回 None"""
+        found = None
+        for record in self.iter_records():
+            if record['room']['id'] == room_id:
+                found = record
+        return found
+
+    def restore(self, room_id: int) -> int:
+        """
+        从归档恢复一个房间及其消息（需要在应用上下文中调用）
+
+        恢复的房间保持关闭状态，closed_at 记为恢复时间，再经过一个保留期才会被重新归档
+
+        Args:
+            room_id: 房间 ID
+
+        Returns:
+            恢复的消息数
+
+        Raises:
+            LookupError: 归档中没有该房间
+            ValueError: 数据库中已存在该房间
+        """
+        record = self.find(room_id)
+        if record is None:
+            raise LookupError(f'归档中没有房间 {room_id}')
+
+        room = record['room']
+        with session_scope():
+            if db.session.get(ChatRoom, room_id) is not None:
+                raise ValueError(f'房间 {room_id} 已存在')
+            db.session.execute(insert(ChatRoom).values(
+                id=room['id'],
+                user1_id=room['user1_id'],
+                user2_id=room['user2_id'],
+                created_at=datetime.fromisoformat(room['created_at']),
+                is_active=False,
+                room_key=room['room_key'],
+                match_type=room['match_type'],
+                is_private=room['is_private'],
+                closed_at=get_beijing_time()
+            ))
+            rows = [
+                {'id': msg['id'], 'room_id': room_id, 'sender_id': msg['sender_id'], 'content': msg['content'],
+                 'timestamp': datetime.fromisoformat(msg['timestamp'])}
+                for msg in record['messages']
+            ]
+            message_search.insert_messages(db.session, rows)
+            room_stats.record_messages(db.session, rows)
+            room_stats.increment(db.session, total_rooms=1)
+        return len(record['messages'])
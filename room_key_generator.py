@@ -2,9 +2,11 @@
 房间秘钥生成和管理器
 生成唯一的房间秘钥，支持秘钥验证
 """
-import random
-import string
+import secrets
 import re
+import threading
+from collections import deque
+from typing import Callable, Iterable, Set
 
 
 class RoomKeyGenerator:
@@ -24,7 +26,8 @@ class RoomKeyGenerator:
         Returns:
             随机秘钥字符串
         """
-        return ''.join(random.choice(RoomKeyGenerator.KEY_CHARS) for _ in range(length))
+        # 使用 secrets 生成不可预测的秘钥
+        return ''.join(secrets.choice(RoomKeyGenerator.KEY_CHARS) for _ in range(length))
 
     @staticmethod
     def generate_unique_key(existing_keys: set = None, max_attempts: int = 10) -> str:
@@ -83,3 +86,64 @@ class RoomKeyGenerator:
 
         # 移除所有非字母数字字符，转大写
         return re.sub(r'[^A-Za-z0-9]', '', key).upper()
+
+
+class RoomKeyPool:
+    """
+    预生成的房间秘钥池
+
+    后台按批生成秘钥，并用一次 IN 查询剔除已被占用的秘钥，创建房间时直接取用，
+    无需读取全部已有秘钥。取出的秘钥仍可能在插入前被并发占用，调用方应依赖
+    room_key 唯一索引做乐观插入，冲突时换一个秘钥重试。
+    """
+
+    def __init__(self, find_existing: Callable[[Iterable[str]], Set[str]], size: int = 200,
+                 refill_below: int = 50):
+        """
+        Args:
+            find_existing: 查询给定秘钥中已被占用的部分，返回已占用秘钥集合
+            size: 每次补充后池中的秘钥数量
+            refill_below: 池中秘钥少于该数量时需要补充
+        """
+        self.find_existing = find_existing
+        self.size = size
+        self.refill_below = refill_below
+        self._keys = deque()
+        self._lock = threading.Lock()
+        self._refilling = False
+
+    def take(self) -> str:
+        """取出一个秘钥；池为空时直接生成（未预先校验，由唯一索引兜底）"""
+        try:
+            return self._keys.popleft()
+        except IndexError:
+            return RoomKeyGenerator.generate_key()
+
+    def needs_refill(self) -> bool:
+        """池中秘钥是否不足（正在补充时返回 False）"""
+        return len(self._keys) < self.refill_below and not self._refilling
+
+    def refill(self) -> int:
+        """
+        补充秘钥池
+
+        Returns:
+            新加入池中的秘钥数量
+        """
+        with self._lock:
+            self._refilling = True
+            try:
+                missing = self.size - len(self._keys)
+                if missing <= 0:
+                    return 0
+
+                candidates = {RoomKeyGenerator.generate_key() for _ in range(missing)}
+                candidates -= set(self._keys)
+                candidates -= self.find_existing(candidates)
+                self._keys.extend(candidates)
+                return len(candidates)
+            finally:
+                self._refilling = False
+
+    def __len__(self):
+        return len(self._keys)
@@ -0,0 +1,152 @@
+"""
+房间与全局统计的冗余计数
+chat_rooms.message_count / last_message_at 和 chat_stats 表中的全局计数，在写入消息、创建 / 关闭 / 删除房间的
+同一事务中增减，管理后台读取统计只需一次主键查询，与表的大小无关；计数出现偏差时用 reconcile 从头重新计算。
+
+加锁顺序：同一事务中先更新 chat_rooms，再更新 chat_stats（按名称排序），避免相互等待
+"""
+from collections import defaultdict
+from typing import Dict, List
+
+from sqlalchemy import bindparam, case, func, insert, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+from models import db, session_scope, get_beijing_time, ChatRoom, ChatStat, Message
+
+TOTAL_ROOMS = 'total_rooms'
+ACTIVE_ROOMS = 'active_rooms'
+TOTAL_MESSAGES = 'total_messages'
+STAT_NAMES = (TOTAL_ROOMS, ACTIVE_ROOMS, TOTAL_MESSAGES)
+
+_rooms = ChatRoom.__table__
+# 支持 ON CONFLICT 的方言（多个 worker 同时初始化时忽略已存在的计数行）
+_UPSERT_INSERTS = {'postgresql': postgresql.insert, 'sqlite': sqlite.insert}
+
+
+def increment(session, **deltas: int):
+    """
+    在当前事务中增减全局计数
+
+    Args:
+        session: 当前数据库会话
+        deltas: {计数名: 增量}，如 total_rooms=1, active_rooms=1
+    """
+    for name in sorted(deltas):
+        if deltas[name]:
+            session.execute(update(ChatStat).where(ChatStat.name == name).values(value=ChatStat.value + deltas[name]))
+
+
+def record_messages(session, rows: List[dict]):
+    """
+    在写入消息的事务中更新房间的消息数、最后消息时间和全局消息数
+
+    Args:
+        session: 当前数据库会话
+        rows: 含 'room_id' 和 'timestamp' 的消息 dict
+    """
+    if not rows:
+        return
+    counts = defaultdict(int)
+    latest = {}
+    for row in rows:
+        room_id = row['room_id']
+        counts[room_id] += 1
+        if room_id not in latest or row['timestamp'] > latest[room_id]:
+            latest[room_id] = row['timestamp']
+
+    # 按房间ID顺序更新，并发写入时加锁顺序一致
+    session.execute(
+        update(_rooms)
+        .where(_rooms.c.id == bindparam('room'))
+        .values(
+            message_count=_rooms.c.message_count + bindparam('count'),
+            last_message_at=case(
+                (_rooms.c.last_message_at > bindparam('latest'), _rooms.c.last_message_at),
+                else_=bindparam('latest')
+            )
+        ),
+        [{'room': room_id, 'count': counts[room_id], 'latest': latest[room_id]} for room_id in sorted(counts)]
+    )
+    increment(session, **{TOTAL_MESSAGES: len(rows)})
+
+
+def close_rooms(session, room_ids: List[int]) -> int:
+    """
+    在当前事务中把房间标记为不活跃并记录关闭时间，已关闭的房间不重复计数
+
+    Returns:
+        本次关闭的房间数
+    """
+    closed = session.execute(
+        update(ChatRoom)
+        .where(ChatRoom.id.in_(sorted(room_ids)), ChatRoom.is_active.is_(True))
+        .values(is_active=False, closed_at=get_beijing_time())
+    ).rowcount
+    increment(session, **{ACTIVE_ROOMS: -closed})
+    return closed
+
+
+def get_stats(session) -> Dict[str, int]:
+    """读取全局计数，{计数名: 值}"""
+    values = dict(session.execute(select(ChatStat.name, ChatStat.value).where(ChatStat.name.in_(STAT_NAMES))).all())
+    return {name: int(values.get(name, 0)) for name in STAT_NAMES}
+
+
+def ensure_stats() -> List[str]:
+    """
+    补建缺少的计数行（值为 0，需要在应用上下文中调用）
+
+    Returns:
+        新建的计数名
+    """
+    with session_scope():
+        existing = set(db.session.scalars(select(ChatStat.name)))
+        missing = [name for name in STAT_NAMES if name not in existing]
+        if missing:
+            make_insert = _UPSERT_INSERTS.get(db.engine.dialect.name)
+            stmt = make_insert(ChatStat).on_conflict_do_nothing() if make_insert else insert(ChatStat)
+            db.session.execute(stmt, [{'name': name, 'value': 0} for name in missing])
+    return missing
+
+
+def reconcile(batch_size: int = 1000) -> Dict[str, int]:
+    """
+    从头重新计算所有计数（需要在应用上下文中调用）
+
+    房间计数按ID范围分批更新，每批一个短事务；全局计数在锁住 chat_stats 后统计，
+    其他事务在此期间提交的增量会在解锁后叠加上去，不会丢失。重新计算期间仍在写入的房间可能有少量偏差，
+    宜在低峰时运行
+
+    Args:
+        batch_size: 每批更新的房间数
+
+    Returns:
+        重新计算后的全局计数
+    """
+    ensure_stats()
+    with session_scope():
+        max_id = db.session.scalar(select(func.max(ChatRoom.id))) or 0
+
+    for low in range(0, max_id, batch_size):
+        with session_scope():
+            db.session.execute(
+                update(_rooms)
+                .where(_rooms.c.id > low, _rooms.c.id <= low + batch_size)
+                .values(
+                    message_count=select(func.count(Message.id))
+                    .where(Message.room_id == _rooms.c.id).scalar_subquery(),
+                    last_message_at=select(func.max(Message.timestamp))
+                    .where(Message.room_id == _rooms.c.id).scalar_subquery()
+                )
+            )
+
+    with session_scope():
+        db.session.execute(select(ChatStat.name).where(ChatStat.name.in_(STAT_NAMES)).with_for_update())
+        stats = {
+            TOTAL_ROOMS: db.session.scalar(select(func.count(ChatRoom.id))),
+            ACTIVE_ROOMS: db.session.scalar(select(func.count(ChatRoom.id)).where(ChatRoom.is_active.is_(True))),
+            TOTAL_MESSAGES: db.session.scalar(select(func.count(Message.id)))
+        }
+        for name, value in stats.items():
+            db.session.execute(update(ChatStat).where(ChatStat.name == name).values(value=value))
+    return stats
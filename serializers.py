@@ -0,0 +1,53 @@
+"""
+消息和房间的批量序列化
+只用 Core select 取需要的列（返回元组，不构造 ORM 实例），再一次遍历转换为 dict，
+与 Message.to_dict() / ChatRoom.to_dict() 输出相同的字段
+"""
+from datetime import datetime
+from typing import Iterable, List
+
+from models import ChatRoom, Message
+
+# 历史消息和导出使用的列，顺序与 serialize_messages 的解包一致
+MESSAGE_COLUMNS = (Message.id, Message.room_id, Message.sender_id, Message.content, Message.timestamp)
+ROOM_COLUMNS = (ChatRoom.id, ChatRoom.user1_id, ChatRoom.user2_id, ChatRoom.created_at,
+                ChatRoom.is_active, ChatRoom.room_key, ChatRoom.match_type, ChatRoom.is_private)
+
+_isoformat = datetime.isoformat
+
+
+def serialize_messages(rows: Iterable[tuple]) -> List[dict]:
+    """
+    把 MESSAGE_COLUMNS 的查询结果转换为消息 dict 列表
+
+    Args:
+        rows: (id, room_id, sender_id, content, timestamp) 元组
+
+    Returns:
+        与 Message.to_dict() 字段相同的 dict 列表
+    """
+    return [
+        {'id': id_, 'room_id': room_id, 'sender_id': sender_id, 'content': content,
+         'timestamp': _isoformat(timestamp)}
+        for id_, room_id, sender_id, content, timestamp in rows
+    ]
+
+
+def serialize_room(row: tuple) -> dict:
+    """
+    把 ROOM_COLUMNS 的一行转换为房间 dict
+
+    Returns:
+        与 ChatRoom.to_dict() 字段相同的 dict
+    """
+    id_, user1_id, user2_id, created_at, is_active, room_key, match_type, is_private = row
+    return {
+        'id': id_,
+        'user1_id': user1_id,
+        'user2_id': user2_id,
+        'created_at': _isoformat(created_at),
+        'is_active': is_active,
+        'room_key': room_key,
+        'match_type': match_type,
+        'is_private': is_private
+    }
@@ -0,0 +1,207 @@
+"""
+Session 存储后端
+memory：进程内 LRU + TTL 存储，cookie 中只保存签名的 session ID（默认，仅适合单 worker）
+cookie：Flask 默认的签名 cookie，服务端不保存任何状态（STATE_BACKEND=redis 时的默认，多 worker 天然共享）
+redis / filesystem：交给 Flask-Session 处理
+"""
+import hashlib
+import hmac
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Optional
+
+from flask.sessions import SessionInterface, SessionMixin
+from flask_session import Session
+from werkzeug.datastructures import CallbackDict
+
+
+class MemorySession(CallbackDict, SessionMixin):
+    """保存在内存存储中的 session"""
+
+    def __init__(self, initial=None, sid: str = None, new: bool = False):
+        def on_update(self):
+            self.modified = True
+
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.modified = False
+
+
+class MemorySessionStore:
+    """
+    按最近访问排序的 session 存储
+
+    每次读写都会把过期时间顺延 ttl 秒并移到末尾，因此顺序同时也是过期顺序：
+    超出容量时淘汰最久未访问的 session，清理过期 session 时只需从头部开始检查
+    """
+
+    def __init__(self, ttl: float = 86400, max_entries: int = 100000):
+        """
+        Args:
+            ttl: 未访问多少秒后过期
+            max_entries: 最多保存的 session 数
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._data = OrderedDict()  # {sid: (过期时间, 数据)}
+        self._lock = threading.Lock()
+        self._task = None
+
+    def get(self, sid: str) -> Optional[dict]:
+        """读取 session 数据，不存在或已过期时返回 None"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(sid)
+            if entry is None:
+                return None
+            if entry[0] <= now:
+                del self._data[sid]
+                return None
+            self._data[sid] = (now + self.ttl, entry[1])
+            self._data.move_to_end(sid)
+            return entry[1]
+
+    def set(self, sid: str, data: dict):
+        """保存 session 数据，超出容量时淘汰最久未访问的 session"""
+        with self._lock:
+            self._data[sid] = (time.monotonic() + self.ttl, data)
+            self._data.move_to_end(sid)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, sid: str):
+        with self._lock:
+            self._data.pop(sid, None)
+
+    def sweep(self) -> int:
+        """
+        清理已过期的 session
+
+        Returns:
+            清理的数量
+        """
+        now = time.monotonic()
+        removed = 0
+        with self._lock:
+            while self._data:
+                sid, (expires_at, _) = next(iter(self._data.items()))
+                if expires_at > now:
+                    break
+                del self._data[sid]
+                removed += 1
+        return removed
+
+    def start_sweeper(self, socketio, interval: float = 60.0):
+        """启动定期清理过期 session 的后台任务（重复调用无副作用）"""
+        if self._task is not None:
+            return
+
+        def run():
+            while True:
+                socketio.sleep(interval)
+                self.sweep()
+
+        self._task = socketio.start_background_task(run)
+
+    def __len__(self):
+        return len(self._data)
+
+
+class MemorySessionInterface(SessionInterface):
+    """
+    把 session 数据保存在 MemorySessionStore 中，cookie 里只有签名后的 session ID（sid.HMAC）
+
+    签名密钥只在 SECRET_KEY 变化时派生一次，每次读取只做一次 HMAC 校验
+    """
+
+    def __init__(self, store: MemorySessionStore):
+        self.store = store
+        self._secret = None
+        self._key = None
+
+    def _sign(self, app, sid: str) -> str:
+        if app.secret_key != self._secret:
+            self._key = hmac.new(app.secret_key.encode(), b'memory-session', hashlib.sha256).digest()
+            self._secret = app.secret_key
+        return hmac.new(self._key, sid.encode(), hashlib.sha256).hexdigest()
+
+    def open_session(self, app, request):
+        cookie = request.cookies.get(self.get_cookie_name(app))
+        if cookie:
+            sid, _, signature = cookie.partition('.')
+            if signature and hmac.compare_digest(signature, self._sign(app, sid)):
+                data = self.store.get(sid)
+                if data is not None:
+                    return MemorySession(data, sid=sid)
+
+        return MemorySession(sid=uuid.uuid4().hex, new=True)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if not session:
+            if session.modified:
+                self.store.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        if session.modified or session.new:
+            self.store.set(session.sid, dict(session))
+
+        if not self.should_set_cookie(app, session) and not session.new:
+            return
+
+        response.set_cookie(
+            name,
+            f'{session.sid}.{self._sign(app, session.sid)}',
+            expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app),
+            domain=domain,
+            path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app)
+        )
+
+
+def init_session(app) -> Optional[MemorySessionStore]:
+    """
+    按 SESSION_BACKEND 配置 session
+
+    Args:
+        app: Flask 应用
+
+    Returns:
+        memory 后端的存储（用于启动定期清理），其他后端返回 None
+    """
+    backend = app.config['SESSION_BACKEND']
+
+    if backend == 'cookie':
+        # Flask 默认的签名 cookie
+        return None
+
+    if backend == 'memory':
+        store = MemorySessionStore(
+            ttl=app.permanent_session_lifetime.total_seconds(),
+            max_entries=app.config['SESSION_MEMORY_MAX_ENTRIES']
+        )
+        app.session_interface = MemorySessionInterface(store)
+        return store
+
+    if backend == 'redis':
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError('SESSION_BACKEND=redis 需要安装 redis 包（pip install redis）')
+        app.config['SESSION_REDIS'] = redis.Redis.from_url(app.config['REDIS_URL'])
+
+    if backend not in ('redis', 'filesystem'):
+        raise ValueError(f'未知的 session 后端: {backend}')
+
+    app.config['SESSION_TYPE'] = backend
+    Session(app)
+    return None
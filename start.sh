@@ -2,7 +2,7 @@
 # Render 启动脚本
 
 # 创建数据库表
-python -c "from app import app, db; app.app_context().push(); db.create_all(); print('Database initialized')"
+python -c "from app import app; from models import init_db; app.app_context().push(); init_db(); print('Database initialized')"
 
 # 启动应用
-gunicorn --worker-class eventlet -w 1 --bind 0.0.0.0:$PORT app:app
+gunicorn --worker-class eventlet -w ${WEB_CONCURRENCY:-1} --bind 0.0.0.0:$PORT app:app
@@ -0,0 +1,425 @@
+"""
+在线状态与匹配池的存储后端
+memory：保存在进程内存中（单进程部署，默认）
+redis：保存在 Redis 协议服务中，多个 worker / 节点共享在线用户和匹配池
+"""
+import heapq
+import json
+import threading
+import time
+import uuid
+from typing import List, Optional, Tuple
+
+
+class MemoryPresence:
+    """
+    进程内的在线用户表 {user_id: {'sid', 'room_id', 'format'}}
+
+    同时记录每个用户的最后活跃时间，并用最小堆按活跃时间排列用户（每个用户只有一项）：
+    touch 只更新时间戳，expire 从堆顶弹出，时间戳已更新的放回堆中，单次 O(log n)
+    """
+
+    def __init__(self):
+        self._users = {}
+        self._last_seen = {}  # {user_id: 最后活跃时间}
+        self._heap = []  # [(入堆时的活跃时间, user_id)]
+        self._scheduled = set()  # 在堆中有一项的用户
+        self._lock = threading.Lock()
+
+    def get(self, user_id: str) -> Optional[dict]:
+        """获取用户的 {'sid', 'room_id', 'format'}，不在线时返回 None（返回副本，修改请用 set_room）"""
+        info = self._users.get(user_id)
+        return dict(info) if info is not None else None
+
+    def set(self, user_id: str, sid: str, room_id: Optional[str] = None, wire_format: str = 'json'):
+        """记录用户的 SocketIO session ID、所在房间和连接使用的线上格式，并刷新活跃时间"""
+        now = time.monotonic()
+        with self._lock:
+            self._users[user_id] = {'sid': sid, 'room_id': room_id, 'format': wire_format}
+            self._last_seen[user_id] = now
+            if user_id not in self._scheduled:
+                self._scheduled.add(user_id)
+                heapq.heappush(self._heap, (now, user_id))
+
+    def touch(self, user_id: str):
+        """刷新在线用户的活跃时间（用户不在线时忽略）"""
+        if user_id in self._last_seen:
+            self._last_seen[user_id] = time.monotonic()
+
+    def expire(self, timeout: float) -> List[Tuple[str, dict]]:
+        """
+        移除超过 timeout 秒没有活跃的用户
+
+        Returns:
+            [(user_id, {'sid', 'room_id', 'format'})]
+        """
+        cutoff = time.monotonic() - timeout
+        expired = []
+        with self._lock:
+            heap = self._heap
+            while heap and heap[0][0] < cutoff:
+                _, user_id = heapq.heappop(heap)
+                last_seen = self._last_seen.get(user_id)
+                if last_seen is None:
+                    # 已正常断开
+                    self._scheduled.discard(user_id)
+                elif last_seen >= cutoff:
+                    heapq.heappush(heap, (last_seen, user_id))
+                else:
+                    self._scheduled.discard(user_id)
+                    del self._last_seen[user_id]
+                    expired.append((user_id, self._users.pop(user_id)))
+        return expired
+
+    def stale_users(self, timeout: float, limit: int = 1000) -> List[str]:
+        """
+        超过 timeout 秒没有活跃、尚未被 expire 移除的用户（只读）
+
+        只遍历堆中入堆时间早于截止时间的项：堆中的时间不晚于用户的实际活跃时间，
+        某一项不早于截止时间时，其子树都不需要再看
+        """
+        cutoff = time.monotonic() - timeout
+        stale = []
+        with self._lock:
+            heap = self._heap
+            pending = [0] if heap else []
+            while pending and len(stale) < limit:
+                i = pending.pop()
+                seen_at, user_id = heap[i]
+                if seen_at >= cutoff:
+                    continue
+                last_seen = self._last_seen.get(user_id)
+                if last_seen is not None and last_seen < cutoff:
+                    stale.append(user_id)
+                pending.extend(child for child in (2 * i + 1, 2 * i + 2) if child < len(heap))
+        return stale
+
+    def set_room(self, user_id: str, room_id: Optional[str]):
+        """更新在线用户所在房间（用户不在线时忽略）"""
+        info = self._users.get(user_id)
+        if info is not None:
+            info['room_id'] = room_id
+
+    def remove(self, user_id: str):
+        """移除在线用户（堆中的项在 expire 时丢弃）"""
+        with self._lock:
+            self._users.pop(user_id, None)
+            self._last_seen.pop(user_id, None)
+
+    def __contains__(self, user_id):
+        return user_id in self._users
+
+    def __len__(self):
+        return len(self._users)
+
+
+class RedisPresence:
+    """
+    Redis 中的在线用户表，每个用户一个 hash：{prefix}presence:{user_id} -> {sid, room_id, format}，
+    另用一个有序集合 {prefix}last_seen 记录在线用户的最后活跃时间（也用于统计人数）
+    """
+
+    def __init__(self, client, prefix: str = 'chat:'):
+        """
+        Args:
+            client: redis.Redis 客户端
+            prefix: 键前缀，多个应用共用一个 Redis 时用于隔离
+        """
+        self.client = client
+        self.prefix = prefix + 'presence:'
+        self.last_seen_key = prefix + 'last_seen'
+
+    @staticmethod
+    def _decode(info: dict) -> Optional[dict]:
+        if not info:
+            return None
+        return {
+            'sid': info[b'sid'].decode(),
+            'room_id': info[b'room_id'].decode() or None,
+            'format': info.get(b'format', b'json').decode()
+        }
+
+    def get(self, user_id: str) -> Optional[dict]:
+        return self._decode(self.client.hgetall(self.prefix + user_id))
+
+    def set(self, user_id: str, sid: str, room_id: Optional[str] = None, wire_format: str = 'json'):
+        pipe = self.client.pipeline()
+        pipe.hset(self.prefix + user_id, mapping={'sid': sid, 'room_id': room_id or '', 'format': wire_format})
+        pipe.zadd(self.last_seen_key, {user_id: time.time()})
+        pipe.execute()
+
+    def touch(self, user_id: str):
+        # XX：只更新已在线的用户
+        self.client.zadd(self.last_seen_key, {user_id: time.time()}, xx=True)
+
+    def expire(self, timeout: float, limit: int = 1000) -> List[Tuple[str, dict]]:
+        """移除超过 timeout 秒没有活跃的用户，多个 worker 同时清理时以 ZREM 成功的一方为准"""
+        user_ids = [
+            uid.decode() for uid in
+            self.client.zrangebyscore(self.last_seen_key, '-inf', f'({time.time() - timeout}', start=0, num=limit)
+        ]
+        if not user_ids:
+            return []
+
+        pipe = self.client.pipeline()
+        for user_id in user_ids:
+            pipe.zrem(self.last_seen_key, user_id)
+        claimed = [uid for uid, removed in zip(user_ids, pipe.execute()) if removed]
+
+        pipe = self.client.pipeline()
+        for user_id in claimed:
+            pipe.hgetall(self.prefix + user_id)
+            pipe.delete(self.prefix + user_id)
+        results = pipe.execute()
+
+        return [
+            (user_id, self._decode(info) or {'sid': None, 'room_id': None, 'format': 'json'})
+            for user_id, info in zip(claimed, results[::2])
+        ]
+
+    def stale_users(self, timeout: float, limit: int = 1000) -> List[str]:
+        """超过 timeout 秒没有活跃、尚未被 expire 移除的用户（只读）"""
+        return [
+            uid.decode() for uid in
+            self.client.zrangebyscore(self.last_seen_key, '-inf', f'({time.time() - timeout}', start=0, num=limit)
+        ]
+
+    def set_room(self, user_id: str, room_id: Optional[str]):
+        # 只在用户仍在线时更新房间，避免断开后又被写回
+        def update(pipe):
+            if pipe.exists(key):
+                pipe.multi()
+                pipe.hset(key, 'room_id', room_id or '')
+
+        key = self.prefix + user_id
+        self.client.transaction(update, key)
+
+    def remove(self, user_id: str):
+        pipe = self.client.pipeline()
+        pipe.delete(self.prefix + user_id)
+        pipe.zrem(self.last_seen_key, user_id)
+        pipe.execute()
+
+    def __contains__(self, user_id):
+        return bool(self.client.exists(self.prefix + user_id))
+
+    def __len__(self):
+        return self.client.zcard(self.last_seen_key)
+
+
+class SharedMatchingQueue:
+    """
+    多进程共享的匹配池
+
+    等待中的用户保存在 Redis hash 中，每次增删在同一个事务中追加到命令列表。持有调度锁的
+    worker（leader）把命令应用到本地 MatchingQueue，由本地索引完成配对；其他 worker
+    只负责写入。leader 失效后，下一个拿到锁的 worker 从 hash 重建本地索引。
+    配对只在后台调度器中进行，因此不提供 try_match / try_keyword_match。
+
+    配对结果用 WATCH 命令列表的事务确认：规划期间又有命令（离开、重新加入、更新资料）的用户，
+    其 hash 中的记录已不是规划时的那一份，所在的配对作废，不会误删重新加入的记录。
+    """
+
+    def __init__(self, client, local_queue, prefix: str = 'chat:', lock_ttl_ms: int = 2000):
+        """
+        Args:
+            client: redis.Redis 客户端
+            local_queue: 本进程的 MatchingQueue（成为 leader 时用于配对）
+            prefix: 键前缀
+            lock_ttl_ms: 调度锁过期时间（毫秒），应明显大于调度间隔
+        """
+        self.client = client
+        self.local = local_queue
+        self.lock_ttl_ms = lock_ttl_ms
+        self.random_key = prefix + 'waiting:random'
+        self.profile_key = prefix + 'waiting:profile'
+        self.commands_key = prefix + 'waiting:commands'
+        self.lock_key = prefix + 'match:leader'
+        self.token = uuid.uuid4().hex
+        self.is_leader = False
+
+    def add(self, user_id: str):
+        """添加用户到随机匹配池"""
+        entry = json.dumps({'enqueued_at': time.time()})
+        pipe = self.client.pipeline()
+        pipe.hdel(self.profile_key, user_id)
+        pipe.hsetnx(self.random_key, user_id, entry)
+        pipe.rpush(self.commands_key, json.dumps(['add', user_id]))
+        pipe.execute()
+
+    def add_with_profile(self, user_id: str, profile: dict):
+        """添加用户到关键词匹配池"""
+        entry = json.dumps({'enqueued_at': time.time(), 'profile': profile}, ensure_ascii=False)
+        pipe = self.client.pipeline()
+        pipe.hdel(self.random_key, user_id)
+        pipe.hset(self.profile_key, user_id, entry)
+        pipe.rpush(self.commands_key, json.dumps(['add_with_profile', user_id, profile], ensure_ascii=False))
+        pipe.execute()
+
+    def remove(self, user_id: str):
+        """从匹配池移除用户"""
+        pipe = self.client.pipeline()
+        pipe.hdel(self.random_key, user_id)
+        pipe.hdel(self.profile_key, user_id)
+        pipe.rpush(self.commands_key, json.dumps(['remove', user_id]))
+        pipe.execute()
+
+    def get_waiting_count(self) -> int:
+        """获取随机匹配池中的等待人数（所有 worker 合计）"""
+        return self.client.hlen(self.random_key)
+
+    def count_waiting(self, user_ids) -> int:
+        """给定用户中有多少人在随机匹配池中"""
+        if not user_ids:
+            return 0
+        pipe = self.client.pipeline()
+        for user_id in user_ids:
+            pipe.hexists(self.random_key, user_id)
+        return sum(pipe.execute())
+
+    def waiting_counts(self) -> dict:
+        """获取随机匹配池和关键词匹配池的等待人数（所有 worker 合计）"""
+        pipe = self.client.pipeline()
+        pipe.hlen(self.random_key)
+        pipe.hlen(self.profile_key)
+        random_count, keyword_count = pipe.execute()
+        return {'random': random_count, 'keyword': keyword_count}
+
+    def plan_matches(self, **kwargs) -> list:
+        """
+        leader 应用待处理命令后调用本地 MatchingQueue.plan_matches，非 leader 返回空列表
+
+        Args:
+            **kwargs: 透传给 MatchingQueue.plan_matches
+
+        Returns:
+            配对结果列表，格式同 MatchingQueue.plan_matches
+        """
+        if not self._acquire_leadership():
+            return []
+
+        self._apply_commands()
+        matches = self.local.plan_matches(**kwargs)
+        if not matches:
+            return matches
+
+        confirmed, touched = self.client.transaction(
+            lambda pipe: self._claim(pipe, matches), self.commands_key, value_from_callable=True
+        )
+
+        # 作废的配对中记录未变的用户放回本地索引（记录已变的用户由待处理的命令更新）
+        now = time.monotonic()
+        confirmed_ids = {id(match) for match in confirmed}
+        for match in matches:
+            if id(match) in confirmed_ids:
+                continue
+            for user_id, profile, wait in zip(match['users'], match['profiles'], match['wait_seconds']):
+                if user_id in touched:
+                    continue
+                if profile.get('keywords'):
+                    self.local.add_with_profile(user_id, profile)
+                else:
+                    self.local.add(user_id)
+                self.local.enqueued_at[user_id] = now - wait
+        return confirmed
+
+    def _claim(self, pipe, matches: list) -> Tuple[list, set]:
+        """
+        在 WATCH 命令列表的事务中确认配对并从共享池删除
+
+        Returns:
+            (确认的配对, 规划之后又有命令的用户)
+        """
+        touched = {json.loads(command)[1] for command in pipe.lrange(self.commands_key, 0, -1)}
+        confirmed = [match for match in matches if not touched.intersection(match['users'])]
+        pipe.multi()
+        if confirmed:
+            matched = [uid for match in confirmed for uid in match['users']]
+            pipe.hdel(self.random_key, *matched)
+            pipe.hdel(self.profile_key, *matched)
+        return confirmed, touched
+
+    def _acquire_leadership(self) -> bool:
+        if self.is_leader and self._renew():
+            return True
+
+        if self.client.set(self.lock_key, self.token, nx=True, px=self.lock_ttl_ms):
+            # 新成为 leader：本地索引可能已过期，从共享存储重建
+            self.is_leader = True
+            self._rebuild()
+            return True
+
+        self.is_leader = False
+        return False
+
+    def _renew(self) -> bool:
+        # 只续期自己持有的锁（WATCH 保证读取和续期之间锁没有易主）
+        def renew(pipe):
+            if pipe.get(self.lock_key) != self.token.encode():
+                return False
+            pipe.multi()
+            pipe.pexpire(self.lock_key, self.lock_ttl_ms)
+            return True
+
+        return self.client.transaction(renew, self.lock_key, value_from_callable=True)
+
+    def _rebuild(self):
+        for user_id in list(self.local.enqueued_at):
+            self.local.remove(user_id)
+
+        now_wall, now_monotonic = time.time(), time.monotonic()
+        for key, with_profile in ((self.random_key, False), (self.profile_key, True)):
+            for user_id, entry in self.client.hgetall(key).items():
+                user_id = user_id.decode()
+                entry = json.loads(entry)
+                if with_profile:
+                    self.local.add_with_profile(user_id, entry['profile'])
+                else:
+                    self.local.add(user_id)
+                # 保留原始入队时间，等待时长决定阈值衰减和随机回退
+                self.local.enqueued_at[user_id] = now_monotonic - (now_wall - entry['enqueued_at'])
+
+        # 重建前已写入 hash 的命令会再应用一次，增删都是幂等的
+        self._apply_commands()
+
+    def _apply_commands(self, batch_size: int = 1000):
+        while True:
+            commands = self.client.lpop(self.commands_key, batch_size)
+            if not commands:
+                return
+            for command in commands:
+                op, user_id, *args = json.loads(command)
+                getattr(self.local, op)(user_id, *args)
+
+
+def create_state_backend(backend: str, redis_url: str, local_queue, prefix: str = 'chat:',
+                         lock_ttl_ms: int = 2000):
+    """
+    创建在线用户表和匹配池
+
+    Args:
+        backend: 'memory' 或 'redis'
+        redis_url: Redis 协议服务地址（backend 为 redis 时使用）
+        local_queue: 本进程的 MatchingQueue
+        prefix: Redis 键前缀
+        lock_ttl_ms: 匹配调度锁过期时间（毫秒）
+
+    Returns:
+        (在线用户表, 匹配池)
+    """
+    if backend == 'memory':
+        return MemoryPresence(), local_queue
+
+    if backend == 'redis':
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError('STATE_BACKEND=redis 需要安装 redis 包（pip install redis）')
+
+        client = redis.Redis.from_url(redis_url)
+        return (
+            RedisPresence(client, prefix=prefix),
+            SharedMatchingQueue(client, local_queue, prefix=prefix, lock_ttl_ms=lock_ttl_ms)
+        )
+
+    raise ValueError(f'未知的状态后端: {backend}')
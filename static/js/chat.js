@@ -1,5 +1,9 @@
 // 初始化Socket.IO连接
-const socket = io();
+// 支持 MessagePack 时优先使用二进制格式，服务端在连接时选定
+const socket = io({
+    transports: window.socketTransports,
+    auth: { formats: typeof MessagePackDecoder !== 'undefined' ? ['msgpack', 'json'] : ['json'] }
+});
 
 // 应用状态
 const AppState = {
@@ -13,6 +17,11 @@ let currentRoomId = null;
 let currentRoomKey = null;
 let currentMatchType = 'random';  // 'random', 'keyword', 'private'
 
+// 历史消息分页状态（向上滚动时按游标加载更早的消息）
+let historyCursor = null;
+let historyHasMore = false;
+let historyLoading = false;
+
 // 获取DOM元素
 const startScreen = document.getElementById('start-screen');
 const waitingScreen = document.getElementById('waiting-screen');
@@ -29,6 +38,32 @@ const messageInput = document.getElementById('message-input');
 const messagesContainer = document.getElementById('messages');
 const waitingCount = document.getElementById('waiting-count');
 
+// 解码 msgpack 格式的事件数据（二进制附件），json 格式原样返回
+function decodePayload(data) {
+    if (data instanceof ArrayBuffer || ArrayBuffer.isView(data)) {
+        return MessagePackDecoder.decode(data);
+    }
+    return data;
+}
+
+// 注册可能以 msgpack 格式发送的事件
+function onDecoded(event, handler) {
+    socket.on(event, (data) => handler(decodePayload(data)));
+}
+
+// 把按列存放的 {字段: [值, ...]} 还原为行列表
+function columnsToRows(columns) {
+    const fields = Object.keys(columns);
+    const count = fields.length ? columns[fields[0]].length : 0;
+    const rows = new Array(count);
+    for (let i = 0; i < count; i++) {
+        const row = {};
+        fields.forEach(field => { row[field] = columns[field][i]; });
+        rows[i] = row;
+    }
+    return rows;
+}
+
 // 切换界面状态
 function switchScreen(state) {
     startScreen.classList.remove('active');
@@ -90,8 +125,8 @@ function escapeHtml(text) {
     return div.innerHTML;
 }
 
-// 添加消息到聊天界面
-function addMessage(content, timestamp, isOwn, isSystem = false) {
+// 创建消息元素
+function createMessageElement(content, timestamp, isOwn, isSystem = false) {
     const messageEl = document.createElement('div');
 
     if (isSystem) {
@@ -111,10 +146,37 @@ function addMessage(content, timestamp, isOwn, isSystem = false) {
         `;
     }
 
-    messagesContainer.appendChild(messageEl);
+    return messageEl;
+}
+
+// 添加消息到聊天界面
+function addMessage(content, timestamp, isOwn, isSystem = false) {
+    messagesContainer.appendChild(createMessageElement(content, timestamp, isOwn, isSystem));
     messagesContainer.scrollTop = messagesContainer.scrollHeight;
 }
 
+// 在顶部插入更早的历史消息，并保持当前可见位置不跳动
+function prependMessages(messages) {
+    const previousHeight = messagesContainer.scrollHeight;
+    const fragment = document.createDocumentFragment();
+
+    messages.forEach(msg => {
+        const isOwn = msg.sender_id === window.currentUserId;
+        fragment.appendChild(createMessageElement(msg.content, msg.timestamp, isOwn));
+    });
+
+    messagesContainer.insertBefore(fragment, messagesContainer.firstChild);
+    messagesContainer.scrollTop += messagesContainer.scrollHeight - previousHeight;
+}
+
+// 请求更早的一页历史消息
+function loadOlderHistory() {
+    if (!historyHasMore || historyLoading || !currentRoomKey) return;
+
+    historyLoading = true;
+    socket.emit('get_room_history', { room_key: currentRoomKey, before: historyCursor });
+}
+
 // 添加系统消息
 function addSystemMessage(content) {
     addMessage(content, null, false, true);
@@ -123,6 +185,9 @@ function addSystemMessage(content) {
 // 清空消息列表
 function clearMessages() {
     messagesContainer.innerHTML = '';
+    historyCursor = null;
+    historyHasMore = false;
+    historyLoading = false;
 }
 
 // 禁用聊天输入
@@ -264,6 +329,13 @@ messageInput.addEventListener('keypress', (e) => {
     }
 });
 
+// 滚动到顶部时加载更早的历史消息
+messagesContainer.addEventListener('scroll', () => {
+    if (messagesContainer.scrollTop < 50) {
+        loadOlderHistory();
+    }
+});
+
 // ========== Socket.IO 事件监听 ==========
 
 // 连接成功
@@ -271,6 +343,13 @@ socket.on('connect', () => {
     console.log('已连接到服务器');
 });
 
+// 定期发送心跳，服务端据此清理异常断开后残留的在线记录
+setInterval(() => {
+    if (socket.connected) {
+        socket.emit('heartbeat');
+    }
+}, window.heartbeatInterval * 1000);
+
 // 等待匹配
 socket.on('waiting', (data) => {
     console.log('等待匹配中...', data);
@@ -282,7 +361,7 @@ socket.on('waiting', (data) => {
 });
 
 // 匹配成功
-socket.on('matched', (data) => {
+onDecoded('matched', (data) => {
     console.log('匹配成功!', data);
     currentRoomId = data.room_id;
     currentMatchType = 'random';
@@ -294,7 +373,7 @@ socket.on('matched', (data) => {
 });
 
 // 关键词匹配成功
-socket.on('matched_with_score', (data) => {
+onDecoded('matched_with_score', (data) => {
     console.log('关键词匹配成功!', data);
     currentRoomId = data.room_id;
     currentMatchType = 'keyword';
@@ -325,7 +404,7 @@ socket.on('private_room_created', (data) => {
 });
 
 // 加入私密房间成功
-socket.on('joined_private_room', (data) => {
+onDecoded('joined_private_room', (data) => {
     console.log('已加入私密房间:', data);
     currentRoomId = data.room_id;
     currentRoomKey = data.room_key;
@@ -346,20 +425,35 @@ socket.on('joined_private_room', (data) => {
     enableChatInput();
 });
 
-// 接收历史消息
-socket.on('room_history', (data) => {
+// 接收历史消息（分页）
+onDecoded('room_history', (data) => {
     console.log('收到历史消息:', data.message_count);
 
-    if (data.messages && data.messages.length > 0) {
-        addSystemMessage(`📜 已加载 ${data.messages.length} 条历史消息\n---`);
+    // msgpack 格式的历史消息按列存放
+    if (data.messages && !Array.isArray(data.messages)) {
+        data.messages = columnsToRows(data.messages);
+    }
 
-        data.messages.forEach(msg => {
-            const isOwn = msg.sender_id === window.currentUserId;
-            addMessage(msg.content, msg.timestamp, isOwn);
-        });
+    historyCursor = data.cursor;
+    historyHasMore = data.has_more;
+    historyLoading = false;
 
-        addSystemMessage('--- 历史消息加载完毕');
+    if (!data.messages || data.messages.length === 0) return;
+
+    // 向上滚动加载的更早消息插入到顶部
+    if (data.older) {
+        prependMessages(data.messages);
+        return;
     }
+
+    addSystemMessage(`📜 已加载最近 ${data.messages.length} 条历史消息${data.has_more ? '，向上滚动查看更早的消息' : ''}\n---`);
+
+    data.messages.forEach(msg => {
+        const isOwn = msg.sender_id === window.currentUserId;
+        addMessage(msg.content, msg.timestamp, isOwn);
+    });
+
+    addSystemMessage('--- 历史消息加载完毕');
 });
 
 // 复制秘钥
@@ -379,6 +473,14 @@ socket.on('new_message', (data) => {
     addMessage(data.content, data.timestamp, isOwn);
 });
 
+// 接收合并发送的新消息（msgpack 格式）
+onDecoded('message_batch', (data) => {
+    columnsToRows(data.messages).forEach(msg => {
+        const isOwn = msg.sender_id === window.currentUserId;
+        addMessage(msg.content, msg.timestamp, isOwn);
+    });
+});
+
 // 对方离开
 socket.on('partner_left', (data) => {
     addSystemMessage('❌ ' + data.message);
@@ -400,9 +502,23 @@ socket.on('left_room', (data) => {
 
 // 错误提示
 socket.on('error', (data) => {
+    // 加载历史失败（如游标无效、房间已不存在）时允许再次加载
+    historyLoading = false;
     alert('错误: ' + data.message);
 });
 
+// 操作过于频繁被限流
+socket.on('slow_down', (data) => {
+    if (data.event === 'get_room_history') {
+        historyLoading = false;
+    }
+    if (currentState === AppState.CHATTING) {
+        addSystemMessage('⏳ ' + data.message);
+    } else {
+        alert(data.message);
+    }
+});
+
 // 连接断开
 socket.on('disconnect', () => {
     console.log('与服务器断开连接');
@@ -0,0 +1,192 @@
+"""
+结构化日志
+事件处理函数只把日志记录放进有界队列，由独立的写入线程格式化为 JSON 行并写到 stdout，
+不在热路径上做任何 I/O；高频事件可以按 LOG_SAMPLE_RATES 采样或关闭
+
+    log_event('send_message', '用户发送消息', user_id=user_id, room_id=room_id)
+    -> {"ts": "...", "level": "INFO", "event": "send_message", "msg": "用户发送消息", "user_id": "...", ...}
+"""
+import atexit
+import json
+import logging
+import random
+import sys
+import time
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler
+from typing import Dict
+
+try:
+    # eventlet 给 threading / queue 打了补丁时，写入线程仍要用真正的系统线程，
+    # 这样阻塞的 stdout 写入不会卡住 eventlet 的 hub
+    from eventlet.patcher import original
+    threading = original('threading')
+    queue = original('queue')
+except ImportError:
+    import threading
+    import queue
+
+import metrics
+
+logger = logging.getLogger('chat')
+logger.propagate = False
+
+# {事件名: 采样率}，未配置的事件全部记录
+_sample_rates: Dict[str, float] = {}
+_writer = None
+
+
+def parse_sample_rates(spec: str) -> Dict[str, float]:
+    """
+    解析采样率配置
+
+    Args:
+        spec: 形如 "send_message=0.01,join_queue=1" 的字符串，采样率为 0 表示不记录该事件
+
+    Returns:
+        {事件名: 采样率}
+    """
+    rates = {}
+    for item in spec.split(','):
+        if not item.strip():
+            continue
+        event, _, rate = item.partition('=')
+        rates[event.strip()] = float(rate)
+    return rates
+
+
+def log_event(event: str, message: str, level: int = logging.INFO, **fields):
+    """
+    记录一条结构化日志（只入队，不做 I/O）
+
+    Args:
+        event: 事件名，用于采样和检索
+        message: 可读的说明
+        level: 日志级别
+        **fields: 附加字段（需可 JSON 序列化）
+    """
+    rate = _sample_rates.get(event, 1.0)
+    if rate < 1.0 and (rate <= 0.0 or random.random() >= rate):
+        return
+    if logger.isEnabledFor(level):
+        logger.log(level, message, extra={'event': event, 'fields': fields})
+
+
+class JsonFormatter(logging.Formatter):
+    """把日志记录格式化为一行 JSON"""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'event': getattr(record, 'event', record.name),
+            'msg': record.getMessage()
+        }
+        entry.update(getattr(record, 'fields', {}))
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class DroppingQueueHandler(QueueHandler):
+    """队列写满时丢弃日志并计数，而不是阻塞或抛错"""
+
+    def prepare(self, record):
+        # 格式化留给写入线程
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            metrics.LOG_DROPPED.inc()
+
+
+class LogWriter:
+    """后台写入线程：从队列取出日志记录，格式化后写入 stream"""
+
+    _STOP = object()
+
+    def __init__(self, log_queue, stream=None):
+        self.queue = log_queue
+        self.stream = stream or sys.stdout
+        self.formatter = JsonFormatter()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='log-writer', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 2.0) -> bool:
+        """
+        通知写入线程写完队列中的日志后退出，最多等待 timeout 秒
+
+        Returns:
+            是否在期限内写完
+        """
+        if self._thread is None:
+            return True
+        deadline = time.monotonic() + timeout
+        try:
+            self.queue.put(self._STOP, timeout=timeout)
+        except queue.Full:
+            return False
+        self._thread.join(max(0.0, deadline - time.monotonic()))
+        finished = not self._thread.is_alive()
+        if finished:
+            self._thread = None
+        return finished
+
+    def _run(self):
+        while True:
+            record = self.queue.get()
+            if record is self._STOP:
+                break
+            lines = [record]
+            # 一次取走已积压的记录，合并成一次写入
+            while len(lines) < 512:
+                try:
+                    record = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if record is self._STOP:
+                    self._write(lines)
+                    return
+                lines.append(record)
+            self._write(lines)
+
+    def _write(self, records):
+        try:
+            self.stream.write(''.join(self.formatter.format(record) + '\n' for record in records))
+            self.stream.flush()
+        except Exception:
+            # 日志写入失败不能影响应用
+            pass
+
+
+def setup(level: str = 'INFO', sample_rates: Dict[str, float] = None, queue_size: int = 10000,
+          shutdown_timeout: float = 2.0, stream=None):
+    """
+    配置 chat 日志：有界队列 + 后台写入线程，退出时最多等待 shutdown_timeout 秒写完日志
+
+    Args:
+        level: 日志级别
+        sample_rates: {事件名: 采样率}
+        queue_size: 队列容量，写满后新日志被丢弃（计入 chat_log_dropped_total）
+        shutdown_timeout: 退出时等待写入的最长时间（秒）
+        stream: 输出流，默认 stdout
+    """
+    global _writer
+    if _writer is not None:
+        _writer.stop(shutdown_timeout)
+
+    _sample_rates.clear()
+    _sample_rates.update(sample_rates or {})
+
+    log_queue = queue.Queue(maxsize=queue_size)
+    logger.handlers = [DroppingQueueHandler(log_queue)]
+    logger.setLevel(level)
+
+    _writer = LogWriter(log_queue, stream)
+    _writer.start()
+    atexit.register(_writer.stop, shutdown_timeout)
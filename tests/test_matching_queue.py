@@ -0,0 +1,97 @@
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from keyword_matcher import KeywordMatcher
+from matching_queue import MatchingQueue
+
+TOPICS = [f'话题{i}' for i in range(120)]
+
+
+def profile(*keywords):
+    return {'keywords': list(keywords), 'bio': '', 'purpose': ''}
+
+
+def test_add_and_add_with_profile_are_mutually_exclusive():
+    queue = MatchingQueue()
+    queue.add('u1')
+    queue.add_with_profile('u1', profile('电影'))
+    assert 'u1' not in queue.queue
+    assert 'u1' in queue.user_keywords
+
+    queue.add('u1')
+    assert 'u1' in queue.queue
+    assert 'u1' not in queue.user_keywords
+    assert '电影' not in queue.keyword_queue
+
+
+def test_plan_matches_never_pairs_a_user_twice_or_with_themselves():
+    queue = MatchingQueue()
+    queue.add_with_profile('u1', profile('电影', '音乐'))
+    queue.add_with_profile('u2', profile('电影', '音乐'))
+    queue.add('u3')
+    # 绕过 add / add_with_profile，模拟同一用户同时出现在两个队列中
+    queue.queue['u1'] = None
+    queue.queue['u2'] = None
+
+    matches = queue.plan_matches(fallback_after=0.0)
+
+    users = [user for match in matches for user in match['users']]
+    assert len(users) == len(set(users))
+    assert all(user1 != user2 for user1, user2 in (match['users'] for match in matches))
+    assert [match['users'] for match in matches] == [('u1', 'u2')]
+    assert list(queue.queue) == ['u3']
+
+
+def test_plan_matches_random_fallback_deduplicates_pool():
+    queue = MatchingQueue(min_similarity=1.1)  # 关键词配对全部不达标，只走随机回退
+    queue.add_with_profile('u1', profile('电影'))
+    queue.queue['u1'] = None
+    queue.add('u2')
+
+    matches = queue.plan_matches(fallback_after=0.0)
+
+    assert [sorted(match['users']) for match in matches] == [['u1', 'u2']]
+    assert matches[0]['match_type'] == 'random'
+
+
+def build_keyword_queue(prune_threshold, seed=3, users=500):
+    rng = random.Random(seed)
+    queue = MatchingQueue(min_similarity=0.05)
+    queue.PRUNE_THRESHOLD = prune_threshold
+    for i in range(users):
+        # 前20个话题占大多数，倒排列表足够长才会触发剪枝
+        queue.add_with_profile(f'u{i}', profile(*rng.sample(TOPICS[:20], 2), *rng.sample(TOPICS, 2)))
+    return queue
+
+
+def test_upper_bounds_never_undershoot_exact_scores():
+    queue = build_keyword_queue(MatchingQueue.PRUNE_THRESHOLD)
+    total = len(queue.user_keywords)
+    weights = {keyword: queue._keyword_weight(keyword) for keyword in queue.keyword_queue}
+    min_weight = KeywordMatcher.idf(min(queue.max_document_frequency, total), total)
+
+    query = ['话题1', '话题7', '话题50']
+    query_bits = queue.vocabulary.encode(query)
+    query_bit_weights = {queue.vocabulary.ids[keyword]: weights[keyword] for keyword in query}
+    candidates = list(queue.user_keywords)
+    bounds = KeywordMatcher.weighted_similarity_upper_bounds(
+        query_bits, [queue.user_bits[user_id] for user_id in candidates], query_bit_weights, min_weight
+    )
+
+    for user_id, bound in zip(candidates, bounds):
+        exact = KeywordMatcher.calculate_weighted_similarity(query, list(queue.user_keywords[user_id]), weights)
+        assert bound >= exact - 1e-12
+
+
+def test_top_k_candidates_pruning_does_not_change_results():
+    unpruned = build_keyword_queue(10 ** 9)
+    pruned = build_keyword_queue(1)
+    rng = random.Random(4)
+
+    for _ in range(100):
+        query = rng.sample(TOPICS[:20], 2) + rng.sample(TOPICS, 1)
+        for k in (1, 5):
+            assert pruned.top_k_candidates('me', query, k) == unpruned.top_k_candidates('me', query, k)
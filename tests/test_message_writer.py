@@ -0,0 +1,70 @@
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'test.db'))
+os.environ.setdefault('LOG_LEVEL', 'ERROR')
+
+import pytest  # noqa: E402
+from sqlalchemy import select  # noqa: E402
+from sqlalchemy.exc import OperationalError  # noqa: E402
+
+import message_search  # noqa: E402
+from app import app, socketio  # noqa: E402
+from message_writer import MessageWriter  # noqa: E402
+from models import db, init_db, ChatRoom, Message  # noqa: E402
+
+
+@pytest.fixture
+def room_id():
+    with app.app_context():
+        init_db()
+        room = ChatRoom(user1_id='a', user2_id='b')
+        db.session.add(room)
+        db.session.commit()
+        return room.id
+
+
+def fail_once(monkeypatch):
+    """让下一次写入抛出一次暂时性错误"""
+    original = message_search.insert_messages
+    calls = []
+
+    def insert_messages(session, rows):
+        calls.append(len(rows))
+        if len(calls) == 1:
+            raise OperationalError('INSERT', {}, Exception('database is locked'))
+        return original(session, rows)
+
+    monkeypatch.setattr(message_search, 'insert_messages', insert_messages)
+
+
+def stored_contents(room_id):
+    with app.app_context():
+        return db.session.scalars(select(Message.content).where(Message.room_id == room_id).order_by(Message.id)).all()
+
+
+def test_sync_mode_raises_instead_of_buffering(room_id, monkeypatch):
+    writer = MessageWriter(app, db, socketio, write_behind=False)
+    fail_once(monkeypatch)
+
+    with pytest.raises(OperationalError):
+        writer.submit(room_id, 'a', 'lost')
+    assert writer.pending_count() == 0
+
+    # 失败后没有退避：下一条消息立即写入
+    writer.submit(room_id, 'a', 'saved')
+    assert writer.pending_count() == 0
+    assert stored_contents(room_id) == ['saved']
+
+
+def test_write_behind_retries_after_transient_error(room_id, monkeypatch):
+    writer = MessageWriter(app, db, socketio, write_behind=True)
+    fail_once(monkeypatch)
+
+    writer.submit(room_id, 'a', 'retried')
+    assert writer.flush() == 0
+    assert writer.pending_count() == 1
+    assert writer.flush(force=True) == 1
+    assert stored_contents(room_id) == ['retried']
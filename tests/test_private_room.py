@@ -0,0 +1,57 @@
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'test.db'))
+os.environ.setdefault('LOG_LEVEL', 'ERROR')
+
+import pytest  # noqa: E402
+from sqlalchemy import func, select  # noqa: E402
+
+import room_stats  # noqa: E402
+from app import app, add_private_room, room_key_pool  # noqa: E402
+from models import db, init_db, ChatRoom  # noqa: E402
+
+
+@pytest.fixture
+def session():
+    with app.app_context():
+        init_db()
+        yield db.session
+        db.session.rollback()
+
+
+def snapshot(session):
+    return session.scalar(select(func.count(ChatRoom.id))), room_stats.get_stats(session)
+
+
+def test_rollback_discards_room_and_counters(session):
+    before = snapshot(session)
+    add_private_room('u1')
+    session.rollback()
+    assert snapshot(session) == before
+
+
+def test_rollback_after_key_conflict_discards_room_and_counters(session, monkeypatch):
+    taken = ChatRoom(user1_id='u0', room_key='TAKEN1', match_type='private', is_private=True)
+    session.add(taken)
+    session.commit()
+    keys = iter(['TAKEN1', 'FRESH1'])
+    monkeypatch.setattr(room_key_pool, 'take', lambda: next(keys))
+
+    before = snapshot(session)
+    room = add_private_room('u1')
+    assert room.room_key == 'FRESH1'
+    session.rollback()
+    assert snapshot(session) == before
+
+
+def test_commit_keeps_room_and_counters(session):
+    rooms, stats = snapshot(session)
+    add_private_room('u1')
+    session.commit()
+    after_rooms, after_stats = snapshot(session)
+    assert after_rooms == rooms + 1
+    assert after_stats['total_rooms'] == stats['total_rooms'] + 1
+    assert after_stats['active_rooms'] == stats['active_rooms'] + 1
@@ -0,0 +1,121 @@
+"""
+Socket.IO 事件的线上格式
+json：默认，事件数据为普通 JSON 对象（兼容旧客户端）
+msgpack：客户端连接时通过 auth={'formats': ['msgpack', 'json']} 声明支持，服务端选定后
+事件数据编码为 MessagePack 二进制附件；历史消息按列存放，同一房间短时间内的多条新消息
+合并为一个 message_batch 帧
+
+每个连接除了加入房间 room_id，还加入按格式区分的 room_id:json / room_id:msgpack，
+房间内的广播分别发给两组连接，因此多 worker 通过消息队列转发时同样适用
+"""
+import threading
+from typing import Dict, Iterable, List
+
+from flask_socketio import emit
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# 新消息批量帧中的列
+MESSAGE_FIELDS = ('sender_id', 'content', 'timestamp')
+
+
+def negotiate(auth, allowed: Iterable[str]) -> str:
+    """
+    按客户端声明的顺序选择第一个服务端允许且可用的格式
+
+    Args:
+        auth: 客户端连接时的 auth 数据
+        allowed: 服务端允许的格式
+
+    Returns:
+        'msgpack' 或 'json'
+    """
+    offered = auth.get('formats') if isinstance(auth, dict) else None
+    for wire_format in offered or ():
+        if wire_format == 'json':
+            return 'json'
+        if wire_format == 'msgpack' and wire_format in allowed and msgpack is not None:
+            return 'msgpack'
+    return 'json'
+
+
+def format_room(room_id: str, wire_format: str) -> str:
+    """房间内使用某种格式的连接所在的子房间"""
+    return f'{room_id}:{wire_format}'
+
+
+def encode(payload, wire_format: str):
+    """按格式编码事件数据，json 格式原样返回"""
+    if wire_format == 'msgpack':
+        return msgpack.packb(payload, use_bin_type=True)
+    return payload
+
+
+def to_columns(rows: List[dict], fields: Iterable[str]) -> Dict[str, list]:
+    """把行列表转换为按列存放的 {字段: [值, ...]}"""
+    return {field: [row[field] for row in rows] for field in fields}
+
+
+class RoomEmitter:
+    """按连接的格式发送事件，并把 msgpack 连接的新消息按房间合并发送"""
+
+    def __init__(self, socketio, batch_window_ms: int = 20, msgpack_enabled: bool = True):
+        """
+        Args:
+            socketio: SocketIO 实例
+            batch_window_ms: 新消息合并窗口（毫秒），0 表示每条消息单独发送
+            msgpack_enabled: 是否有可能存在 msgpack 连接（关闭时只向 json 子房间广播）
+        """
+        self.socketio = socketio
+        self.window = batch_window_ms / 1000.0
+        self.msgpack_enabled = msgpack_enabled and msgpack is not None
+        self._pending = {}  # {room_id: [消息]}
+        self._lock = threading.Lock()
+
+    def emit_room(self, event: str, payload: dict, room_id: str):
+        """向房间内所有连接广播"""
+        self.socketio.emit(event, payload, room=format_room(room_id, 'json'))
+        if self.msgpack_enabled:
+            self.socketio.emit(event, encode(payload, 'msgpack'), room=format_room(room_id, 'msgpack'))
+
+    def send(self, event: str, payload: dict, wire_format: str):
+        """在事件处理函数中按当前连接的格式回复"""
+        emit(event, encode(payload, wire_format))
+
+    def new_message(self, room_id: str, message: dict):
+        """
+        广播一条新消息：json 连接立即收到 new_message，msgpack 连接在合并窗口结束时收到 message_batch
+
+        Args:
+            message: {'sender_id', 'content', 'timestamp'}
+        """
+        self.socketio.emit('new_message', message, room=format_room(room_id, 'json'))
+        if not self.msgpack_enabled:
+            return
+        if self.window <= 0:
+            self._emit_batch(room_id, [message])
+            return
+
+        with self._lock:
+            pending = self._pending.get(room_id)
+            if pending is not None:
+                pending.append(message)
+                return
+            self._pending[room_id] = [message]
+        self.socketio.start_background_task(self._flush_later, room_id)
+
+    def _flush_later(self, room_id: str):
+        self.socketio.sleep(self.window)
+        with self._lock:
+            messages = self._pending.pop(room_id, None)
+        if messages:
+            self._emit_batch(room_id, messages)
+
+    def _emit_batch(self, room_id: str, messages: List[dict]):
+        self.socketio.emit('message_batch', encode({
+            'room_id': room_id,
+            'messages': to_columns(messages, MESSAGE_FIELDS)
+        }, 'msgpack'), room=format_room(room_id, 'msgpack'))
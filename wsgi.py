@@ -1,5 +1,6 @@
 import os
-from app import app, socketio, db
+from app import app, socketio
+from models import init_db
 
 # 生产环境配置
 if __name__ != '__main__':
@@ -8,12 +9,12 @@ if __name__ != '__main__':
 
     # 创建数据库表
     with app.app_context():
-        db.create_all()
+        init_db()
 
 if __name__ == '__main__':
     # 开发环境
     with app.app_context():
-        db.create_all()
+        init_db()
 
     port = int(os.environ.get('PORT', 5000))
     socketio.run(app, host='0.0.0.0', port=port, debug=False)